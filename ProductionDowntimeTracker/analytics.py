@@ -1,77 +1,101 @@
+import numpy as np
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+from dimensions import REST_LABEL
+from instrumentation import span, traced
+from snapshot import as_snapshot
 
-def calculate_kpis(records):
-    if not records or len(records) == 0:
+TREND_GRANULARITIES = {
+    'day': {'label': 'Daily', 'frequency': 'D'},
+    'week': {'label': 'Weekly', 'frequency': 'W-MON'},
+    'month': {'label': 'Monthly', 'frequency': 'MS'},
+    # Shift starts are not evenly spaced, so missing shifts are not filled
+    'shift': {'label': 'Per-Shift', 'frequency': None},
+}
+
+TREND_MAX_POINTS = 2000
+TREND_MAX_SERIES = 10
+
+def _graph_objects():
+    # plotly is imported when the first chart is drawn rather than at startup
+    import plotly.graph_objects as go
+    return go
+
+@traced(category='analytics')
+def calculate_kpis(db, **filters):
+    """Calculate downtime KPIs from totals aggregated in the database.
+
+    db can also be a RecordSnapshot, which provides the same aggregates.
+    total_downtime sums the recorded durations; line_downtime counts
+    overlapping stops on the same line once.
+    """
+    total_downtime, avg_downtime, num_incidents = db.get_downtime_totals(**filters)
+
+    if not num_incidents:
         return {
             'total_downtime': 0,
+            'line_downtime': 0,
             'avg_downtime': 0,
             'num_incidents': 0
         }
 
-    # Create DataFrame with proper column names from database schema
-    columns = ['id', 'date', 'shift', 'line', 'start_time', 'end_time', 
-              'duration', 'equipment', 'issue_type', 'issue_description',
-              'action_taken', 'responsible_person', 'remarks', 'created_at']
-    df = pd.DataFrame(records, columns=columns)
-
-    total_downtime = df['duration'].sum()
-    avg_downtime = df['duration'].mean()
-    num_incidents = len(df)
-
     return {
         'total_downtime': total_downtime,
+        'line_downtime': db.get_line_downtime(**filters),
         'avg_downtime': round(avg_downtime, 2),
         'num_incidents': num_incidents
     }
 
+@traced(category='analytics')
 def create_pareto_chart(data, title="Pareto Analysis", x_title="Category"):
-    """Generic Pareto chart creation function"""
+    """Generic Pareto chart creation function; a REST_LABEL row stays the last bar"""
     if not data or len(data) == 0:
         return None
 
     df = pd.DataFrame(data, columns=['category', 'frequency', 'total_duration'])
-    df = df.sort_values('total_duration', ascending=False)
+    df['rest'] = df['category'] == REST_LABEL
+    df = df.sort_values(['rest', 'total_duration'], ascending=[True, False])
 
     # Calculate cumulative percentage
     df['cumulative_percentage'] = df['total_duration'].cumsum() / df['total_duration'].sum() * 100
 
-    fig = go.Figure()
+    with span('plotly.pareto_figure', 'plotly'):
+        go = _graph_objects()
+        fig = go.Figure()
 
-    # Bar chart for duration
-    fig.add_trace(go.Bar(
-        x=df['category'],
-        y=df['total_duration'],
-        name='Duration'
-    ))
+        # Bar chart for duration
+        fig.add_trace(go.Bar(
+            x=df['category'],
+            y=df['total_duration'],
+            name='Duration'
+        ))
 
-    # Line chart for cumulative percentage
-    fig.add_trace(go.Scatter(
-        x=df['category'],
-        y=df['cumulative_percentage'],
-        name='Cumulative %',
-        yaxis='y2',
-        line=dict(color='red', width=2)
-    ))
+        # Line chart for cumulative percentage
+        fig.add_trace(go.Scatter(
+            x=df['category'],
+            y=df['cumulative_percentage'],
+            name='Cumulative %',
+            yaxis='y2',
+            line=dict(color='red', width=2)
+        ))
 
-    fig.update_layout(
-        title=title,
-        yaxis=dict(title='Total Downtime (minutes)'),
-        yaxis2=dict(
-            title='Cumulative Percentage',
-            overlaying='y',
-            side='right',
-            range=[0, 100],
-            tickformat='.0f'
-        ),
-        showlegend=True,
-        height=500,
-        barmode='relative'
-    )
+        fig.update_layout(
+            title=title,
+            yaxis=dict(title='Total Downtime (minutes)'),
+            yaxis2=dict(
+                title='Cumulative Percentage',
+                overlaying='y',
+                side='right',
+                range=[0, 100],
+                tickformat='.0f'
+            ),
+            showlegend=True,
+            height=500,
+            barmode='relative'
+        )
 
     return fig
 
+@traced(category='analytics')
 def create_equipment_pareto(equipment_stats):
     """Create Pareto chart for equipment downtime"""
     return create_pareto_chart(
@@ -80,6 +104,7 @@ def create_equipment_pareto(equipment_stats):
         x_title="Equipment"
     )
 
+@traced(category='analytics')
 def create_issue_type_pareto(issue_type_stats):
     """Create Pareto chart for downtime causes"""
     return create_pareto_chart(
@@ -88,46 +113,129 @@ def create_issue_type_pareto(issue_type_stats):
         x_title="Issue Type"
     )
 
-def create_downtime_trend(records):
-    """Create trend analysis of downtime over time"""
-    if not records or len(records) == 0:
+def downsample_lttb(x, y, threshold):
+    """Indices of at most threshold points chosen by Largest-Triangle-Three-Buckets.
+
+    Keeps the first and last points and, from each bucket in between, the
+    point forming the largest triangle with the previously kept point and
+    the next bucket's average, which preserves peaks and the overall shape.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        kept[i + 1] = previous
+    return kept
+
+@traced(category='analytics')
+def create_downtime_trend(db, granularity='day', series=None, rolling=None,
+                          max_points=TREND_MAX_POINTS, **filters):
+    """Create trend analysis of downtime over time from a Database or RecordSnapshot.
+
+    granularity is one of TREND_GRANULARITIES and series optionally splits
+    the trend by line, shift, equipment or issue type (the largest
+    TREND_MAX_SERIES, the rest summed as Other). rolling adds a moving
+    average over that many buckets. Series are downsampled with LTTB so the
+    figure holds at most max_points points in total.
+    """
+    rows = db.get_downtime_series(granularity, series, **filters)
+    if not rows:
         return None
 
-    # Create DataFrame with proper column names
-    columns = ['id', 'date', 'shift', 'line', 'start_time', 'end_time', 
-              'duration', 'equipment', 'issue_type', 'issue_description',
-              'action_taken', 'responsible_person', 'remarks', 'created_at']
-    df = pd.DataFrame(records, columns=columns)
-    df['date'] = pd.to_datetime(df['date'])
-    daily_downtime = df.groupby('date')['duration'].sum().reset_index()
-
-    fig = px.line(
-        daily_downtime, 
-        x='date', 
-        y='duration',
-        title='Daily Downtime Trend',
-        labels={'duration': 'Total Downtime (minutes)', 'date': 'Date'}
-    )
+    trend = pd.DataFrame(rows, columns=['bucket', 'series', 'duration', 'frequency'])
+    trend['bucket'] = pd.to_datetime(trend['bucket'])
+    if series is None:
+        trend['series'] = 'Downtime'
+    else:
+        totals = trend.groupby('series')['duration'].sum().sort_values(ascending=False)
+        trend.loc[~trend['series'].isin(totals.index[:TREND_MAX_SERIES]), 'series'] = 'Other'
+
+    # One column per series; buckets without downtime count as zero
+    table = trend.pivot_table(index='bucket', columns='series', values='duration',
+                              aggfunc='sum', fill_value=0, sort=False)
+    table = table.sort_index()
+    frequency = TREND_GRANULARITIES[granularity]['frequency']
+    if frequency:
+        table = table.asfreq(frequency, fill_value=0)
+
+    # (name, values, opacity); a single series keeps its raw values faintly
+    # behind the moving average
+    traces = []
+    single = len(table.columns) == 1
+    for name in table.columns:
+        values = table[name]
+        if rolling and rolling > 1:
+            average = values.rolling(rolling, min_periods=1).mean()
+            if single:
+                traces.append((name, values, 0.35))
+                name = f'{rolling}-point average'
+            traces.append((name, average, 1.0))
+        else:
+            traces.append((name, values, 1.0))
+
+    points_per_trace = max(3, max_points // len(traces))
+    label = TREND_GRANULARITIES[granularity]['label']
+
+    with span('plotly.trend_figure', 'plotly'):
+        go = _graph_objects()
+        fig = go.Figure()
+        for name, values, opacity in traces:
+            kept = downsample_lttb(values.index.asi8, values.values, points_per_trace)
+            fig.add_trace(go.Scatter(
+                x=values.index[kept],
+                y=values.values[kept],
+                name=str(name),
+                mode='lines',
+                opacity=opacity
+            ))
+
+        fig.update_layout(
+            title=f'{label} Downtime Trend',
+            xaxis=dict(title='Date'),
+            yaxis=dict(title='Total Downtime (minutes)'),
+            showlegend=len(traces) > 1
+        )
 
     return fig
 
+@traced(category='analytics')
 def create_shift_analysis(records):
-    if not records or len(records) == 0:
+    """Compare downtime across shifts; records is a RecordSnapshot or record tuples"""
+    if records is None or len(records) == 0:
         return None
 
-    columns = ['id', 'date', 'shift', 'line', 'start_time', 'end_time', 
-              'duration', 'equipment', 'issue_type', 'issue_description',
-              'action_taken', 'responsible_person', 'remarks', 'created_at']
-    df = pd.DataFrame(records, columns=columns)
+    df = as_snapshot(records).frame
 
     # Aggregate by shift
-    shift_analysis = df.groupby('shift').agg({
+    shift_analysis = df.groupby('shift', observed=True).agg({
         'duration': ['sum', 'mean', 'count']
     }).round(2)
 
     shift_analysis.columns = ['Total Downtime', 'Average Downtime', 'Number of Incidents']
     shift_analysis = shift_analysis.reset_index()
+    shift_analysis['shift'] = shift_analysis['shift'].astype(object)
 
+    go = _graph_objects()
     fig = go.Figure()
 
     # Add bars for each metric
@@ -0,0 +1,140 @@
+import os
+import uuid
+from snapshot import RECORD_COLUMNS
+
+# Cold storage for records moved out of downtime_records by retention.py.
+# Each month of archived records is one zstd-compressed Parquet segment in
+# a directory next to the database (downtime.db -> downtime.archive/), and
+# the archive_segments table lists the segment file currently holding
+# each month. A segment is rewritten under a new name when more of its
+# month is archived, so a reader never sees a half-written file and a
+# crash before the database commit leaves only an unreferenced file.
+#
+# Values are stored exactly as SQLite returns them, so archived rows read
+# back identical to the rows they were moved from.
+
+COMPRESSION = 'zstd'
+
+INTEGER_COLUMNS = ['id', 'duration']
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Archived records require pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def archive_path_for(db_path):
+    """The archive directory of a database file, or None for an in-memory database"""
+    if db_path == ':memory:':
+        return None
+    return os.path.splitext(db_path)[0] + '.archive'
+
+
+def _schema(pa):
+    return pa.schema([
+        (column, pa.int64() if column in INTEGER_COLUMNS else pa.string())
+        for column in RECORD_COLUMNS
+    ])
+
+
+def _filter_expression(pa, start_date=None, end_date=None, line=None,
+                       shift=None, equipment=None, issue_type=None):
+    """The Database.build_filters filters as a pyarrow dataset expression, or None"""
+    import pyarrow.compute as pc
+
+    conditions = []
+    if start_date:
+        conditions.append(pc.field('date') >= str(start_date))
+    if end_date:
+        conditions.append(pc.field('date') <= str(end_date))
+    for column, value in (('line', line), ('shift', shift),
+                          ('equipment', equipment), ('issue_type', issue_type)):
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            values = list(value)
+            if not values:
+                continue
+            conditions.append(pc.field(column).isin(pa.array(values, type=pa.string())))
+        else:
+            conditions.append(pc.field(column) == value)
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def table_rows(table):
+    """Rows of a pyarrow table as tuples, like a cursor's fetchall"""
+    return list(zip(*(column.to_pylist() for column in table.columns)))
+
+
+class RecordArchive:
+    """Parquet segment files of archived records under one directory"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def segment_path(self, file_name):
+        return os.path.join(self.path, file_name)
+
+    def size(self):
+        """Total bytes of the files in the archive directory"""
+        if not os.path.isdir(self.path):
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(self.path) if entry.is_file())
+
+    def write_segment(self, period, rows, previous=None):
+        """Write a month's segment from RECORD_COLUMNS rows plus the previous segment's rows.
+
+        Returns (file_name, row_count) of the new file; the previous file is
+        left in place for the caller to remove once the new one is recorded.
+        """
+        pa = _import_pyarrow()
+        schema = _schema(pa)
+        table = pa.Table.from_pylist(
+            [dict(zip(RECORD_COLUMNS, row)) for row in rows], schema=schema
+        )
+        if previous is not None:
+            table = pa.concat_tables([
+                pa.parquet.read_table(self.segment_path(previous), schema=schema), table
+            ])
+        table = table.sort_by([('date', 'ascending'), ('id', 'ascending')])
+
+        os.makedirs(self.path, exist_ok=True)
+        file_name = f'{period}-{uuid.uuid4().hex[:8]}.parquet'
+        pa.parquet.write_table(table, self.segment_path(file_name), compression=COMPRESSION)
+        return file_name, table.num_rows
+
+    def remove(self, file_name):
+        try:
+            os.remove(self.segment_path(file_name))
+        except FileNotFoundError:
+            pass
+
+    def read_table(self, file_names, columns=None, **filters):
+        """Read the filtered records of several segments as one pyarrow table"""
+        pa = _import_pyarrow()
+        columns = list(columns or RECORD_COLUMNS)
+        expression = _filter_expression(pa, **filters)
+        tables = [
+            pa.parquet.read_table(self.segment_path(file_name), columns=columns, filters=expression)
+            for file_name in file_names
+        ]
+        if not tables:
+            return _schema(pa).empty_table().select(columns)
+        return pa.concat_tables(tables)
+
+    def iter_rows(self, file_names, columns=None, **filters):
+        """Yield the filtered records oldest first, reading one segment at a time.
+
+        file_names must be in period order; each segment is stored sorted by
+        date and id.
+        """
+        for file_name in file_names:
+            yield from table_rows(self.read_table([file_name], columns, **filters))
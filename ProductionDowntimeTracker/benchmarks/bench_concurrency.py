@@ -0,0 +1,165 @@
+"""Concurrent writer/reader stress benchmark for the database layer.
+
+Run from the application directory:
+
+    python -m benchmarks.bench_concurrency [--writers 16] [--readers 16] [--seconds 10]
+
+Writer threads submit records through Database.insert_record the way
+operators do at shift change; reader threads run the dashboard queries
+with a short pause between them.
+Reports throughput, latency percentiles and any errors such as
+'database is locked'.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from database import Database
+from utils import get_shift_options, get_line_options, get_equipment_options, get_issue_type_options
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def make_record(rng):
+    start = rng.randrange(24 * 60)
+    duration = rng.randint(1, 90)
+    end = (start + duration) % (24 * 60)
+    return {
+        'date': f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        'shift': rng.choice(get_shift_options()),
+        'line': rng.choice(get_line_options()),
+        'start_time': f'{start // 60:02d}:{start % 60:02d}',
+        'end_time': f'{end // 60:02d}:{end % 60:02d}',
+        'duration': duration,
+        'equipment': rng.choice(get_equipment_options()[:-1]),
+        'issue_type': rng.choice(get_issue_type_options()[:-1]),
+        'issue_description': 'Stopped for a jam at the infeed',
+        'action_taken': 'Cleared and restarted',
+        'responsible_person': 'Operator',
+        'remarks': ''
+    }
+
+
+def run(db_path, writers, readers, seconds, think_time=0.005, seed=7):
+    db = Database(db_path)
+    stop = threading.Event()
+    lock = threading.Lock()
+    write_latencies = []
+    read_latencies = []
+    errors = []
+
+    def writer(index):
+        rng = random.Random(seed + index)
+        latencies = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                db.insert_record(make_record(rng))
+            except Exception as e:
+                with lock:
+                    errors.append(f'write: {e}')
+                continue
+            latencies.append(time.perf_counter() - started)
+        with lock:
+            write_latencies.extend(latencies)
+
+    def reader(index):
+        rng = random.Random(seed * 1000 + index)
+        queries = [
+            lambda: db.get_downtime_totals(),
+            lambda: db.get_equipment_stats(line=rng.choice(get_line_options())),
+            lambda: db.get_daily_downtime(start_date='2025-03-01', end_date='2025-05-31'),
+            lambda: db.get_records_page(page_size=100),
+            lambda: db.count_search_results('jam'),
+        ]
+        latencies = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                rng.choice(queries)()
+            except Exception as e:
+                with lock:
+                    errors.append(f'read: {e}')
+                continue
+            latencies.append(time.perf_counter() - started)
+            # Dashboard sessions pause between reruns; without this the
+            # readers mostly measure how fast cache hits spin on the GIL
+            time.sleep(think_time)
+        with lock:
+            read_latencies.extend(latencies)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    commits = db.connections.commits
+    jobs = db.connections.jobs_committed
+    db.close()
+
+    def summary(latencies):
+        return {
+            'operations': len(latencies),
+            'per_second': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': max(latencies, default=0) * 1000
+        }
+
+    return {
+        'writers': writers,
+        'readers': readers,
+        'seconds': elapsed,
+        'writes': summary(write_latencies),
+        'reads': summary(read_latencies),
+        'commits': commits,
+        'writes_per_commit': jobs / commits if commits else 0,
+        'errors': errors
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--think-ms', type=float, default=5, help="reader pause between queries")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = run(os.path.join(tmp, 'stress.db'), args.writers, args.readers, args.seconds,
+                     think_time=args.think_ms / 1000)
+
+    print(f"{result['writers']} writers, {result['readers']} readers, {result['seconds']:.1f}s")
+    for kind in ('writes', 'reads'):
+        stats = result[kind]
+        print(f"{kind:>6}: {stats['operations']} ops, {stats['per_second']:,.0f}/s, "
+              f"p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms, "
+              f"p99 {stats['p99_ms']:.1f} ms, max {stats['max_ms']:.1f} ms")
+    print(f"group commit: {result['commits']} transactions, "
+          f"{result['writes_per_commit']:.1f} writes per commit")
+    print(f"errors: {len(result['errors'])}")
+    for error in sorted(set(result['errors']))[:10]:
+        print(f"  {error}")
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
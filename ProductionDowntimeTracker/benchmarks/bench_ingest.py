@@ -0,0 +1,174 @@
+"""Load generator for the HTTP ingestion API.
+
+Run from the application directory:
+
+    python -m benchmarks.bench_ingest [--connections 32] [--seconds 10] [--batch 1]
+                                      [--url http://127.0.0.1:8502]
+
+Without --url an ingest server is started in a subprocess on a fresh
+temporary database. Each connection posts events back to back over
+keep-alive and a share of requests are resent with the same idempotency
+key, as gateways do after a timeout. Reports sustained events per second,
+request latency percentiles, and checks that no retry created a duplicate.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+from benchmarks.bench_concurrency import make_record, percentile
+
+
+async def post(reader, writer, host, body, idempotency_key=None):
+    headers = [
+        'POST /events HTTP/1.1',
+        f'Host: {host}',
+        'Content-Type: application/json',
+        f'Content-Length: {len(body)}',
+    ]
+    if idempotency_key:
+        headers.append(f'Idempotency-Key: {idempotency_key}')
+    writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode() + body)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode().partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(index, host, port, deadline, batch, retry_rate, results):
+    rng = random.Random(index)
+    reader, writer = await asyncio.open_connection(host, port)
+    sequence = 0
+    try:
+        while time.perf_counter() < deadline:
+            events = []
+            for _ in range(batch):
+                sequence += 1
+                event = make_record(rng)
+                event['idempotency_key'] = f'bench-{index}-{sequence}'
+                events.append(event)
+            body = json.dumps(events[0] if batch == 1 else {'events': events}).encode()
+
+            started = time.perf_counter()
+            status, payload = await post(reader, writer, host, body)
+            results['latencies'].append(time.perf_counter() - started)
+            if status == 503:
+                results['throttled'] += 1
+                await asyncio.sleep(0.05)
+                continue
+            if status != 200:
+                results['errors'].append(f'{status}: {payload}')
+                continue
+            results['events'] += batch
+            results['keys'].update(event['idempotency_key'] for event in events)
+
+            if rng.random() < retry_rate:
+                # Resend the same request; every event must come back as a duplicate
+                status, payload = await post(reader, writer, host, body)
+                statuses = [payload['status']] if batch == 1 else [r['status'] for r in payload['results']]
+                results['retries'] += 1
+                if status != 200 or any(s != 'duplicate' for s in statuses):
+                    results['errors'].append(f'retry created a duplicate: {status} {payload}')
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, connections, seconds, batch, retry_rate):
+    results = {'latencies': [], 'events': 0, 'throttled': 0, 'retries': 0, 'keys': set(), 'errors': []}
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        client(i, host, port, deadline, batch, retry_rate, results) for i in range(connections)
+    ))
+    results['seconds'] = time.perf_counter() - started
+    return results
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f'{url}/health', timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"ingest server at {url} did not start")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help="existing ingest server; by default one is started")
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--batch', type=int, default=1, help="events per request")
+    parser.add_argument('--retry-rate', type=float, default=0.05, help="share of requests resent")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'ingest.db')
+        server = None
+        url = args.url
+        if url is None:
+            port = free_port()
+            url = f'http://127.0.0.1:{port}'
+            server = subprocess.Popen(
+                [sys.executable, 'ingest.py', '--db', db_path, '--port', str(port)],
+                stdout=subprocess.DEVNULL
+            )
+        try:
+            wait_for_server(url)
+            parts = urlsplit(url)
+            results = asyncio.run(run_load(parts.hostname, parts.port, args.connections,
+                                           args.seconds, args.batch, args.retry_rate))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+        stored = None
+        if server is not None:
+            conn = sqlite3.connect(db_path)
+            stored = conn.execute('SELECT COUNT(*) FROM downtime_records').fetchone()[0]
+            conn.close()
+
+    latencies = results['latencies']
+    print(f"{args.connections} connections, {args.batch} event(s) per request, {results['seconds']:.1f}s")
+    print(f"ingested {results['events']} events: {results['events'] / results['seconds']:,.0f} events/s")
+    print(f"latency p50 {percentile(latencies, 50) * 1000:.1f} ms, p95 {percentile(latencies, 95) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} ms, max {max(latencies, default=0) * 1000:.1f} ms")
+    print(f"retries: {results['retries']}, throttled (503): {results['throttled']}")
+    ok = not results['errors']
+    if stored is not None:
+        ok = ok and stored == len(results['keys'])
+        print(f"records stored: {stored} for {len(results['keys'])} unique keys")
+    print(f"errors: {len(results['errors'])}")
+    for error in results['errors'][:10]:
+        print(f"  {error}")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
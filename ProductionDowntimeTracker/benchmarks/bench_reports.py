@@ -0,0 +1,81 @@
+"""Scaling benchmark for the per-line report generator.
+
+Run from the application directory:
+
+    python -m benchmarks.bench_reports [--rows 100000] [--workers 1 2 4 8] [--out results.json]
+
+Renders the HTML reports of every configured line for one month of a
+synthetic database with each number of worker processes, into a fresh
+directory each time so nothing is skipped, and reports the wall time and
+the speedup over one worker. Worker counts above the number of CPUs show
+where scaling stops.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks.synthetic import DEFAULT_SEED, populate_database
+from reports import generate_reports
+
+# The synthetic records span 2021 to 2023
+BENCHMARK_PERIOD = ('2023-06-01', '2023-06-30')
+
+
+def default_workers():
+    cpus = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cpus:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpus:
+        counts.append(cpus)
+    return counts
+
+
+def run(rows, workers, seed):
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'downtime.db')
+        populate_database(db_path, rows, seed)
+        for count in workers:
+            summary = generate_reports(db_path, os.path.join(workdir, f'reports-{count}'),
+                                       *BENCHMARK_PERIOD, workers=count)
+            if summary['failed']:
+                raise RuntimeError(f"Reports failed: {summary['failed']}")
+            results.append({
+                'workers': count,
+                'wall_seconds': summary['wall_seconds'],
+                'cpu_seconds': sum(entry['cpu_seconds'] for entry in summary['rendered'].values()),
+                'lines': len(summary['rendered']),
+            })
+    base = results[0]['wall_seconds']
+    for result in results:
+        result['speedup'] = base / result['wall_seconds']
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help="records in the synthetic database")
+    parser.add_argument('--workers', type=int, nargs='+', default=default_workers(),
+                        help="worker counts to run with (default: powers of two up to the CPU count)")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--out', help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, args.workers, args.seed)
+    print(f"{'workers':>8} {'wall':>9} {'cpu':>9} {'speedup':>8} {'efficiency':>11}")
+    for result in results:
+        print(f"{result['workers']:>8} {result['wall_seconds']:>8.2f}s {result['cpu_seconds']:>8.2f}s "
+              f"{result['speedup']:>7.2f}x {result['speedup'] / result['workers']:>10.0%}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'rows': args.rows, 'cpus': os.cpu_count(), 'results': results}, f, indent=2)
+        print(f"Wrote {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Startup and rerun benchmark for the Streamlit app.
+
+Run from the application directory:
+
+    python -m benchmarks.bench_startup [--rows 100000] [--repeat 5] [--out results.json]
+
+Measures, each in a fresh interpreter so nothing is already imported:
+
+- import time of the modules main.py loads, and of plotly, which now
+  only loads with the first chart;
+- opening a Database on an existing file (migrations check, WAL setup,
+  writer thread);
+- with streamlit installed, time to first render of main.py under
+  streamlit.testing's AppTest, then the cost of a plain rerun and of
+  switching to each view.
+
+The app runs against a synthetic database in a temporary directory.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic import DEFAULT_SEED, populate_database
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP_MODULES = [
+    'pandas', 'database', 'analytics', 'export', 'maintenance_predictor',
+    'predictions', 'shift_summary', 'utils', 'instrumentation'
+]
+
+# Each probe prints one JSON object on its last line of output
+IMPORT_PROBE = '''
+import json, sys, time
+sys.path.insert(0, {app_dir!r})
+timings = {{}}
+for module in {modules!r}:
+    started = time.perf_counter()
+    __import__(module)
+    timings[module] = time.perf_counter() - started
+started = time.perf_counter()
+import plotly.graph_objects as go
+go.Figure(go.Bar())
+timings['plotly (first chart)'] = time.perf_counter() - started
+print(json.dumps(timings))
+'''
+
+DATABASE_PROBE = '''
+import json, sys, time
+sys.path.insert(0, {app_dir!r})
+from database import Database
+started = time.perf_counter()
+db = Database({db_path!r})
+opened = time.perf_counter() - started
+db.close()
+print(json.dumps({{'Database() on existing file': opened}}))
+'''
+
+APP_PROBE = '''
+import json, os, sys, time
+sys.path.insert(0, {app_dir!r})
+os.chdir({workdir!r})
+from streamlit.testing.v1 import AppTest
+
+timings = {{}}
+at = AppTest.from_file({main_path!r}, default_timeout=120)
+started = time.perf_counter()
+at.run()
+timings['first render'] = time.perf_counter() - started
+if at.exception:
+    raise SystemExit(f"main.py raised: {{at.exception}}")
+
+reruns = []
+for _ in range({repeat}):
+    started = time.perf_counter()
+    at.run()
+    reruns.append(time.perf_counter() - started)
+timings['rerun (median)'] = sorted(reruns)[len(reruns) // 2]
+
+for view in at.radio(key='active_view').options:
+    started = time.perf_counter()
+    at.radio(key='active_view').set_value(view).run()
+    timings[f'switch to {{view}}'] = time.perf_counter() - started
+print(json.dumps(timings))
+'''
+
+
+def run_probe(source, cwd):
+    """Run a probe in a new interpreter and return its timings in seconds"""
+    completed = subprocess.run(
+        [sys.executable, '-c', source],
+        cwd=cwd, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else
+                           f"probe exited with {completed.returncode}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def median_timings(source, cwd, repeat):
+    runs = [run_probe(source, cwd) for _ in range(repeat)]
+    return {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+
+
+def streamlit_available():
+    completed = subprocess.run([sys.executable, '-c', 'import streamlit.testing.v1'],
+                               capture_output=True)
+    return completed.returncode == 0
+
+
+def run(rows, repeat, seed):
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'downtime.db')
+        populate_database(db_path, rows, seed)
+
+        results['imports'] = median_timings(
+            IMPORT_PROBE.format(app_dir=APP_DIR, modules=APP_MODULES), workdir, repeat
+        )
+        results['database'] = median_timings(
+            DATABASE_PROBE.format(app_dir=APP_DIR, db_path=db_path), workdir, repeat
+        )
+        if streamlit_available():
+            results['app'] = run_probe(APP_PROBE.format(
+                app_dir=APP_DIR, workdir=workdir, repeat=repeat,
+                main_path=os.path.join(APP_DIR, 'main.py')
+            ), workdir)
+        else:
+            results['app'] = None
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help="records in the synthetic database")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--out', help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, args.repeat, args.seed)
+    for section in ('imports', 'database', 'app'):
+        if results[section] is None:
+            print(f"{section}: skipped, streamlit is not installed")
+            continue
+        print(f"{section}:")
+        for name, seconds in results[section].items():
+            print(f"  {name:<36} {seconds * 1000:>9.1f} ms")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(dict(results, rows=args.rows, repeat=args.repeat), f, indent=2)
+        print(f"Wrote {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""Benchmark suite for the database, analytics and predictor hot paths.
+
+Run from the application directory:
+
+    python -m benchmarks.suite [--sizes 10000 100000 1000000] [--out results.json]
+                               [--compare previous.json]
+
+For each size a fresh database is filled with seeded synthetic records and
+every benchmark is timed with the snapshot cache cleared, so each run
+measures real work. Peak memory is taken from tracemalloc in a separate
+run and covers Python allocations only. Results are written as JSON.
+With --compare, they are checked against an earlier results file.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+from analytics import calculate_kpis, create_pareto_chart, create_downtime_trend
+from benchmarks.synthetic import DEFAULT_SEED, populate_database
+from database import Database
+from maintenance_predictor import calculate_equipment_metrics
+from shift_summary import build_shift_summaries, format_downtime_summary
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+
+def build_benchmarks(db):
+    """Return [(name, function)]; inputs the functions need are prepared up front"""
+    columns, records = db.get_all_records()
+    snapshot = db.get_snapshot()
+    equipment_stats = db.get_equipment_stats()
+    busiest_date, busiest_line = db.conn.execute('''
+        SELECT date, line FROM downtime_records
+        GROUP BY date, line ORDER BY COUNT(*) DESC LIMIT 1
+    ''').fetchone()
+    production_data = {
+        'date': busiest_date,
+        'line': busiest_line,
+        'shift': 'Morning',
+        'packs_produced': 0
+    }
+
+    return [
+        ('Database.get_all_records', lambda: db.get_all_records()),
+        ('Database.get_equipment_stats', lambda: db.get_equipment_stats()),
+        ('analytics.calculate_kpis', lambda: calculate_kpis(db)),
+        ('analytics.create_pareto_chart', lambda: create_pareto_chart(equipment_stats)),
+        ('analytics.create_downtime_trend', lambda: create_downtime_trend(db)),
+        ('analytics.create_downtime_trend (shift, by line)',
+         lambda: create_downtime_trend(db, 'shift', 'line', rolling=7)),
+        ('Database.get_snapshot', lambda: db.get_snapshot()),
+        ('maintenance_predictor.calculate_equipment_metrics',
+         lambda: calculate_equipment_metrics(records)),
+        ('maintenance_predictor.calculate_equipment_metrics (snapshot)',
+         lambda: calculate_equipment_metrics(snapshot)),
+        ('shift_summary.format_downtime_summary',
+         lambda: format_downtime_summary(records, production_data)),
+        ('shift_summary.build_shift_summaries (all lines and shifts)',
+         lambda: build_shift_summaries(db, busiest_date)),
+    ]
+
+
+def time_benchmark(db, function, repeat):
+    timings = []
+    for _ in range(repeat):
+        db.cache.clear()
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def peak_memory(db, function):
+    db.cache.clear()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_size(num_rows, repeat, seed, workdir):
+    db_path = os.path.join(workdir, f'bench_{num_rows}.db')
+    started = time.perf_counter()
+    populate_database(db_path, num_rows, seed)
+    populate_seconds = time.perf_counter() - started
+    print(f"{num_rows:>9} rows: populated in {populate_seconds:.1f}s")
+
+    db = Database(db_path)
+    results = []
+    try:
+        for name, function in build_benchmarks(db):
+            timings = time_benchmark(db, function, repeat)
+            peak = peak_memory(db, function)
+            result = {
+                'name': name,
+                'rows': num_rows,
+                'wall_min_s': min(timings),
+                'wall_median_s': statistics.median(timings),
+                'peak_mb': peak / 1e6,
+                'repeat': repeat
+            }
+            results.append(result)
+            print(f"{'':>9}  {name:<62} {result['wall_median_s'] * 1000:>10.1f} ms "
+                  f"{result['peak_mb']:>9.1f} MB")
+    finally:
+        db.close()
+        os.remove(db_path)
+    return results
+
+
+def compare(results, previous, threshold):
+    """Print the change against an earlier run; returns the regressed benchmarks"""
+    baseline = {(r['name'], r['rows']): r for r in previous['results']}
+    regressions = []
+    print(f"\nCompared with {previous['meta'].get('timestamp', 'previous run')}:")
+    for result in results:
+        before = baseline.get((result['name'], result['rows']))
+        if before is None or not before['wall_min_s']:
+            continue
+        # Best-of-N is far less noisy than the median on a shared machine
+        ratio = result['wall_min_s'] / before['wall_min_s']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(result)
+        print(f"  {result['rows']:>9} {result['name']:<62} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="slowdown ratio over 1 reported as a regression")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for num_rows in args.sizes:
+            results.extend(run_size(num_rows, args.repeat, args.seed, workdir))
+
+    output = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+        },
+        'results': results
+    }
+    with open(args.out, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"\nWrote {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(results, previous, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""Seeded synthetic downtime_records for benchmarks.
+
+Records use the line, equipment, shift and issue type options from utils
+with skewed frequencies: a few lines and machines account for most stops,
+Mechanical and Electrical issues dominate, more stops start on the night
+shift, and durations have a long tail. Each stop's shift is the one its
+start time falls in. The same seed always produces the same rows.
+"""
+import bisect
+import random
+import sqlite3
+from datetime import date, timedelta
+
+from bulk_import import IMPORT_COLUMNS, load_rows
+from migrations import migrate
+from utils import (get_equipment_options, get_issue_type_options, get_line_options,
+                   get_shift_options, get_shift_start_times)
+
+DEFAULT_SEED = 20250215
+
+# Relative frequencies of the configured issue types and shifts (without
+# 'Other'); options added to utils later get the default weight
+ISSUE_TYPE_FREQUENCIES = {
+    'Mechanical': 35, 'Electrical': 20, 'Operational': 15,
+    'Production': 12, 'Material Shortage': 10, 'Quality': 8
+}
+SHIFT_FREQUENCIES = {'Morning': 30, 'Afternoon': 32, 'Night': 38}
+DEFAULT_WEIGHT = 10
+
+ISSUE_TYPE_WEIGHTS = {
+    issue_type: ISSUE_TYPE_FREQUENCIES.get(issue_type, DEFAULT_WEIGHT)
+    for issue_type in get_issue_type_options() if issue_type != 'Other'
+}
+SHIFT_WEIGHTS = {
+    shift: SHIFT_FREQUENCIES.get(shift, DEFAULT_WEIGHT) for shift in get_shift_options()
+}
+
+DESCRIPTIONS = {
+    'Mechanical': ['Bearing noise and vibration', 'Belt slipped off the drive pulley',
+                   'Jam at the infeed star wheel', 'Gearbox overheating'],
+    'Electrical': ['Motor tripped on overload', 'Sensor not detecting bottles',
+                   'PLC fault, line stopped', 'Loose connection in control panel'],
+    'Operational': ['Changeover took longer than planned', 'Operator not at station',
+                    'Wrong recipe selected'],
+    'Production': ['Waiting for upstream line', 'Downstream accumulation full'],
+    'Material Shortage': ['Preforms not delivered', 'Labels ran out', 'Caps out of stock'],
+    'Quality': ['Fill level out of tolerance', 'Labels misaligned', 'Cap torque failures'],
+}
+DEFAULT_DESCRIPTIONS = ['Stopped, cause under investigation']
+
+ACTIONS = ['Adjusted and restarted', 'Replaced worn part', 'Reset and monitored',
+           'Called maintenance, part replaced', 'Cleared jam and cleaned sensors']
+
+PEOPLE = ['A. Mensah', 'B. Okafor', 'C. Adeyemi', 'D. Boateng', 'E. Nwosu', 'F. Owusu']
+
+
+def zipf_weights(count, exponent=1.1):
+    return [1 / rank ** exponent for rank in range(1, count + 1)]
+
+
+def shift_windows():
+    """[(shift, start minute, length)] of each shift, from its start time to the next shift's"""
+    starts = sorted((int(time[:2]) * 60 + int(time[3:]), shift)
+                    for shift, time in get_shift_start_times().items())
+    return [(shift, start, (starts[(index + 1) % len(starts)][0] - start) % (24 * 60) or 24 * 60)
+            for index, (start, shift) in enumerate(starts)]
+
+
+def shift_at(minute, windows):
+    """The shift a minute of the day falls in; before the first start it is the last shift's"""
+    index = bisect.bisect_right([start for _, start, _ in windows], minute) - 1
+    return windows[index][0]
+
+
+def generate_records(num_rows, seed=DEFAULT_SEED, start_date=date(2021, 1, 1), days=1095):
+    """Yield num_rows tuples in IMPORT_COLUMNS order, in date order"""
+    rng = random.Random(seed)
+
+    lines = get_line_options()
+    line_weights = zipf_weights(len(lines), 0.8)
+    equipment = get_equipment_options()[:-1]
+    equipment_weights = zipf_weights(len(equipment), 1.1)
+    issue_types = list(ISSUE_TYPE_WEIGHTS)
+    issue_weights = list(ISSUE_TYPE_WEIGHTS.values())
+    windows = shift_windows()
+    window_weights = [SHIFT_WEIGHTS.get(shift, DEFAULT_WEIGHT) for shift, _, _ in windows]
+
+    for i in range(num_rows):
+        day = start_date + timedelta(days=i * days // num_rows)
+        issue_type = rng.choices(issue_types, issue_weights)[0]
+        _, window_start, window_length = rng.choices(windows, window_weights)[0]
+        start_minute = (window_start + rng.randrange(window_length)) % (24 * 60)
+        duration = max(1, min(480, int(rng.lognormvariate(2.8, 0.9))))
+        end_minute = (start_minute + duration) % (24 * 60)
+        yield (
+            day.isoformat(),
+            shift_at(start_minute, windows),
+            rng.choices(lines, line_weights)[0],
+            f'{start_minute // 60:02d}:{start_minute % 60:02d}',
+            f'{end_minute // 60:02d}:{end_minute % 60:02d}',
+            duration,
+            rng.choices(equipment, equipment_weights)[0],
+            issue_type,
+            rng.choice(DESCRIPTIONS.get(issue_type, DEFAULT_DESCRIPTIONS)),
+            rng.choice(ACTIONS),
+            rng.choice(PEOPLE),
+            '' if rng.random() < 0.8 else 'Follow up next shift'
+        )
+
+
+def generate_dicts(num_rows, seed=DEFAULT_SEED):
+    """Yield the same records as dicts keyed by column name"""
+    for row in generate_records(num_rows, seed):
+        yield dict(zip(IMPORT_COLUMNS, row))
+
+
+def populate_database(db_path, num_rows, seed=DEFAULT_SEED):
+    """Create db_path at the latest schema and fill it with num_rows records"""
+    conn = sqlite3.connect(db_path)
+    migrate(conn)
+    count = load_rows(conn, generate_records(num_rows, seed))
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+    return count
@@ -0,0 +1,445 @@
+import argparse
+import csv
+import functools
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import date, datetime
+from connection import DEFAULT_BUSY_TIMEOUT
+from dimensions import DIMENSION_COLUMNS, DIMENSION_TABLES, canonicalize_rows
+from failure_stats import rebuild_stats
+from intervals import ended_at_sql, minutes_sql, started_at_sql
+from migrations import BULK_INSERT_GUARD, migrate
+from utils import (
+    calculate_duration, get_shift_options, get_line_options,
+    get_equipment_options, get_issue_type_options
+)
+
+IMPORT_COLUMNS = [
+    'date', 'shift', 'line', 'start_time', 'end_time', 'duration',
+    'equipment', 'issue_type', 'issue_description', 'action_taken',
+    'responsible_person', 'remarks'
+]
+
+
+def insert_sql(columns=IMPORT_COLUMNS):
+    return f'''
+        INSERT INTO downtime_records ({', '.join(columns)})
+        VALUES ({', '.join('?' * len(columns))})
+    '''
+
+
+INSERT_SQL = insert_sql()
+
+SHIFTS = {shift.lower(): shift for shift in get_shift_options()}
+LINES = set(get_line_options())
+EQUIPMENT = {name.lower(): name for name in get_equipment_options() if name != 'Other'}
+ISSUE_TYPES = {name.lower(): name for name in get_issue_type_options() if name != 'Other'}
+
+TIME_PATTERN = re.compile(r'^(\d{1,2}):(\d{2})(?::\d{2})?$')
+DATE_FORMATS = ['%Y/%m/%d', '%d.%m.%Y', '%Y-%m-%d %H:%M:%S']
+
+
+class RowError(ValueError):
+    pass
+
+
+# Historical logs repeat the same dates, clock times, lines and categories
+# on thousands of rows, so the per-value normalizers are memoized.
+memoize = functools.lru_cache(maxsize=65536)
+
+
+def normalize_header(name):
+    """'Issue Description' -> 'issue_description'"""
+    return re.sub(r'\W+', '_', str(name).strip().lower()).strip('_')
+
+
+@memoize
+def _normalize_date(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value or '').strip()
+    if not text:
+        raise RowError('missing date')
+    try:
+        return date.fromisoformat(text).isoformat()
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise RowError(f"invalid date '{text}'")
+
+
+@memoize
+def _normalize_time(value, field):
+    if hasattr(value, 'strftime'):
+        return value.strftime('%H:%M')
+    text = str(value or '').strip()
+    if not text:
+        return ''
+    match = TIME_PATTERN.match(text)
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise RowError(f"invalid {field} '{text}'")
+    return f'{int(match.group(1)):02d}:{match.group(2)}'
+
+
+@memoize
+def _normalize_line(value):
+    text = str(value or '').strip()
+    if text.isdigit():
+        text = f'Line {int(text)}'
+    else:
+        text = ' '.join(text.split()).title()
+    if text not in LINES:
+        raise RowError(f"unknown line '{value}'")
+    return text
+
+
+@memoize
+def _normalize_category(value, field):
+    text = ' '.join(str(value or '').split())
+    if not text:
+        raise RowError(f'missing {field}')
+    # Standard options get their canonical spelling, anything else is kept
+    # as free text like the 'Other' choice in the entry form
+    options = EQUIPMENT if field == 'equipment' else ISSUE_TYPES
+    return options.get(text.lower(), text)
+
+
+def _normalize_duration(value, start_time, end_time):
+    if value is None or str(value).strip() == '':
+        if not start_time or not end_time:
+            raise RowError('missing duration and start/end time')
+        return calculate_duration(start_time, end_time)
+    try:
+        duration = int(float(value))
+    except (TypeError, ValueError):
+        raise RowError(f"invalid duration '{value}'")
+    if duration < 0:
+        raise RowError(f"negative duration '{value}'")
+    return duration
+
+
+def normalize_row(row):
+    """Validate a mapping of input fields and return the values to insert.
+
+    Raises RowError describing the first problem found.
+    """
+    shift = SHIFTS.get(str(row.get('shift') or '').strip().lower())
+    if shift is None:
+        raise RowError(f"unknown shift '{row.get('shift')}'")
+
+    start_time = _normalize_time(row.get('start_time'), 'start_time')
+    end_time = _normalize_time(row.get('end_time'), 'end_time')
+
+    return (
+        _normalize_date(row.get('date')),
+        shift,
+        _normalize_line(row.get('line')),
+        start_time,
+        end_time,
+        _normalize_duration(row.get('duration'), start_time, end_time),
+        _normalize_category(row.get('equipment'), 'equipment'),
+        _normalize_category(row.get('issue_type'), 'issue_type'),
+        str(row.get('issue_description') or '').strip(),
+        str(row.get('action_taken') or '').strip(),
+        str(row.get('responsible_person') or '').strip(),
+        str(row.get('remarks') or '').strip()
+    )
+
+
+def read_csv_rows(path):
+    """Stream rows from a CSV file as dicts keyed by normalized headers"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = [normalize_header(name) for name in next(reader, [])]
+        for values in reader:
+            yield dict(zip(header, values))
+
+
+def read_excel_rows(path):
+    """Stream rows from the first sheet of an Excel workbook"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("Importing Excel files requires openpyxl (pip install openpyxl)")
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [normalize_header(name) for name in next(rows, ())]
+        for values in rows:
+            if any(value is not None for value in values):
+                yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def read_rows(path):
+    if str(path).lower().endswith(('.xlsx', '.xlsm')):
+        return read_excel_rows(path)
+    return read_csv_rows(path)
+
+
+# The insert triggers on downtime_records are switched off during a bulk
+# load by the BULK_INSERT_GUARD row (migration 14) and replaced by one
+# set-based statement per batch, run in this order. Other triggers fire per
+# row as usual.
+
+def _maintain_rollup(cursor, first_id):
+    for column in DIMENSION_COLUMNS:
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO {DIMENSION_TABLES[column]} (name)
+            SELECT DISTINCT IFNULL({column}, '') FROM downtime_records WHERE id >= ?
+        ''', (first_id,))
+    cursor.execute('''
+        INSERT INTO downtime_rollup
+            (date, line_id, shift_id, equipment_id, issue_type_id, incidents, total_duration)
+        SELECT IFNULL(r.date, ''), l.id, s.id, e.id, i.id,
+               COUNT(*), IFNULL(SUM(r.duration), 0)
+        FROM downtime_records r
+        JOIN dim_line l ON l.name = IFNULL(r.line, '')
+        JOIN dim_shift s ON s.name = IFNULL(r.shift, '')
+        JOIN dim_equipment e ON e.name = IFNULL(r.equipment, '')
+        JOIN dim_issue_type i ON i.name = IFNULL(r.issue_type, '')
+        WHERE r.id >= ?
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT (date, line_id, shift_id, equipment_id, issue_type_id) DO UPDATE SET
+            incidents = incidents + excluded.incidents,
+            total_duration = total_duration + excluded.total_duration
+    ''', (first_id,))
+
+
+def _maintain_search(cursor, first_id):
+    cursor.execute('''
+        INSERT INTO downtime_search
+            (rowid, issue_description, action_taken, remarks, equipment, responsible_person)
+        SELECT id, issue_description, action_taken, remarks, equipment, responsible_person
+        FROM downtime_records
+        WHERE id >= ?
+    ''', (first_id,))
+
+
+def _maintain_dirty_equipment(cursor, first_id):
+    cursor.execute('''
+        INSERT INTO maintenance_dirty (equipment)
+        SELECT DISTINCT equipment FROM downtime_records WHERE id >= ?
+    ''', (first_id,))
+
+
+def _maintain_intervals(cursor, first_id):
+    cursor.execute(f'''
+        UPDATE downtime_records SET
+            started_at = {started_at_sql('downtime_records')},
+            ended_at = {ended_at_sql('downtime_records')}
+        WHERE id >= ?
+    ''', (first_id,))
+    cursor.execute(f'''
+        INSERT INTO downtime_intervals (id, start_minute, end_minute)
+        SELECT id, {minutes_sql('started_at')}, {minutes_sql('ended_at')}
+        FROM downtime_records WHERE id >= ? AND started_at IS NOT NULL
+    ''', (first_id,))
+
+
+def _maintain_line_downtime_dirty(cursor, first_id):
+    # Reads the timestamps _maintain_intervals has stored
+    cursor.execute(f'''
+        INSERT INTO line_downtime_dirty (date, end_minute)
+        SELECT date, MAX({minutes_sql('ended_at')})
+        FROM downtime_records
+        WHERE id >= ? AND started_at IS NOT NULL
+        GROUP BY date
+    ''', (first_id,))
+
+
+BULK_MAINTENANCE = {
+    'trg_downtime_rollup_insert': _maintain_rollup,
+    'trg_downtime_search_insert': _maintain_search,
+    'trg_maintenance_dirty_insert': _maintain_dirty_equipment,
+    'trg_downtime_interval_insert': _maintain_intervals,
+    'trg_line_downtime_dirty_insert': _maintain_line_downtime_dirty,
+}
+
+
+def _write_batch(conn, batch, columns=IMPORT_COLUMNS):
+    """Insert a batch of row tuples in columns order in one transaction with insert triggers guarded.
+
+    The guarded triggers' work is done once for the whole batch by their
+    BULK_MAINTENANCE steps.
+
+    Returns the equipment names the batch added records for, whose failure
+    statistics _rebuild_failure_stats has to bring up to date.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN')
+        cursor.execute('INSERT INTO trigger_guards (name) VALUES (?)', (BULK_INSERT_GUARD,))
+        first_id = cursor.execute(
+            'SELECT IFNULL(MAX(id), 0) + 1 FROM downtime_records'
+        ).fetchone()[0]
+        cursor.executemany(insert_sql(columns), canonicalize_rows(cursor, batch, columns))
+
+        for maintain in BULK_MAINTENANCE.values():
+            maintain(cursor, first_id)
+        cursor.execute('DELETE FROM trigger_guards WHERE name = ?', (BULK_INSERT_GUARD,))
+        equipment = {row[0] for row in cursor.execute(
+            'SELECT DISTINCT equipment FROM downtime_records WHERE id >= ?', (first_id,)
+        )}
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return equipment
+
+
+def _rebuild_failure_stats(conn, equipment):
+    """Recompute the failure statistics of the imported equipment in one transaction.
+
+    Imported records land anywhere in an equipment's history, so its
+    statistics are recomputed once the import has finished rather than
+    updated per row or per batch.
+    """
+    if not equipment:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN')
+        rebuild_stats(cursor, sorted(equipment, key=str))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def import_rows(conn, rows, batch_size=50000):
+    """Validate rows and write them in batched transactions.
+
+    rows is an iterable of dicts keyed by downtime_records column names.
+    Invalid rows are skipped and reported; they never abort a batch.
+    Returns (imported_count, rejects) where rejects is a list of
+    (row_number, reason, row) with row_number counting data rows from 1.
+    """
+    imported = 0
+    rejects = []
+    batch = []
+    equipment = set()
+
+    # Batches already committed are counted in the statistics even if a
+    # later one fails
+    try:
+        for row_number, row in enumerate(rows, start=1):
+            try:
+                batch.append(normalize_row(row))
+            except RowError as e:
+                rejects.append((row_number, str(e), row))
+                continue
+
+            if len(batch) >= batch_size:
+                equipment |= _write_batch(conn, batch)
+                imported += len(batch)
+                batch = []
+
+        if batch:
+            equipment |= _write_batch(conn, batch)
+            imported += len(batch)
+    finally:
+        _rebuild_failure_stats(conn, equipment)
+
+    return imported, rejects
+
+
+def load_rows(conn, rows, batch_size=50000, columns=IMPORT_COLUMNS):
+    """Write already normalized row tuples (columns order, IMPORT_COLUMNS by default) in batches.
+
+    Skips validation; meant for trusted generated data or rows copied from
+    another database. Returns the row count.
+    """
+    count = 0
+    batch = []
+    equipment = set()
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                equipment |= _write_batch(conn, batch, columns)
+                count += len(batch)
+                batch = []
+        if batch:
+            equipment |= _write_batch(conn, batch, columns)
+            count += len(batch)
+    finally:
+        _rebuild_failure_stats(conn, equipment)
+    return count
+
+
+def write_rejects(path, rejects):
+    """Write (source_file, row_number, reason, row) rejects to a CSV report"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file', 'row', 'reason'] + IMPORT_COLUMNS)
+        for source, row_number, reason, row in rejects:
+            writer.writerow(
+                [source, row_number, reason] + [row.get(column, '') for column in IMPORT_COLUMNS]
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import downtime logs from CSV or Excel files")
+    parser.add_argument('files', nargs='+', help="CSV (.csv) or Excel (.xlsx) files")
+    parser.add_argument('--db', default='downtime.db',
+                        help="database file or partitions directory (default: downtime.db)")
+    parser.add_argument('--plant', help="with a partitions directory, the plant the rows belong to")
+    parser.add_argument('--batch-size', type=int, default=50000, help="rows per transaction")
+    parser.add_argument('--rejects', help="write rejected rows with reasons to this CSV file")
+    args = parser.parse_args(argv)
+
+    # partitions imports this module, so it is only imported when run as a script
+    from partitions import DEFAULT_PLANT, PartitionedDatabase
+    if os.path.isdir(args.db):
+        partitioned = PartitionedDatabase(args.db)
+        plant = args.plant or DEFAULT_PLANT
+
+        def import_file(path):
+            return partitioned.import_rows(read_rows(path), plant, batch_size=args.batch_size)
+    elif args.plant:
+        parser.error("--plant needs --db to be a partitions directory")
+    else:
+        conn = sqlite3.connect(args.db, timeout=DEFAULT_BUSY_TIMEOUT)
+        migrate(conn)
+
+        def import_file(path):
+            return import_rows(conn, read_rows(path), batch_size=args.batch_size)
+
+    total_imported = 0
+    all_rejects = []
+    started = time.perf_counter()
+    for path in args.files:
+        imported, rejects = import_file(path)
+        total_imported += imported
+        all_rejects.extend((path,) + reject for reject in rejects)
+        print(f"{path}: {imported} imported, {len(rejects)} rejected")
+        for row_number, reason, _ in rejects[:20]:
+            print(f"  row {row_number}: {reason}")
+        if len(rejects) > 20:
+            print(f"  ... {len(rejects) - 20} more")
+    elapsed = time.perf_counter() - started
+    if not os.path.isdir(args.db):
+        conn.close()
+
+    if args.rejects and all_rejects:
+        write_rejects(args.rejects, all_rejects)
+
+    rate = total_imported / elapsed if elapsed else 0
+    print(f"Imported {total_imported} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return 1 if all_rejects else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+import functools
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+class SnapshotCache:
+    """In-memory LRU cache of query results keyed by a data version.
+
+    Every write through Database bumps the version, which makes all entries
+    computed against older data unreachable; they are dropped straight away
+    rather than waiting to be evicted.
+
+    When db_path is given, the cache also keeps a connection open to watch
+    PRAGMA data_version, which changes whenever another connection commits.
+    Writes made outside Database, such as a bulk import from the command
+    line, then invalidate the cache as well. The watch connection only
+    reads; with read_only it is opened with mode=ro so a read-only Database
+    never holds a writable handle on the file.
+
+    Commits of the Database's own writer go through own_commit, which
+    absorbs the data_version change they cause; those writes invalidate
+    what they touch themselves (bump_version or invalidate).
+    """
+
+    def __init__(self, max_entries=64, db_path=None, read_only=False):
+        self.max_entries = max_entries
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._watch_conn = None
+        self._seen_data_version = None
+        if db_path is not None:
+            if read_only:
+                self._watch_conn = sqlite3.connect(f'{Path(db_path).resolve().as_uri()}?mode=ro',
+                                                   uri=True, check_same_thread=False)
+            else:
+                self._watch_conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._seen_data_version = self._read_data_version()
+
+    def _read_data_version(self):
+        return self._watch_conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def _check_external_writes(self):
+        # Called with the lock held
+        if self._watch_conn is None:
+            return
+        data_version = self._read_data_version()
+        if data_version != self._seen_data_version:
+            self._seen_data_version = data_version
+            self.version += 1
+            self._entries.clear()
+
+    def own_commit(self, commit):
+        """Run commit() for the Database's own writer without it counting as an external write.
+
+        Called by the writer while it still holds the write lock, so no
+        other connection can commit between the check for earlier external
+        writes and commit(). Only a commit landing between commit() and
+        re-reading data_version could go unnoticed.
+        """
+        with self._lock:
+            self._check_external_writes()
+            commit()
+            if self._watch_conn is not None:
+                self._seen_data_version = self._read_data_version()
+
+    def bump_version(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            return self.version
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key at the current version, computing it on a miss"""
+        with self._lock:
+            self._check_external_writes()
+            version = self.version
+            full_key = (version, key)
+            if full_key in self._entries:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return self._entries[full_key]
+            self.misses += 1
+
+        value = compute()
+
+        with self._lock:
+            # Skip storing if a write landed while computing
+            if version == self.version:
+                self._entries[full_key] = value
+                self._entries.move_to_end(full_key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, names):
+        """Drop the cached results of the named queries only, keeping the version"""
+        names = set(names)
+        with self._lock:
+            for full_key in [full_key for full_key in self._entries if full_key[1][0] in names]:
+                del self._entries[full_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self.version,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(db_path, read_only=False):
+    """Return the process-wide cache shared by every Database on db_path.
+
+    read_only applies to the watch connection of a cache created by this
+    call; a cache that already exists is shared as it is, since its watch
+    connection never writes either way.
+    """
+    if db_path == ':memory:':
+        # Each in-memory connection is a separate database
+        return SnapshotCache()
+    db_path = os.path.abspath(db_path)
+    with _caches_lock:
+        if db_path not in _caches:
+            _caches[db_path] = SnapshotCache(db_path=db_path, read_only=read_only)
+        return _caches[db_path]
+
+
+def make_key(name, *args, **kwargs):
+    """Build a hashable cache key, turning list filter values into tuples"""
+    def freeze(value):
+        if isinstance(value, (list, tuple, set)):
+            return tuple(value)
+        return value
+
+    return (
+        name,
+        tuple(freeze(arg) for arg in args),
+        tuple(sorted((k, freeze(v)) for k, v in kwargs.items()))
+    )
+
+
+def cached_query(method):
+    """Cache a Database read method's result in the instance's SnapshotCache"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = make_key(method.__name__, *args, **kwargs)
+        return self.cache.get_or_compute(key, lambda: method(self, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,201 @@
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+
+# SQLite allows one writer at a time. Rather than letting every Streamlit
+# session thread contend for the write lock (and fail with 'database is
+# locked'), all writes are queued to a single writer thread. Whatever has
+# queued up while the previous transaction was committing goes into the
+# next transaction together (group commit), each job in its own savepoint
+# so a failing job does not take the others down with it. Reads use
+# per-thread connections which WAL lets run alongside the writer.
+#
+# A read-only manager (report workers) opens the file with mode=ro and has
+# no writer at all, so any number of processes can read the same database.
+
+DEFAULT_BUSY_TIMEOUT = 10.0
+
+
+class ConnectionManager:
+    def __init__(self, db_path, busy_timeout=DEFAULT_BUSY_TIMEOUT, max_batch=256,
+                 max_idle_readers=8, read_only=False):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.max_batch = max_batch
+        self.max_idle_readers = max_idle_readers
+        self.shared = db_path == ':memory:'
+        self.read_only = read_only
+        if read_only and self.shared:
+            raise ValueError("An in-memory database cannot be opened read-only")
+
+        self._readers = {}
+        self._idle_readers = []
+        self._readers_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._closed = False
+        self.commits = 0
+        self.jobs_committed = 0
+        # Called with the writer's commit function in place of calling it
+        # directly; Database hands it to its cache (SnapshotCache.own_commit)
+        self.commit_hook = None
+
+        self.writer_conn = None
+        if read_only:
+            self._writer = None
+            return
+        self.writer_conn = self._connect()
+        if not self.shared:
+            self.writer_conn.execute('PRAGMA journal_mode = WAL')
+            # NORMAL is durable across application crashes in WAL mode
+            self.writer_conn.execute('PRAGMA synchronous = NORMAL')
+
+        self._writer = None
+
+    def _connect(self):
+        if self.read_only:
+            conn = sqlite3.connect(f'{Path(self.db_path).resolve().as_uri()}?mode=ro', uri=True,
+                                   timeout=self.busy_timeout, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}')
+        return conn
+
+    def start(self):
+        """Start the writer thread; call once the schema is up to date"""
+        if self._writer is None and not self.read_only:
+            self._writer = threading.Thread(
+                target=self._writer_loop, name=f'sqlite-writer:{self.db_path}', daemon=True
+            )
+            self._writer.start()
+
+    def reader(self):
+        """Return the calling thread's read-only connection.
+
+        Connections of threads that have exited are reused by new threads,
+        and a bounded number are kept idle.
+        """
+        if self.shared:
+            return self.writer_conn
+
+        ident = threading.get_ident()
+        conn = self._readers.get(ident)
+        if conn is not None:
+            return conn
+
+        with self._readers_lock:
+            self._reclaim_readers()
+            if self._idle_readers:
+                conn = self._idle_readers.pop()
+            else:
+                conn = self._connect()
+                conn.execute('PRAGMA query_only = 1')
+            self._readers[ident] = conn
+        return conn
+
+    def _reclaim_readers(self):
+        # Called with _readers_lock held
+        alive = {thread.ident for thread in threading.enumerate()}
+        for ident in [ident for ident in self._readers if ident not in alive]:
+            conn = self._readers.pop(ident)
+            if len(self._idle_readers) < self.max_idle_readers:
+                self._idle_readers.append(conn)
+            else:
+                conn.close()
+
+    def submit(self, job):
+        """Queue job(cursor) to run in the writer's next transaction.
+
+        Returns a Future resolving to the job's return value once its
+        transaction has committed.
+        """
+        if self._closed:
+            raise RuntimeError("Connection manager is closed")
+        if self.read_only:
+            raise RuntimeError(f"{self.db_path} is opened read-only")
+        future = Future()
+        self._queue.put((job, future))
+        return future
+
+    def write(self, job):
+        """Run job(cursor) in a write transaction and wait for the commit"""
+        if self.read_only:
+            raise RuntimeError(f"{self.db_path} is opened read-only")
+        if self._writer is None:
+            # Before start() (migrations) writes run synchronously
+            return self._run_batch([(job, Future())])[0].result()
+        return self.submit(job).result()
+
+    def _writer_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._run_batch(batch)
+            if stop:
+                break
+
+    def _run_batch(self, batch):
+        conn = self.writer_conn
+        cursor = conn.cursor()
+        results = []
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for job, future in batch:
+                cursor.execute('SAVEPOINT job')
+                try:
+                    results.append((future, job(cursor), None))
+                    cursor.execute('RELEASE job')
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO job')
+                    cursor.execute('RELEASE job')
+                    results.append((future, None, e))
+            if self.commit_hook is not None:
+                self.commit_hook(conn.commit)
+            else:
+                conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return [future for _, future in batch]
+
+        self.commits += 1
+        self.jobs_committed += len(batch)
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        return [future for _, future in batch]
+
+    def close(self):
+        """Finish queued writes, stop the writer and close every connection"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+        with self._readers_lock:
+            for conn in list(self._readers.values()) + self._idle_readers:
+                if conn is not self.writer_conn:
+                    conn.close()
+            self._readers.clear()
+            self._idle_readers.clear()
+        if self.writer_conn is not None:
+            self.writer_conn.close()
@@ -1,82 +1,654 @@
-import sqlite3
-from datetime import datetime
+import heapq
+import re
+import pandas as pd
+from datetime import datetime, timedelta
+from archive import RecordArchive, archive_path_for, table_rows
+from cache import cached_query, get_cache, make_key
+from connection import ConnectionManager
+from dimensions import DIMENSION_TABLES, REST_LABEL, canonicalize_rows, merge_member
+from failure_stats import delete_records, failure_rate_alerts, read_stats, record_added
+from instrumentation import traced
+from intervals import event_minutes, from_minutes, line_downtime, shift_availability, shift_windows, to_minutes
+from maintenance_predictor import METRIC_COLUMNS
+from merged_downtime import line_downtime_total, refresh_line_downtime
+from migrations import LATEST_VERSION, get_schema_version, migrate
+from snapshot import RECORD_COLUMNS, RecordSnapshot, SNAPSHOT_COLUMNS, concat_frames
+from utils import get_shift_start_times
+
+def build_search_query(search_term):
+    """Translate a search box entry into an FTS5 MATCH expression.
+
+    Quoted text is matched as a phrase and every other word as a prefix,
+    so 'conv "belt slip"' finds records mentioning conveyor and the exact
+    phrase belt slip. Returns '' when nothing searchable remains.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', search_term):
+        if phrase:
+            tokens = re.findall(r'\w+', phrase)
+            if tokens:
+                terms.append('"' + ' '.join(tokens) + '"')
+        else:
+            terms.extend(f'"{token}"*' for token in re.findall(r'\w+', word))
+    return ' '.join(terms)
+
+# SQL for the start of the day, week (Monday) or month each rollup row
+# falls in; shift buckets also add the shift's start time
+TREND_BUCKETS = {
+    'day': 'date',
+    'week': "date(date, '-6 days', 'weekday 1')",
+    'month': "substr(date, 1, 7) || '-01'",
+    'shift': 'date',
+}
+
+TREND_SERIES = ['line', 'shift', 'equipment', 'issue_type']
+
+# Columns a new record is inserted with; the rest have defaults
+INSERT_COLUMNS = [
+    'date', 'shift', 'line', 'start_time', 'end_time', 'duration',
+    'equipment', 'issue_type', 'issue_description', 'action_taken',
+    'responsible_person', 'remarks'
+]
 
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('downtime.db', check_same_thread=False)
-        self.create_tables()
+    def __init__(self, db_path='downtime.db', read_only=False):
+        """Open (creating or upgrading) the database at db_path.
+
+        A read_only database is not migrated and cannot be written; its
+        schema must already be current.
+        """
+        self.connections = ConnectionManager(db_path, read_only=read_only)
+        self.cache = get_cache(db_path, read_only=read_only)
+        self.connections.commit_hook = self.cache.own_commit
+        archive_path = archive_path_for(db_path)
+        self.archive = RecordArchive(archive_path) if archive_path else None
+        if read_only:
+            self.check_schema()
+        else:
+            self.create_tables()
+        self.connections.start()
+
+    @property
+    def conn(self):
+        """The calling thread's read connection; writes go through the writer queue"""
+        return self.connections.reader()
 
     def create_tables(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS downtime_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date DATE,
-                shift TEXT,
-                line TEXT,
-                start_time TEXT,
-                end_time TEXT,
-                duration INTEGER,
-                equipment TEXT,
-                issue_type TEXT,
-                issue_description TEXT,
-                action_taken TEXT,
-                responsible_person TEXT,
-                remarks TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        self.conn.commit()
+        """Create or upgrade the schema to the latest migration"""
+        migrate(self.connections.writer_conn)
+
+    def check_schema(self):
+        """Raise RuntimeError unless the schema is at the latest migration"""
+        version = get_schema_version(self.conn)
+        if version != LATEST_VERSION:
+            self.close()
+            raise RuntimeError(f"Database schema version {version} is not the current "
+                               f"{LATEST_VERSION}; open it read-write once to upgrade it")
+
+    def close(self):
+        self.connections.close()
 
+    @traced('db.insert_record', 'db')
     def insert_record(self, data):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO downtime_records 
-            (date, shift, line, start_time, end_time, duration, 
-             equipment, issue_type, issue_description, action_taken, 
-             responsible_person, remarks)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['date'], data['shift'], data['line'], 
-            data['start_time'], data['end_time'], data['duration'],
-            data['equipment'], data['issue_type'], data['issue_description'],
-            data['action_taken'], data['responsible_person'], data['remarks']
-        ))
-        self.conn.commit()
+        values = tuple(data[column] for column in INSERT_COLUMNS)
+
+        def insert(cursor):
+            row, = canonicalize_rows(cursor, [values], INSERT_COLUMNS)
+            cursor.execute(f'''
+                INSERT INTO downtime_records ({', '.join(INSERT_COLUMNS)})
+                VALUES ({', '.join('?' * len(INSERT_COLUMNS))})
+            ''', row)
+            record_added(cursor, cursor.lastrowid)
+            return cursor.lastrowid
+
+        record_id = self.connections.write(insert)
+        self.cache.bump_version()
+        return record_id
+
+    @traced('db.merge_dimension_member', 'db')
+    def merge_dimension_member(self, column, alias, canonical):
+        """Record alias as a spelling of canonical for a dimension column (see dimensions.py).
+
+        Returns the number of records renamed.
+        """
+        if column not in DIMENSION_TABLES:
+            raise ValueError(f"Unknown dimension: {column}")
+        renamed = self.connections.write(lambda cursor: merge_member(cursor, column, alias, canonical))
+        self.cache.bump_version()
+        return renamed
 
     def get_all_records(self):
+        return self.get_records()
+
+    @cached_query
+    @traced('db.get_records', 'db')
+    def get_records(self, **filters):
+        """Get the records matching the given filters, newest first"""
+        where, params = self.build_filters(**filters)
         cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM downtime_records ORDER BY date DESC')
+        cursor.execute(f'''
+            SELECT {', '.join(RECORD_COLUMNS)} FROM downtime_records {where} ORDER BY date DESC
+        ''', params)
         columns = [description[0] for description in cursor.description]
         records = cursor.fetchall()
+
+        segments = self.archive_segments(**filters)
+        if segments:
+            archived = self.archive.read_table(segments, columns, **filters)
+            archived = table_rows(archived.sort_by([('date', 'descending'), ('id', 'descending')]))
+            date_index = columns.index('date')
+            records = list(heapq.merge(records, archived, key=lambda record: record[date_index],
+                                       reverse=True))
         return columns, records
 
-    def delete_record(self, record_id):
+    @cached_query
+    @traced('db.get_snapshot', 'db')
+    def get_snapshot(self, **filters):
+        """Get the filtered records as a typed RecordSnapshot, newest first.
+
+        The free-text columns are not read until the snapshot's text() asks
+        for them.
+        """
+        where, params = self.build_filters(**filters)
+        segments = self.archive_segments(**filters)
+
+        def load_text(columns):
+            cursor = self.conn.cursor()
+            cursor.execute(f'SELECT id, {", ".join(columns)} FROM downtime_records {where}', params)
+            rows = cursor.fetchall()
+            if segments:
+                rows += table_rows(self.archive.read_table(segments, ['id'] + columns, **filters))
+            return pd.DataFrame.from_records(rows, columns=['id'] + columns).set_index('id')
+
         cursor = self.conn.cursor()
-        cursor.execute('DELETE FROM downtime_records WHERE id = ?', (record_id,))
-        self.conn.commit()
+        cursor.execute(f'''
+            SELECT {', '.join(SNAPSHOT_COLUMNS)}
+            FROM downtime_records
+            {where}
+            ORDER BY date DESC, id DESC
+        ''', params)
+        snapshot = RecordSnapshot.from_cursor(cursor, text_loader=load_text)
+        if not segments:
+            return snapshot
+
+        archived = RecordSnapshot.from_frame(
+            self.archive.read_table(segments, SNAPSHOT_COLUMNS, **filters).to_pandas()
+        )
+        frame = concat_frames([snapshot.frame, archived.frame], SNAPSHOT_COLUMNS)
+        frame = frame.sort_values(['date', 'id'], ascending=False, kind='stable', ignore_index=True)
+        return RecordSnapshot(frame, text_loader=load_text)
+
+    @cached_query
+    @traced('db.get_shift_downtimes', 'db')
+    def get_shift_downtimes(self, date, line=None, shift=None):
+        """Get (line, shift, equipment, duration, issue_description) rows for one date.
+
+        Rows come grouped by line and shift, read in one pass over the
+        date's entries in idx_downtime_date_line_shift.
+        """
+        where, params = self.build_filters(line=line, shift=shift)
+        # An equality on date, not a date range, so the index also gives the line and shift order
+        where = 'WHERE date = ?' + (where and ' AND ' + where[len('WHERE '):])
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT line, shift, equipment, duration, issue_description
+            FROM downtime_records
+            {where}
+            ORDER BY line, shift
+        ''', [str(date)] + params)
+        rows = cursor.fetchall()
+
+        segments = self.archive_segments(start_date=date, end_date=date)
+        if segments:
+            rows += table_rows(self.archive.read_table(
+                segments, ['line', 'shift', 'equipment', 'duration', 'issue_description'],
+                start_date=date, end_date=date, line=line, shift=shift
+            ))
+            rows.sort(key=lambda row: (row[0] or '', row[1] or ''))
+        return rows
+
+    @cached_query
+    @traced('db.search_records', 'db')
+    def search_records(self, search_term, limit=100, offset=0, ranked=False):
+        """Full-text search of the records, best matches first.
+
+        ranked adds a rank column, lower for better matches, by which results
+        from several databases can be merged.
+        """
+        query = build_search_query(search_term)
+        cursor = self.conn.cursor()
+        if not query:
+            rank = ', NULL AS rank' if ranked else ''
+            cursor.execute(
+                f'SELECT {", ".join(RECORD_COLUMNS)}{rank} FROM downtime_records LIMIT 0'
+            )
+        else:
+            rank = ', downtime_search.rank' if ranked else ''
+            cursor.execute(f'''
+                SELECT {', '.join(f'r.{column}' for column in RECORD_COLUMNS)}{rank}
+                FROM downtime_search
+                JOIN downtime_records r ON r.id = downtime_search.rowid
+                WHERE downtime_search MATCH ?
+                ORDER BY downtime_search.rank, r.date DESC
+                LIMIT ? OFFSET ?
+            ''', (query, limit, offset))
+        columns = [description[0] for description in cursor.description]
+        records = cursor.fetchall()
+        return columns, records
+
+    @cached_query
+    @traced('db.count_search_results', 'db')
+    def count_search_results(self, search_term):
+        query = build_search_query(search_term)
+        if not query:
+            return 0
+        cursor = self.conn.cursor()
+        cursor.execute(
+            'SELECT COUNT(*) FROM downtime_search WHERE downtime_search MATCH ?', (query,)
+        )
+        return cursor.fetchone()[0]
+
+    @cached_query
+    @traced('db.get_records_page', 'db')
+    def get_records_page(self, columns=None, after=None, page_size=50, **filters):
+        """Get one page of records, newest first, using keyset pagination.
+
+        after is the (date, id) of the last row of the previous page, or None
+        for the first page. Only the requested columns are loaded; date and
+        id are always included so the next page's key can be taken from the
+        last row.
+        """
+        columns = list(columns or RECORD_COLUMNS)
+        for column in columns:
+            if column not in RECORD_COLUMNS:
+                raise ValueError(f"Unknown record column: {column}")
+        for column in ('date', 'id'):
+            if column not in columns:
+                columns.insert(0, column)
+
+        where, params = self.build_filters(**filters)
+        if after is not None:
+            where = f"{where} AND (date, id) < (?, ?)" if where else 'WHERE (date, id) < (?, ?)'
+            params.extend(after)
+
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT {', '.join(columns)}
+            FROM downtime_records
+            {where}
+            ORDER BY date DESC, id DESC
+            LIMIT ?
+        ''', params + [page_size])
+        records = cursor.fetchall()
+
+        # Archived months, newest first, while they can still place a row on
+        # the page: once the page is full, a month ending before its oldest
+        # row has nothing newer to offer
+        archive_filters = dict(filters)
+        if after is not None and (not filters.get('end_date') or after[0] < str(filters['end_date'])):
+            archive_filters['end_date'] = after[0]
+        date_index, id_index = columns.index('date'), columns.index('id')
+        for segment, last_date in self._archive_segment_spans(**archive_filters):
+            if len(records) >= page_size and last_date < (records[-1][date_index] or ''):
+                break
+            table = self.archive.read_table([segment], columns, **archive_filters)
+            rows = table_rows(table.sort_by([('date', 'descending'), ('id', 'descending')]))
+            if after is not None:
+                rows = [row for row in rows if (row[date_index], row[id_index]) < tuple(after)]
+            records = sorted(records + rows[:page_size], key=lambda row: (row[date_index], row[id_index]),
+                             reverse=True)[:page_size]
+        return columns, records
+
+    @cached_query
+    @traced('db.get_intervals', 'db')
+    def get_intervals(self, start=None, end=None, **filters):
+        """Get (line, start, end, equipment, id) of the filtered stops in start order.
+
+        Each stop's start and end are minutes since the epoch (see
+        intervals.py). The start and end arguments ('YYYY-MM-DD HH:MM') keep
+        the stops overlapping that period, found through the
+        downtime_intervals R*Tree.
+        """
+        return [row[:5] for row in self.get_dated_intervals(start, end, **filters)]
 
-    def get_equipment_stats(self):
+    def get_dated_intervals(self, start=None, end=None, **filters):
+        """get_intervals rows with each stop's record date appended, uncached"""
+        where, params = self.build_filters(**filters)
+        clauses = [where[len('WHERE '):]] if where else []
+        if start is not None:
+            clauses.append('i.end_minute > ?')
+            params.append(to_minutes(start))
+        if end is not None:
+            clauses.append('i.start_minute < ?')
+            params.append(to_minutes(end))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT r.line, i.start_minute, i.end_minute, r.equipment, r.id, r.date
+            FROM downtime_intervals i JOIN downtime_records r ON r.id = i.id
+            {where}
+        ''', params)
+        rows = cursor.fetchall()
+
+        # A stop after midnight is dated the day before, so the archive is
+        # read from the day before the period
+        archive_filters = dict(filters)
+        if start is not None:
+            earliest = (datetime.fromisoformat(start) - timedelta(days=1)).date().isoformat()
+            if not filters.get('start_date') or str(filters['start_date']) < earliest:
+                archive_filters['start_date'] = earliest
+        if end is not None:
+            latest = str(end)[:10]
+            if not filters.get('end_date') or str(filters['end_date']) > latest:
+                archive_filters['end_date'] = latest
+        segments = self.archive_segments(**archive_filters)
+        if segments:
+            columns = ['line', 'date', 'shift', 'start_time', 'duration', 'equipment', 'id']
+            table = self.archive.read_table(segments, columns, **archive_filters)
+            low = to_minutes(start) if start is not None else None
+            high = to_minutes(end) if end is not None else None
+            for line, record_date, shift, start_time, duration, equipment, record_id in table_rows(table):
+                interval = event_minutes(record_date, shift, start_time, duration)
+                if interval is None or (low is not None and interval[1] <= low) \
+                        or (high is not None and interval[0] >= high):
+                    continue
+                rows.append((line, interval[0], interval[1], equipment, record_id, record_date))
+        rows.sort(key=lambda row: (row[1], row[4]))
+        return rows
+
+    @cached_query
+    @traced('db.get_line_downtime', 'db')
+    def get_line_downtime(self, **filters):
+        """Minutes the filtered lines were down, with overlapping stops on a line counted once.
+
+        Date and line filters are answered from line_downtime_daily (see
+        merged_downtime.py), refreshed first if records changed; shift,
+        equipment and issue type filters, or stale rows in a read-only
+        database, sweep the filtered stops instead.
+        """
+        if any(filters.get(column) for column in ('shift', 'equipment', 'issue_type')) \
+                or not refresh_line_downtime(self):
+            return line_downtime(self.get_intervals(**filters))
+        return line_downtime_total(self, **{column: filters.get(column)
+                                            for column in ('start_date', 'end_date', 'line')})
+
+    def refresh_line_downtime(self):
+        """Bring line_downtime_daily up to date with the records (see merged_downtime.py)"""
+        return refresh_line_downtime(self)
+
+    @cached_query
+    @traced('db.get_shift_availability', 'db')
+    def get_shift_availability(self, start_date, end_date, line=None):
+        """Availability per line and shift from start_date to end_date (see intervals.shift_availability)"""
+        windows = shift_windows(start_date, end_date)
+        if not windows:
+            return []
+        rows = self.get_intervals(start=from_minutes(windows[0][2]), end=from_minutes(windows[-1][3]),
+                                  line=line)
+        lines = [line] if isinstance(line, str) else line
+        return shift_availability(rows, windows, lines=lines)
+
+    def get_failure_rate_alerts(self, at=None, **thresholds):
+        """Equipment failing abnormally often, from the running statistics (see failure_stats.py)"""
+        # The rates decay with time, so 'now' is fixed to the minute before
+        # the cache key is built, and cached alerts age out minute by minute
+        return self._failure_rate_alerts(from_minutes(to_minutes(at or datetime.now())), **thresholds)
+
+    @cached_query
+    @traced('db.get_failure_rate_alerts', 'db')
+    def _failure_rate_alerts(self, at, **thresholds):
+        return failure_rate_alerts(self.conn, at=at, **thresholds)
+
+    @cached_query
+    @traced('db.get_failure_stats', 'db')
+    def get_failure_stats(self):
+        """Rows of equipment_failure_stats (see failure_stats.read_stats)"""
+        return read_stats(self.conn)
+
+    @cached_query
+    @traced('db.get_maintenance_predictions', 'db')
+    def get_maintenance_predictions(self, equipment=None):
+        """Get the precomputed equipment metrics as a DataFrame, soonest maintenance first"""
+        where, params = self.build_filters(equipment=equipment)
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT {', '.join(METRIC_COLUMNS)}
+            FROM maintenance_predictions
+            {where}
+            ORDER BY recommended_maintenance IS NULL, recommended_maintenance, equipment
+        ''', params)
+        predictions = pd.DataFrame.from_records(cursor.fetchall(), columns=METRIC_COLUMNS)
+        predictions['mtbf_days'] = predictions['mtbf_days'].astype(float)
+        for column in ('next_predicted_failure', 'recommended_maintenance'):
+            predictions[column] = pd.to_datetime(predictions[column])
+        return predictions
+
+    @cached_query
+    @traced('db.get_latest_prediction_run', 'db')
+    def get_latest_prediction_run(self):
+        """Get (version, computed_at, equipment_updated, full_refresh) of the latest prediction run, or None"""
         cursor = self.conn.cursor()
         cursor.execute('''
-            SELECT equipment, 
-                   COUNT(*) as frequency,
-                   SUM(duration) as total_duration
-            FROM downtime_records 
-            GROUP BY equipment
-            ORDER BY total_duration DESC
+            SELECT version, computed_at, equipment_updated, full_refresh
+            FROM prediction_runs
+            ORDER BY version DESC
+            LIMIT 1
         ''')
-        return cursor.fetchall()
+        return cursor.fetchone()
+
+    def archive_segments(self, start_date=None, end_date=None, **filters):
+        """Files of the archived months a query's date range reaches, newest first.
+
+        Empty unless the range starts on or before the last archived date,
+        so queries over recent records never touch the archive.
+        """
+        return [segment for segment, _ in self._archive_segment_spans(start_date, end_date)]
 
-    def get_issue_type_stats(self):
-        """Get statistics for downtime causes (issue types)"""
+    def _archive_segment_spans(self, start_date=None, end_date=None, **filters):
+        """(file, last_date) of the archived months archive_segments returns"""
+        if self.archive is None:
+            return []
         cursor = self.conn.cursor()
         cursor.execute('''
-            SELECT issue_type, 
-                   COUNT(*) as frequency,
-                   SUM(duration) as total_duration
-            FROM downtime_records 
-            GROUP BY issue_type
-            ORDER BY total_duration DESC
-        ''')
-        return cursor.fetchall()
\ No newline at end of file
+            SELECT file, last_date FROM archive_segments
+            WHERE last_date >= IFNULL(?, last_date) AND first_date <= IFNULL(?, first_date)
+            ORDER BY period DESC
+        ''', (str(start_date) if start_date else None, str(end_date) if end_date else None))
+        return cursor.fetchall()
+
+    def delete_record(self, record_id):
+        return self.delete_records([record_id])
+
+    @traced('db.delete_records', 'db')
+    def delete_records(self, record_ids):
+        """Delete several records in a single transaction; returns the number deleted.
+
+        Archived records are read-only and are skipped.
+        """
+        record_ids = [int(record_id) for record_id in record_ids]
+        deleted = self.connections.write(lambda cursor: delete_records(cursor, record_ids))
+        if deleted:
+            self.cache.bump_version()
+        return deleted
+
+    def deletable_record_ids(self, record_ids):
+        """Return the ids among record_ids that are not archived and so can be deleted"""
+        record_ids = [int(record_id) for record_id in record_ids]
+        if not record_ids:
+            return set()
+        cursor = self.conn.execute(
+            f'SELECT id FROM downtime_records WHERE id IN ({", ".join("?" * len(record_ids))})',
+            record_ids
+        )
+        return {row[0] for row in cursor}
+
+    @property
+    def data_version(self):
+        return self.cache.version
+
+    def get_derived(self, name, compute, **key_args):
+        """Get a value derived from the records, cached until the next write.
+
+        key_args (typically the active filters) distinguish results of the
+        same computation; compute is only called on a cache miss.
+        """
+        return self.cache.get_or_compute(make_key(name, **key_args), compute)
+
+    def build_filters(self, start_date=None, end_date=None, line=None,
+                      shift=None, equipment=None, issue_type=None, keyed=False):
+        """Build a WHERE clause and its parameters from optional record filters.
+
+        Dates are inclusive 'YYYY-MM-DD' bounds. Line, shift, equipment and
+        issue type accept a single value or a list of values. keyed filters
+        the member id columns of downtime_rollup instead of the names.
+        """
+        clauses = []
+        params = []
+
+        if start_date:
+            clauses.append('date >= ?')
+            params.append(str(start_date))
+        if end_date:
+            clauses.append('date <= ?')
+            params.append(str(end_date))
+
+        for column, value in (('line', line), ('shift', shift),
+                              ('equipment', equipment), ('issue_type', issue_type)):
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                values = list(value)
+                if not values:
+                    continue
+                condition = f"IN ({', '.join('?' * len(values))})"
+                params.extend(values)
+            else:
+                condition = '= ?'
+                params.append(value)
+            if keyed:
+                clauses.append(f'{column}_id IN (SELECT id FROM {DIMENSION_TABLES[column]} '
+                               f'WHERE name {condition})')
+            else:
+                clauses.append(f'{column} {condition}')
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        return where, params
+
+    @cached_query
+    @traced('db.get_downtime_totals', 'db')
+    def get_downtime_totals(self, **filters):
+        """Get total, average and count of downtime for the filtered records (from the rollups)"""
+        where, params = self.build_filters(keyed=True, **filters)
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT COALESCE(SUM(total_duration), 0) as total_duration,
+                   CAST(SUM(total_duration) AS REAL) / SUM(incidents) as avg_duration,
+                   COALESCE(SUM(incidents), 0) as num_incidents
+            FROM downtime_rollup
+            {where}
+        ''', params)
+        return cursor.fetchone()
+
+    @cached_query
+    @traced('db.get_daily_downtime', 'db')
+    def get_daily_downtime(self, **filters):
+        """Get total downtime and incident count per day for the filtered records (from the rollups)"""
+        where, params = self.build_filters(keyed=True, **filters)
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT date,
+                   SUM(total_duration) as total_duration,
+                   SUM(incidents) as frequency
+            FROM downtime_rollup
+            {where}
+            GROUP BY date
+            ORDER BY date
+        ''', params)
+        return cursor.fetchall()
+
+    @cached_query
+    @traced('db.get_downtime_series', 'db')
+    def get_downtime_series(self, granularity='day', series=None, **filters):
+        """Get (bucket, series, total_duration, incidents) rows for a downtime trend (from the rollups).
+
+        Buckets are 'YYYY-MM-DD' days, weeks starting on Monday or months
+        starting on the 1st; shift buckets are 'YYYY-MM-DD HH:MM' shift
+        starts. series is None for a single series, or one of TREND_SERIES
+        to split the trend by that column.
+        """
+        if granularity not in TREND_BUCKETS:
+            raise ValueError(f"Unknown trend granularity: {granularity}")
+        if series is not None and series not in TREND_SERIES:
+            raise ValueError(f"Unknown trend series: {series}")
+
+        bucket = TREND_BUCKETS[granularity]
+        bucket_params = []
+        if granularity == 'shift':
+            start_times = get_shift_start_times()
+            cases = ' '.join('WHEN ? THEN ?' for _ in start_times)
+            bucket = f"date || ' ' || CASE (SELECT name FROM dim_shift WHERE id = shift_id) {cases} ELSE '00:00' END"
+            for shift, start_time in start_times.items():
+                bucket_params.extend([shift, start_time])
+
+        series_name = f'(SELECT name FROM {DIMENSION_TABLES[series]} WHERE id = {series}_id)' if series else 'NULL'
+        where, params = self.build_filters(keyed=True, **filters)
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT {bucket} AS bucket,
+                   {series_name} AS series,
+                   SUM(total_duration) AS total_duration,
+                   SUM(incidents) AS incidents
+            FROM downtime_rollup
+            {where}
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        ''', bucket_params + params)
+        return cursor.fetchall()
+
+    def _pareto_stats(self, column, top_n, filters):
+        # (name, incidents, total_duration) per member, largest duration
+        # first; with top_n, the members after the first top_n are summed
+        # into a REST_LABEL row that comes last
+        where, params = self.build_filters(keyed=True, **filters)
+        grouped = f'''
+            SELECT {column}_id AS member_id,
+                   SUM(incidents) AS frequency,
+                   SUM(total_duration) AS total_duration
+            FROM downtime_rollup
+            {where}
+            GROUP BY {column}_id
+        '''
+        cursor = self.conn.cursor()
+        if top_n is None:
+            cursor.execute(f'''
+                SELECT d.name, g.frequency, g.total_duration
+                FROM ({grouped}) g JOIN {DIMENSION_TABLES[column]} d ON d.id = g.member_id
+                ORDER BY g.total_duration DESC
+            ''', params)
+            return cursor.fetchall()
+
+        cursor.execute(f'''
+            WITH ranked AS (
+                SELECT member_id, frequency, total_duration,
+                       MIN(ROW_NUMBER() OVER (ORDER BY total_duration DESC, member_id), ? + 1) AS position
+                FROM ({grouped})
+            )
+            SELECT CASE WHEN position <= ? THEN MIN(d.name) ELSE ? END,
+                   SUM(r.frequency), SUM(r.total_duration)
+            FROM ranked r JOIN {DIMENSION_TABLES[column]} d ON d.id = r.member_id
+            GROUP BY position
+            ORDER BY position
+        ''', [top_n] + params + [top_n, REST_LABEL])
+        return cursor.fetchall()
+
+    @cached_query
+    @traced('db.get_equipment_stats', 'db')
+    def get_equipment_stats(self, top_n=None, **filters):
+        """Get incidents and downtime per equipment, optionally the top_n plus a REST_LABEL row"""
+        return self._pareto_stats('equipment', top_n, filters)
+
+    @cached_query
+    @traced('db.get_issue_type_stats', 'db')
+    def get_issue_type_stats(self, top_n=None, **filters):
+        """Get statistics for downtime causes (issue types), optionally the top_n plus a REST_LABEL row"""
+        return self._pareto_stats('issue_type', top_n, filters)
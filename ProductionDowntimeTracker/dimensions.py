@@ -0,0 +1,261 @@
+import json
+import re
+import sys
+from failure_stats import rebuild_stats
+from utils import get_equipment_options, get_issue_type_options, get_line_options, get_shift_options
+
+# Lines, shifts, equipment and issue types are interned in dimension
+# tables (dim_line, dim_shift, dim_equipment, dim_issue_type, created in
+# migration 9) with integer ids, which key downtime_rollup. Every spelling
+# seen is reduced to an alias key and mapped to one member in
+# dimension_aliases, so 'conveyor', 'Conveyor.' and ' CONVEYOR' are all
+# stored as 'Conveyor'. New free-text values become new members; an alias
+# added later merges one member into another. The records themselves keep
+# the canonical names, as full-text search, the archive segments, exports
+# and every record reader work with names.
+
+DIMENSION_COLUMNS = ['line', 'shift', 'equipment', 'issue_type']
+
+DIMENSION_TABLES = {column: f'dim_{column}' for column in DIMENSION_COLUMNS}
+
+# Label of the bucket summing everything after the top N of a Pareto
+REST_LABEL = 'All others'
+
+PARETO_TOP_N = 10
+
+# trigger_guards row (migration 12) that turns off trg_downtime_rollup_update
+ROLLUP_TRIGGER_GUARD = 'downtime_rollup'
+
+NON_ALPHANUMERIC = re.compile(r'[\W_]+')
+
+
+def configured_members(column):
+    """The standard options of a dimension, whose spelling always wins"""
+    options = {
+        'line': get_line_options(),
+        'shift': get_shift_options(),
+        'equipment': get_equipment_options(),
+        'issue_type': get_issue_type_options(),
+    }[column]
+    return [name for name in options if name != 'Other']
+
+
+def alias_key(value):
+    """Case-folded value with punctuation and repeated whitespace reduced to single spaces"""
+    key = ' '.join(NON_ALPHANUMERIC.sub(' ', str(value).casefold()).split())
+    # A value of punctuation only keeps it rather than joining the '' member
+    return key or display_name(value).casefold()
+
+
+def display_name(value):
+    """Spelling a new member is stored under: the value with whitespace collapsed"""
+    return ' '.join(str(value).split())
+
+
+def _member_id(cursor, column, name):
+    table = DIMENSION_TABLES[column]
+    cursor.execute(f'INSERT OR IGNORE INTO {table} (name) VALUES (?)', (name,))
+    return cursor.execute(f'SELECT id FROM {table} WHERE name = ?', (name,)).fetchone()[0]
+
+
+def _known_members(cursor, column, keys):
+    """{alias key: canonical name} of the given alias keys that have a member"""
+    return dict(cursor.execute(f'''
+        SELECT a.alias_key, m.name
+        FROM dimension_aliases a JOIN {DIMENSION_TABLES[column]} m ON m.id = a.member_id
+        WHERE a.dimension = ? AND a.alias_key IN (SELECT value FROM json_each(?))
+    ''', (column, json.dumps(sorted(set(keys))))).fetchall())
+
+
+def lookup_names(cursor, column, names):
+    """Map each name to its member's canonical name, or None for unknown spellings; never writes"""
+    keys = {name: alias_key(name) for name in names}
+    known = _known_members(cursor, column, keys.values()) if keys else {}
+    return {name: known.get(key) for name, key in keys.items()}
+
+
+def intern_names(cursor, column, names):
+    """Map each name to its member's canonical name, adding members for unknown spellings"""
+    keys = {name: alias_key(name) for name in names}
+    if not keys:
+        return {}
+    known = _known_members(cursor, column, keys.values())
+
+    for name, key in keys.items():
+        if key in known:
+            continue
+        canonical = display_name(name)
+        cursor.execute('''
+            INSERT OR IGNORE INTO dimension_aliases (dimension, alias_key, member_id)
+            VALUES (?, ?, ?)
+        ''', (column, key, _member_id(cursor, column, canonical)))
+        known[key] = canonical
+    return {name: known[key] for name, key in keys.items()}
+
+
+def canonicalize_rows(cursor, rows, columns):
+    """Rewrite the dimension values of row tuples (in columns order) to canonical names.
+
+    Run inside the write transaction that inserts the rows, so the members
+    and aliases it adds commit with them. NULLs are left alone.
+    """
+    positions = [(column, columns.index(column)) for column in DIMENSION_COLUMNS if column in columns]
+    if not rows or not positions:
+        return rows
+    rows = [list(row) for row in rows]
+    for column, index in positions:
+        names = intern_names(cursor, column, {row[index] for row in rows if row[index] is not None})
+        for row in rows:
+            if row[index] is not None:
+                row[index] = names[row[index]]
+    return [tuple(row) for row in rows]
+
+
+def fold_spelling_variants(cursor, rollup_table):
+    """Intern the names already recorded and rewrite variant spellings in downtime_records.
+
+    Configured options are interned first, then names in descending order
+    of incidents in rollup_table (a name-keyed rollup, which also counts
+    archived records), so the most used spelling of a group of variants
+    becomes the member. Returns {column: {name: member id}} for every name
+    in the rollup, including the '' used for NULL.
+    """
+    members = {}
+    for column in DIMENSION_COLUMNS:
+        recorded = [row[0] for row in cursor.execute(f'''
+            SELECT {column} FROM {rollup_table} GROUP BY 1 ORDER BY SUM(incidents) DESC, 1
+        ''')]
+        names = {}
+        for name in [''] + configured_members(column) + recorded:
+            names.update(intern_names(cursor, column, [name]))
+        for name, canonical in names.items():
+            if name != canonical:
+                cursor.execute(f'UPDATE downtime_records SET {column} = ? WHERE {column} = ?',
+                               (canonical, name))
+        ids = dict(cursor.execute(f'SELECT name, id FROM {DIMENSION_TABLES[column]}').fetchall())
+        members[column] = {name: ids[canonical] for name, canonical in names.items()}
+    return members
+
+
+def list_members(conn, column):
+    """(id, name, aliases, incidents) of every member of a dimension, most incidents first"""
+    table = DIMENSION_TABLES[column]
+    return conn.execute(f'''
+        SELECT m.id, m.name,
+               (SELECT COUNT(*) FROM dimension_aliases a
+                WHERE a.dimension = ? AND a.member_id = m.id) AS aliases,
+               (SELECT IFNULL(SUM(incidents), 0) FROM downtime_rollup r
+                WHERE r.{column}_id = m.id) AS incidents
+        FROM {table} m
+        WHERE m.name != ''
+        ORDER BY incidents DESC, m.name
+    ''', (column,)).fetchall()
+
+
+def merge_member(cursor, column, alias, canonical):
+    """Make alias a spelling of canonical, merging alias's member into it.
+
+    Hot records are renamed and rollup rows, including those of archived
+    records, move to the canonical member. Archived records keep the
+    spelling they were archived with. Returns the number of records renamed.
+    """
+    table = DIMENSION_TABLES[column]
+    target = _member_id(cursor, column, intern_names(cursor, column, [canonical])[canonical])
+    row = cursor.execute(f'''
+        SELECT m.id, m.name FROM dimension_aliases a JOIN {table} m ON m.id = a.member_id
+        WHERE a.dimension = ? AND a.alias_key = ?
+    ''', (column, alias_key(alias))).fetchone()
+    if row is None:
+        cursor.execute('''
+            INSERT INTO dimension_aliases (dimension, alias_key, member_id) VALUES (?, ?, ?)
+        ''', (column, alias_key(alias), target))
+        return 0
+    source, source_name = row
+    if source == target:
+        return 0
+
+    # The rollup rows are moved wholesale below, so the rollup trigger must
+    # not also move the renamed records; the guard row never commits
+    target_name = cursor.execute(f'SELECT name FROM {table} WHERE id = ?', (target,)).fetchone()[0]
+    cursor.execute('INSERT INTO trigger_guards (name) VALUES (?)', (ROLLUP_TRIGGER_GUARD,))
+    try:
+        cursor.execute(f'UPDATE downtime_records SET {column} = ? WHERE {column} = ?',
+                       (target_name, source_name))
+        renamed = cursor.rowcount
+    finally:
+        cursor.execute('DELETE FROM trigger_guards WHERE name = ?', (ROLLUP_TRIGGER_GUARD,))
+
+    keys = ['date', 'line_id', 'shift_id', 'equipment_id', 'issue_type_id']
+    moved = [f'? AS {key}' if key == f'{column}_id' else key for key in keys]
+    cursor.execute(f'''
+        INSERT INTO downtime_rollup ({', '.join(keys)}, incidents, total_duration)
+        SELECT {', '.join(moved)}, incidents, total_duration
+        FROM downtime_rollup WHERE {column}_id = ?
+        ON CONFLICT ({', '.join(keys)}) DO UPDATE SET
+            incidents = incidents + excluded.incidents,
+            total_duration = total_duration + excluded.total_duration
+    ''', (target, source))
+    cursor.execute(f'DELETE FROM downtime_rollup WHERE {column}_id = ?', (source,))
+    cursor.execute('UPDATE dimension_aliases SET member_id = ? WHERE dimension = ? AND member_id = ?',
+                   (target, column, source))
+    cursor.execute(f'DELETE FROM {table} WHERE id = ?', (source,))
+    if column == 'equipment':
+        rebuild_stats(cursor, [source_name, target_name])
+    return renamed
+
+
+def fold_top_n(rows, top_n):
+    """Keep the first top_n of (name, frequency, total_duration) rows sorted by
+    duration and sum the rest into one REST_LABEL row, like the SQL Pareto queries"""
+    rows = sorted(rows, key=lambda row: row[2], reverse=True)
+    if top_n is None or len(rows) <= top_n:
+        return rows
+    rest = rows[top_n:]
+    return rows[:top_n] + [(REST_LABEL, sum(row[1] for row in rest), sum(row[2] for row in rest))]
+
+
+def main(argv=None):
+    """List the members of a dimension or add an alias.
+
+    Usage: python dimensions.py [--db downtime.db] list equipment
+           python dimensions.py [--db downtime.db] alias equipment "Convyor" Conveyor
+
+    --db also takes a partitions directory; its members are listed by name,
+    as each partition numbers them separately.
+    """
+    # database imports this module, so it is only imported when run as a script
+    from partitions import PartitionedDatabase, open_database
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    db_path = 'downtime.db'
+    if argv[:1] == ['--db'] and len(argv) >= 2:
+        db_path, argv = argv[1], argv[2:]
+    if len(argv) < 2 or argv[0] not in ('list', 'alias') or argv[1] not in DIMENSION_COLUMNS \
+            or (argv[0] == 'alias' and len(argv) != 4):
+        print(main.__doc__)
+        return 2
+
+    db = open_database(db_path)
+    try:
+        if argv[0] == 'list' and isinstance(db, PartitionedDatabase):
+            members = {}
+            for _, _, partition in db.each_partition():
+                for _, name, aliases, incidents in list_members(partition.conn, argv[1]):
+                    previous_aliases, previous_incidents = members.get(name, (0, 0))
+                    members[name] = (max(previous_aliases, aliases), previous_incidents + incidents)
+            # Most incidents first, as list_members orders them
+            for name, (aliases, incidents) in sorted(members.items(),
+                                                     key=lambda item: (-item[1][1], item[0])):
+                print(f"{'':>6}  {name:<40} {aliases:>3} spellings {incidents:>8} incidents")
+        elif argv[0] == 'list':
+            for member_id, name, aliases, incidents in list_members(db.conn, argv[1]):
+                print(f"{member_id:>6}  {name:<40} {aliases:>3} spellings {incidents:>8} incidents")
+        else:
+            renamed = db.merge_dimension_member(argv[1], argv[2], argv[3])
+            print(f"'{argv[2]}' is now spelled '{argv[3]}'; {renamed} records renamed")
+    finally:
+        db.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
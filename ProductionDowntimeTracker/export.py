@@ -0,0 +1,251 @@
+import argparse
+import contextlib
+import csv
+import heapq
+import io
+import itertools
+import sys
+from database import RECORD_COLUMNS
+from partitions import PartitionedDatabase, open_database
+
+# Records are read through a single cursor with fetchmany, so at most one
+# chunk of rows is held in memory whatever the size of the table. Archived
+# records are read one month's segment at a time. Partitioned records (see
+# partitions.py) are read a period at a time, with a leading plant column.
+
+DEFAULT_CHUNK_SIZE = 10000
+
+EXPORT_FORMATS = ['csv', 'parquet', 'arrow']
+
+# The app hands the finished file to st.download_button, which reads it all
+# into memory for the browser session, so downloads from the app are capped.
+# Larger exports go through the command line below, which writes to disk.
+MAX_DOWNLOAD_ROWS = 250000
+
+
+def export_columns(db, columns=None):
+    """The columns to export from db, checked; every record column by default"""
+    partitioned = isinstance(db, PartitionedDatabase)
+    if not columns:
+        return (['plant'] if partitioned else []) + RECORD_COLUMNS
+    columns = list(columns)
+    for column in columns:
+        if column not in RECORD_COLUMNS and not (partitioned and column == 'plant'):
+            raise ValueError(f"Unknown record column: {column}")
+    return columns
+
+
+def iter_record_chunks(db, chunk_size=DEFAULT_CHUNK_SIZE, columns=None, **filters):
+    """Yield lists of record tuples, oldest first, chunk_size rows at a time"""
+    columns = export_columns(db, columns)
+    if isinstance(db, PartitionedDatabase):
+        yield from _iter_partitioned_chunks(db, chunk_size, columns, **filters)
+        return
+
+    where, params = db.build_filters(**filters)
+    segments = db.archive_segments(**filters)
+    # Archived rows are merged in by (date, id), so both sources are read
+    # with those two columns first
+    read_columns = columns
+    if segments:
+        read_columns = ['date', 'id'] + [column for column in columns if column not in ('date', 'id')]
+    # A separate cursor keeps the export independent of other queries
+    cursor = db.conn.cursor()
+    cursor.execute(f'''
+        SELECT {', '.join(read_columns)}
+        FROM downtime_records
+        {where}
+        ORDER BY date, id
+    ''', params)
+    try:
+        if not segments:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+            return
+
+        archived = db.archive.iter_rows(list(reversed(segments)), read_columns, **filters)
+        merged = heapq.merge(archived, cursor, key=lambda row: (row[0] or '', row[1]))
+        positions = [read_columns.index(column) for column in columns]
+        while True:
+            rows = [tuple(row[index] for index in positions)
+                    for row in itertools.islice(merged, chunk_size)]
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def _with_plant(plant, chunks):
+    for rows in chunks:
+        for row in rows:
+            yield (plant,) + tuple(row)
+
+
+def _iter_partitioned_chunks(partitioned, chunk_size, columns, plant=None, **filters):
+    """iter_record_chunks of a PartitionedDatabase, whose columns may include plant.
+
+    The plants' partitions of a period are read together, merged by date,
+    so a chunk never spans two periods.
+    """
+    read_columns = ['date'] + [column for column in columns if column not in ('plant', 'date')]
+    positions = [0 if column == 'plant' else 1 + read_columns.index(column) for column in columns]
+    for period, plants in partitioned.select_periods(plant, filters.get('start_date'),
+                                                     filters.get('end_date')):
+        with contextlib.ExitStack() as stack:
+            streams = []
+            for partition_plant in plants:
+                db = stack.enter_context(partitioned.partition(partition_plant, period))
+                chunks = iter_record_chunks(db, chunk_size, read_columns, **filters)
+                streams.append(_with_plant(partition_plant, chunks))
+            merged = heapq.merge(*streams, key=lambda row: row[1] or '')
+            while True:
+                rows = [tuple(row[index] for index in positions)
+                        for row in itertools.islice(merged, chunk_size)]
+                if not rows:
+                    break
+                yield rows
+
+
+def iter_csv(db, chunk_size=DEFAULT_CHUNK_SIZE, columns=None, **filters):
+    """Yield CSV text one chunk at a time, starting with the header row"""
+    columns = export_columns(db, columns)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in iter_record_chunks(db, chunk_size, columns, **filters):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def write_csv(db, out, chunk_size=DEFAULT_CHUNK_SIZE, columns=None, **filters):
+    """Write records as CSV to a text file object; returns the row count"""
+    count = 0
+    columns = export_columns(db, columns)
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    for rows in iter_record_chunks(db, chunk_size, columns, **filters):
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("Parquet and Arrow export require pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def _arrow_schema(pa, columns):
+    types = {
+        'id': pa.int64(),
+        'date': pa.date32(),
+        'duration': pa.int64(),
+    }
+    return pa.schema([(column, types.get(column, pa.string())) for column in columns])
+
+
+def _arrow_batches(db, chunk_size, columns, **filters):
+    pa = _import_pyarrow()
+    schema = _arrow_schema(pa, columns)
+    for rows in iter_record_chunks(db, chunk_size, columns, **filters):
+        arrays = []
+        for index, field in enumerate(schema):
+            values = [row[index] for row in rows]
+            if pa.types.is_date32(field.type):
+                arrays.append(pa.array(values, type=pa.string()).cast(field.type))
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_parquet(db, path, chunk_size=DEFAULT_CHUNK_SIZE, columns=None,
+                  compression='zstd', **filters):
+    """Write records to a Parquet file, one row group per chunk; returns the row count"""
+    pa = _import_pyarrow()
+    import pyarrow.parquet as pq
+
+    columns = export_columns(db, columns)
+    count = 0
+    with pq.ParquetWriter(path, _arrow_schema(pa, columns), compression=compression) as writer:
+        for batch in _arrow_batches(db, chunk_size, columns, **filters):
+            writer.write_batch(batch)
+            count += batch.num_rows
+    return count
+
+
+def write_arrow(db, path, chunk_size=DEFAULT_CHUNK_SIZE, columns=None, **filters):
+    """Write records to an Arrow IPC (Feather v2) file; returns the row count"""
+    pa = _import_pyarrow()
+
+    columns = export_columns(db, columns)
+    count = 0
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, _arrow_schema(pa, columns)) as writer:
+            for batch in _arrow_batches(db, chunk_size, columns, **filters):
+                writer.write_batch(batch)
+                count += batch.num_rows
+    return count
+
+
+def check_download_size(db, **filters):
+    """Return the number of records the filters select, raising ValueError above MAX_DOWNLOAD_ROWS"""
+    _, _, count = db.get_downtime_totals(**filters)
+    if count > MAX_DOWNLOAD_ROWS:
+        raise ValueError(
+            f"{count:,} records selected; downloads are limited to {MAX_DOWNLOAD_ROWS:,}. "
+            "Narrow the date range or lines, or use `python export.py` for a full export."
+        )
+    return count
+
+
+def export_records(db, path, export_format='csv', chunk_size=DEFAULT_CHUNK_SIZE,
+                   columns=None, **filters):
+    """Export the filtered records to path in the given format; returns the row count"""
+    if export_format == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as out:
+            return write_csv(db, out, chunk_size, columns, **filters)
+    if export_format == 'parquet':
+        return write_parquet(db, path, chunk_size, columns, **filters)
+    if export_format == 'arrow':
+        return write_arrow(db, path, chunk_size, columns, **filters)
+    raise ValueError(f"Unknown export format: {export_format}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export downtime records")
+    parser.add_argument('out', help="output file")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--db', default='downtime.db',
+                        help="database file or partitions directory (default: downtime.db)")
+    parser.add_argument('--start-date', help="first date to include (YYYY-MM-DD)")
+    parser.add_argument('--end-date', help="last date to include (YYYY-MM-DD)")
+    parser.add_argument('--line', action='append', help="production line, repeatable")
+    parser.add_argument('--equipment', action='append', help="equipment, repeatable")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    db = open_database(args.db)
+    try:
+        count = export_records(
+            db, args.out, args.format, args.chunk_size,
+            start_date=args.start_date, end_date=args.end_date,
+            line=args.line, equipment=args.equipment
+        )
+    finally:
+        db.close()
+    print(f"Exported {count} records to {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,335 @@
+import argparse
+import math
+import sys
+from datetime import datetime
+from intervals import to_minutes
+
+# Running failure statistics per equipment in equipment_failure_stats
+# (migration 11), kept current by the write paths rather than recomputed
+# from the history. Every record with a start time is a failure; the
+# table holds Welford running counts, means and sums of squared deviations
+# (m2) of the downtime duration and of the time between consecutive
+# failures, and an exponentially weighted failure rate.
+#
+# A record inserted or deleted between two others splits or joins a gap,
+# found through idx_downtime_equipment_started, so either takes a fixed
+# number of updates whatever order the records arrive in. The weighted
+# rate is a sum of exp(-age / RATE_TIME_CONSTANT_DAYS) terms, one per
+# failure, held at the time rate_at; a term can be added or taken away
+# exactly as well.
+
+MINUTES_PER_DAY = 1440
+
+RATE_TIME_CONSTANT_DAYS = 7
+
+# A failure rate alert needs this much history and this many recent
+# failures, and a weighted rate this many times the long-run rate
+MIN_FAILURES = 5
+MIN_RECENT_FAILURES = 3
+ALERT_RATIO = 2.0
+
+STATS_COLUMNS = [
+    'equipment', 'failures', 'duration_mean', 'duration_m2',
+    'gap_mean', 'gap_m2', 'rate', 'rate_at'
+]
+
+TAU = RATE_TIME_CONSTANT_DAYS * MINUTES_PER_DAY
+
+
+def welford_add(count, mean, m2, value):
+    """(count, mean, m2) with value added"""
+    count += 1
+    delta = value - mean
+    mean += delta / count
+    return count, mean, m2 + delta * (value - mean)
+
+
+def welford_remove(count, mean, m2, value):
+    """(count, mean, m2) with a previously added value taken away"""
+    if count <= 1:
+        return 0, 0.0, 0.0
+    new_mean = (count * mean - value) / (count - 1)
+    return count - 1, new_mean, max(m2 - (value - new_mean) * (value - mean), 0.0)
+
+
+def welford_merge(first, second):
+    """(count, mean, m2) of the values of two (count, mean, m2) summaries together"""
+    count_a, mean_a, m2_a = first
+    count_b, mean_b, m2_b = second
+    count = count_a + count_b
+    if not count:
+        return 0, 0.0, 0.0
+    delta = mean_b - mean_a
+    mean = mean_a + delta * count_b / count
+    return count, mean, m2_a + m2_b + delta * delta * count_a * count_b / count
+
+
+class _Stats:
+    """One equipment's row of equipment_failure_stats"""
+
+    def __init__(self, equipment, failures=0, duration_mean=0.0, duration_m2=0.0,
+                 gap_mean=0.0, gap_m2=0.0, rate=0.0, rate_at=None):
+        self.equipment = equipment
+        self.failures = failures
+        self.duration = (failures, duration_mean, duration_m2)
+        self.gaps = (max(failures - 1, 0), gap_mean, gap_m2)
+        self.rate = rate
+        self.rate_at = rate_at
+
+    @classmethod
+    def load(cls, cursor, equipment):
+        row = cursor.execute(f'''
+            SELECT {', '.join(STATS_COLUMNS)} FROM equipment_failure_stats WHERE equipment = ?
+        ''', (equipment,)).fetchone()
+        return cls(*row) if row else cls(equipment)
+
+    def add_gap(self, gap):
+        self.gaps = welford_add(*self.gaps, gap)
+
+    def remove_gap(self, gap):
+        self.gaps = welford_remove(*self.gaps, gap)
+
+    def add_failure(self, start, duration):
+        self.failures += 1
+        self.duration = welford_add(*self.duration, duration or 0)
+        if self.rate_at is None or start > self.rate_at:
+            self.rate = (self.rate * math.exp(-(start - self.rate_at) / TAU)
+                         if self.rate_at is not None else 0.0) + 1 / TAU
+            self.rate_at = start
+        else:
+            self.rate += math.exp(-(self.rate_at - start) / TAU) / TAU
+
+    def remove_failure(self, start, duration):
+        self.failures -= 1
+        self.duration = welford_remove(*self.duration, duration or 0)
+        if self.failures <= 0:
+            self.rate, self.rate_at = 0.0, None
+        else:
+            self.rate = max(self.rate - math.exp(-(self.rate_at - start) / TAU) / TAU, 0.0)
+
+    def merge(self, other):
+        """Fold in the same equipment's statistics from another database's records.
+
+        The gap between a failure in one database and the next in the other
+        is not known to either, so it is left out of the gap statistics.
+        """
+        self.failures += other.failures
+        self.duration = welford_merge(self.duration, other.duration)
+        self.gaps = welford_merge(self.gaps, other.gaps)
+        if other.rate_at is None:
+            return
+        if self.rate_at is None:
+            self.rate, self.rate_at = other.rate, other.rate_at
+            return
+        rate_at = max(self.rate_at, other.rate_at)
+        self.rate = (self.rate * math.exp(-(rate_at - self.rate_at) / TAU)
+                     + other.rate * math.exp(-(rate_at - other.rate_at) / TAU))
+        self.rate_at = rate_at
+
+    def save(self, cursor):
+        if self.failures <= 0:
+            cursor.execute('DELETE FROM equipment_failure_stats WHERE equipment = ?', (self.equipment,))
+            return
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO equipment_failure_stats ({', '.join(STATS_COLUMNS)})
+            VALUES ({', '.join('?' * len(STATS_COLUMNS))})
+        ''', (self.equipment, self.failures, self.duration[1], self.duration[2],
+              self.gaps[1], self.gaps[2], self.rate, self.rate_at))
+
+
+def _neighbours(cursor, equipment, started_at, record_id):
+    """Start minutes of the failures just before and after (started_at, record_id), or None"""
+    previous = cursor.execute('''
+        SELECT started_at FROM downtime_records
+        WHERE equipment = ? AND (started_at, id) < (?, ?)
+        ORDER BY started_at DESC, id DESC LIMIT 1
+    ''', (equipment, started_at, record_id)).fetchone()
+    following = cursor.execute('''
+        SELECT started_at FROM downtime_records
+        WHERE equipment = ? AND (started_at, id) > (?, ?)
+        ORDER BY started_at, id LIMIT 1
+    ''', (equipment, started_at, record_id)).fetchone()
+    return (to_minutes(previous[0]) if previous else None,
+            to_minutes(following[0]) if following else None)
+
+
+def record_added(cursor, record_id):
+    """Count an inserted record in its equipment's statistics"""
+    row = cursor.execute(
+        'SELECT equipment, started_at, duration FROM downtime_records WHERE id = ?', (record_id,)
+    ).fetchone()
+    if row is None or row[0] is None or row[1] is None:
+        return
+    equipment, started_at, duration = row
+    start = to_minutes(started_at)
+    previous, following = _neighbours(cursor, equipment, started_at, record_id)
+
+    stats = _Stats.load(cursor, equipment)
+    if previous is not None and following is not None:
+        stats.remove_gap(following - previous)
+    if previous is not None:
+        stats.add_gap(start - previous)
+    if following is not None:
+        stats.add_gap(following - start)
+    stats.add_failure(start, duration)
+    stats.save(cursor)
+
+
+def delete_records(cursor, record_ids):
+    """Delete records one at a time, taking each out of its equipment's statistics.
+
+    Returns the number of records deleted.
+    """
+    deleted = 0
+    for record_id in record_ids:
+        row = cursor.execute(
+            'SELECT equipment, started_at, duration FROM downtime_records WHERE id = ?', (record_id,)
+        ).fetchone()
+        if row is None:
+            continue
+        cursor.execute('DELETE FROM downtime_records WHERE id = ?', (record_id,))
+        deleted += 1
+        equipment, started_at, duration = row
+        if equipment is None or started_at is None:
+            continue
+
+        start = to_minutes(started_at)
+        previous, following = _neighbours(cursor, equipment, started_at, record_id)
+        stats = _Stats.load(cursor, equipment)
+        if previous is not None:
+            stats.remove_gap(start - previous)
+        if following is not None:
+            stats.remove_gap(following - start)
+        if previous is not None and following is not None:
+            stats.add_gap(following - previous)
+        stats.remove_failure(start, duration)
+        stats.save(cursor)
+    return deleted
+
+
+def rebuild_stats(cursor, equipment=None):
+    """Recompute the statistics of the given equipment names (all by default) from their records"""
+    if equipment is None:
+        cursor.execute('DELETE FROM equipment_failure_stats')
+        where, params = 'WHERE equipment IS NOT NULL', []
+    else:
+        names = [name for name in equipment if name is not None]
+        if not names:
+            return
+        placeholders = ', '.join('?' * len(names))
+        cursor.execute(f'DELETE FROM equipment_failure_stats WHERE equipment IN ({placeholders})', names)
+        where, params = f'WHERE equipment IN ({placeholders})', names
+
+    rows = cursor.execute(f'''
+        SELECT equipment, started_at, duration FROM downtime_records
+        {where} AND started_at IS NOT NULL
+        ORDER BY equipment, started_at, id
+    ''', params).fetchall()
+    stats = None
+    previous = None
+    for name, started_at, duration in rows:
+        if stats is None or stats.equipment != name:
+            if stats is not None:
+                stats.save(cursor)
+            stats, previous = _Stats(name), None
+        start = to_minutes(started_at)
+        if previous is not None:
+            stats.add_gap(start - previous)
+        stats.add_failure(start, duration)
+        previous = start
+    if stats is not None:
+        stats.save(cursor)
+
+
+def read_stats(conn):
+    """Rows of equipment_failure_stats in STATS_COLUMNS order"""
+    return conn.execute(
+        f'SELECT {", ".join(STATS_COLUMNS)} FROM equipment_failure_stats'
+    ).fetchall()
+
+
+def merge_stats(partials):
+    """Combine the read_stats rows of databases holding different records of the same equipment"""
+    merged = {}
+    for rows in partials:
+        for row in rows:
+            stats = _Stats(*row)
+            if stats.equipment in merged:
+                merged[stats.equipment].merge(stats)
+            else:
+                merged[stats.equipment] = stats
+    return [(stats.equipment, stats.failures, *stats.duration[1:], *stats.gaps[1:], stats.rate,
+             stats.rate_at, stats.gaps[0]) for stats in merged.values()]
+
+
+def failure_rate_alerts(conn, at=None, **thresholds):
+    """Equipment failing abnormally often in the database on conn (see rate_alerts)"""
+    return rate_alerts([row + (max(row[1] - 1, 0),) for row in read_stats(conn)], at, **thresholds)
+
+
+def rate_alerts(rows, at=None, ratio=ALERT_RATIO, min_failures=MIN_FAILURES,
+                min_recent=MIN_RECENT_FAILURES):
+    """Equipment failing abnormally often, highest ratio first.
+
+    rows are read_stats rows followed by their number of gaps, as
+    merge_stats returns them. Compares each equipment's weighted failure
+    rate at the time at (default now) with its long-run rate, one failure
+    per mean gap. Returns dicts with the rates in failures per day and the
+    mean and standard deviation of the gap in days.
+    """
+    now = to_minutes(at or datetime.now())
+    alerts = []
+    for equipment, failures, duration_mean, _, gap_mean, gap_m2, rate, rate_at, gaps in rows:
+        if failures < min_failures or gap_mean <= 0:
+            continue
+        recent = rate * math.exp(-max(now - rate_at, 0) / TAU)
+        long_run = 1 / gap_mean
+        if recent * TAU < min_recent or recent < ratio * long_run:
+            continue
+        alerts.append({
+            'equipment': equipment,
+            'recent_rate': round(recent * MINUTES_PER_DAY, 2),
+            'long_run_rate': round(long_run * MINUTES_PER_DAY, 2),
+            'ratio': round(recent / long_run, 1),
+            'failures': failures,
+            'mtbf_days': round(gap_mean / MINUTES_PER_DAY, 2),
+            'mtbf_sd_days': round(math.sqrt(gap_m2 / (gaps - 1)) / MINUTES_PER_DAY, 2)
+            if gaps > 1 else None,
+            'avg_downtime': round(duration_mean, 2),
+        })
+    alerts.sort(key=lambda alert: alert['ratio'], reverse=True)
+    return alerts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show equipment failing abnormally often")
+    parser.add_argument('--db', default='downtime.db',
+                        help="database file or partitions directory (default: downtime.db)")
+    parser.add_argument('--at', help="evaluate the rates at this time (YYYY-MM-DD HH:MM, default now)")
+    parser.add_argument('--rebuild', action='store_true', help="recompute the statistics from the records first")
+    args = parser.parse_args(argv)
+
+    # database imports this module, so it is only imported when run as a script
+    from partitions import PartitionedDatabase, open_database
+    db = open_database(args.db)
+    try:
+        if args.rebuild:
+            partitions = (db.each_partition() if isinstance(db, PartitionedDatabase)
+                          else [(None, None, db)])
+            for _, _, database in partitions:
+                database.connections.write(rebuild_stats)
+                database.cache.bump_version()
+        alerts = db.get_failure_rate_alerts(at=args.at)
+    finally:
+        db.close()
+
+    for alert in alerts:
+        plant = f"{alert['plant']} " if 'plant' in alert else ''
+        print(f"{plant}{alert['equipment']}: {alert['recent_rate']} failures/day recently, "
+              f"{alert['long_run_rate']} long-run ({alert['ratio']}x)")
+    print(f"{len(alerts)} equipment failing abnormally often")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
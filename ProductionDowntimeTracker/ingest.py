@@ -0,0 +1,407 @@
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime, timedelta
+from bulk_import import IMPORT_COLUMNS, INSERT_SQL, RowError, normalize_row
+from dimensions import canonicalize_rows
+from failure_stats import record_added
+from partitions import (
+    DEFAULT_PLANT, PLANT_PATTERN, PartitionedDatabase, open_database, partition_period, record_key
+)
+
+# HTTP/JSON ingestion of downtime events posted by PLC and MES gateways.
+# Requests are validated with the same normalization as the bulk importer,
+# queued, and written by a single batcher task in transactions of up to
+# batch_size events or max_delay seconds, whichever comes first. When more
+# than max_pending events are queued, new requests get 503 with
+# Retry-After. An Idempotency-Key header (single events) or an
+# idempotency_key field (any event) makes retries return the original
+# record instead of creating a duplicate. With partitioned records (see
+# partitions.py) an event's plant field picks its plant, each partition's
+# events are written in a transaction of their own, and the ids returned
+# are record keys.
+#
+#   POST /events   one event object, a list of events or {"events": [...]}
+#   GET  /health   queue depth and counters
+
+DEFAULT_PORT = 8502
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MAX_DELAY = 0.05
+DEFAULT_MAX_PENDING = 10000
+DEFAULT_KEY_RETENTION_DAYS = 7
+
+MAX_BODY_BYTES = 1024 * 1024
+MAX_KEY_LENGTH = 200
+
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'
+}
+
+
+class Backpressure(Exception):
+    pass
+
+
+def validate_event(event):
+    """Return (values, idempotency_key, plant) for an event, raising RowError if it is invalid"""
+    if not isinstance(event, dict):
+        raise RowError('event must be a JSON object')
+    for field, value in event.items():
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise RowError(f"{field} must be a string or number")
+    key = event.get('idempotency_key')
+    if key is not None:
+        key = str(key)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise RowError(f'idempotency_key must be 1 to {MAX_KEY_LENGTH} characters')
+    plant = event.get('plant')
+    if plant is not None:
+        plant = str(plant)
+        if not PLANT_PATTERN.match(plant):
+            raise RowError(f"invalid plant '{plant}'")
+    return normalize_row(event), key, plant
+
+
+class IngestBuffer:
+    """Queue of validated events written in size- or time-bounded batches"""
+
+    def __init__(self, db, batch_size=DEFAULT_BATCH_SIZE, max_delay=DEFAULT_MAX_DELAY,
+                 max_pending=DEFAULT_MAX_PENDING):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.stats = {'created': 0, 'duplicates': 0, 'rejected': 0, 'throttled': 0, 'batches': 0}
+        self._queue = asyncio.Queue()
+        self._in_flight = {}
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Write everything still queued, then stop the batcher"""
+        await self._queue.put(None)
+        await self._task
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def submit(self, events):
+        """Queue (values, key, plant) events; returns an awaitable of (record_id, created) each.
+
+        Raises Backpressure without queueing anything when the queue is full.
+        """
+        if self._queue.qsize() + len(events) > self.max_pending:
+            self.stats['throttled'] += 1
+            raise Backpressure()
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for values, key, plant in events:
+            if key is not None and key in self._in_flight:
+                # A retry of an event still waiting to be written
+                futures.append(self._duplicate_of(self._in_flight[key]))
+                continue
+            future = loop.create_future()
+            if key is not None:
+                self._in_flight[key] = future
+            self._queue.put_nowait((values, key, plant, future))
+            futures.append(future)
+        return futures
+
+    async def _duplicate_of(self, future):
+        record_id, _ = await asyncio.shield(future)
+        self.stats['duplicates'] += 1
+        return record_id, False
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        writes = set()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.batch_size:
+                if self._queue.empty():
+                    # An idle writer takes the batch straight away; while a
+                    # write is in progress the batch keeps growing, for up to
+                    # max_delay, so batches get larger as load rises
+                    busy = {write for write in writes if not write.done()}
+                    remaining = deadline - loop.time()
+                    if not busy or remaining <= 0:
+                        break
+                    getter = loop.create_task(self._queue.get())
+                    await asyncio.wait({getter} | busy, timeout=remaining,
+                                       return_when=asyncio.FIRST_COMPLETED)
+                    if not getter.done():
+                        getter.cancel()
+                        continue
+                    item = getter.result()
+                else:
+                    item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            write = loop.create_task(self._write(batch))
+            writes.add(write)
+            write.add_done_callback(writes.discard)
+        if writes:
+            await asyncio.wait(writes)
+
+    async def _write(self, batch):
+        if not isinstance(self.db, PartitionedDatabase):
+            await self._write_to(self.db, batch, lambda record_id: record_id)
+            return
+        by_partition = {}
+        for item in batch:
+            values, _, plant, _ = item
+            partition = (plant or DEFAULT_PLANT, partition_period(values[0], self.db.scheme))
+            by_partition.setdefault(partition, []).append(item)
+        await asyncio.gather(*(self._write_partition(plant, period, items)
+                               for (plant, period), items in by_partition.items()))
+
+    async def _write_partition(self, plant, period, batch):
+        with self.db.partition(plant, period) as db:
+            await self._write_to(db, batch, lambda record_id: record_key(plant, period, record_id))
+
+    async def _write_to(self, db, batch, to_id):
+        """Write a batch in one transaction of db; to_id maps its record ids to the ids returned"""
+        received_at = datetime.now().isoformat(timespec='seconds')
+
+        def job(cursor):
+            results = []
+            rows = canonicalize_rows(cursor, [item[0] for item in batch], IMPORT_COLUMNS)
+            for values, (_, key, _, _) in zip(rows, batch):
+                if key is not None:
+                    row = cursor.execute(
+                        'SELECT record_id FROM ingest_keys WHERE key = ?', (key,)
+                    ).fetchone()
+                    if row is not None:
+                        results.append((to_id(row[0]), False))
+                        continue
+                cursor.execute(INSERT_SQL, values)
+                record_id = cursor.lastrowid
+                record_added(cursor, record_id)
+                if key is not None:
+                    cursor.execute(
+                        'INSERT INTO ingest_keys (key, record_id, received_at) VALUES (?, ?, ?)',
+                        (key, record_id, received_at)
+                    )
+                results.append((to_id(record_id), True))
+            return results
+
+        try:
+            results = await asyncio.wrap_future(db.connections.submit(job))
+        except Exception as e:
+            for _, key, _, future in batch:
+                self._in_flight.pop(key, None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        db.cache.bump_version()
+        self.stats['batches'] += 1
+        for (_, key, _, future), result in zip(batch, results):
+            self._in_flight.pop(key, None)
+            self.stats['created' if result[1] else 'duplicates'] += 1
+            future.set_result(result)
+
+
+def prune_ingest_keys(db, retention_days=DEFAULT_KEY_RETENTION_DAYS):
+    """Forget idempotency keys older than retention_days; returns how many were removed"""
+    if isinstance(db, PartitionedDatabase):
+        return sum(prune_ingest_keys(partition, retention_days)
+                   for _, _, partition in db.each_partition())
+    cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat(timespec='seconds')
+    return db.connections.write(
+        lambda cursor: cursor.execute('DELETE FROM ingest_keys WHERE received_at < ?', (cutoff,)).rowcount
+    )
+
+
+class IngestServer:
+    def __init__(self, db, host='127.0.0.1', port=DEFAULT_PORT, **buffer_options):
+        self.db = db
+        self.host = host
+        self.port = port
+        self.buffer = IngestBuffer(db, **buffer_options)
+        self._server = None
+
+    async def start(self):
+        self.buffer.start()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        await self.buffer.stop()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if isinstance(body, int):
+                    # The request could not be read, so the connection cannot be reused
+                    self._write_response(writer, body, {'error': REASONS[body]}, False, {})
+                    await writer.drain()
+                    break
+                status, payload, extra_headers = await self._route(method, path, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self._write_response(writer, status, payload, keep_alive, extra_headers)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """(method, path, headers, body), with body an error status if it cannot be read"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            return 'GET', '', {}, 400
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            return method, path, headers, 400
+        if length < 0:
+            return method, path, headers, 400
+        if length > MAX_BODY_BYTES:
+            return method, path, headers, 413
+        body = await reader.readexactly(length) if length else b''
+        return method, path, headers, body
+
+    async def _route(self, method, path, headers, body):
+        path = path.split('?', 1)[0]
+        if path == '/health':
+            if method != 'GET':
+                return 405, {'error': REASONS[405]}, {}
+            return 200, dict(self.buffer.stats, pending=self.buffer.pending), {}
+        if path != '/events':
+            return 404, {'error': REASONS[404]}, {}
+        if method != 'POST':
+            return 405, {'error': REASONS[405]}, {}
+        return await self._post_events(headers, body)
+
+    async def _post_events(self, headers, body):
+        try:
+            payload = json.loads(body or b'null')
+        except ValueError as e:
+            return 400, {'error': f'invalid JSON: {e}'}, {}
+
+        single = isinstance(payload, dict) and 'events' not in payload
+        if single:
+            events = [payload]
+            if headers.get('idempotency-key') and 'idempotency_key' not in payload:
+                payload['idempotency_key'] = headers['idempotency-key']
+        elif isinstance(payload, dict):
+            events = payload['events']
+        else:
+            events = payload
+        if not isinstance(events, list) or not events:
+            return 400, {'error': 'expected an event object or a non-empty list of events'}, {}
+
+        validated = []
+        errors = []
+        for index, event in enumerate(events):
+            try:
+                validated.append(validate_event(event))
+            except RowError as e:
+                errors.append({'index': index, 'error': str(e)})
+        if errors:
+            # Nothing from an invalid request is written, so it can be fixed and resent whole
+            self.buffer.stats['rejected'] += len(events)
+            return 400, {'errors': errors}, {}
+
+        try:
+            futures = self.buffer.submit(validated)
+        except Backpressure:
+            return 503, {'error': 'ingest queue is full, retry later'}, {'Retry-After': '1'}
+
+        try:
+            results = await asyncio.gather(*futures)
+        except Exception as e:
+            return 500, {'error': f'write failed: {e}'}, {}
+
+        results = [
+            {'id': record_id, 'status': 'created' if created else 'duplicate'}
+            for record_id, created in results
+        ]
+        return 200, results[0] if single else {'results': results}, {}
+
+    def _write_response(self, writer, status, payload, keep_alive, extra_headers):
+        body = json.dumps(payload).encode()
+        headers = [
+            f'HTTP/1.1 {status} {REASONS[status]}',
+            'Content-Type: application/json',
+            f'Content-Length: {len(body)}',
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        headers.extend(f'{name}: {value}' for name, value in extra_headers.items())
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') + body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP ingestion API for downtime events")
+    parser.add_argument('--db', default='downtime.db',
+                        help="database file or partitions directory (default: downtime.db)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="events per transaction")
+    parser.add_argument('--max-delay-ms', type=float, default=DEFAULT_MAX_DELAY * 1000,
+                        help="longest an event waits for its batch to fill")
+    parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+                        help="queued events before requests are turned away with 503")
+    parser.add_argument('--key-retention-days', type=float, default=DEFAULT_KEY_RETENTION_DAYS)
+    args = parser.parse_args(argv)
+
+    db = open_database(args.db)
+    pruned = prune_ingest_keys(db, args.key_retention_days)
+    server = IngestServer(
+        db, args.host, args.port, batch_size=args.batch_size,
+        max_delay=args.max_delay_ms / 1000, max_pending=args.max_pending
+    )
+
+    async def run():
+        await server.start()
+        print(f"Listening on http://{args.host}:{server.port} ({pruned} expired idempotency keys removed)",
+              flush=True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
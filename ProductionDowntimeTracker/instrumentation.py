@@ -0,0 +1,210 @@
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Lightweight timing spans for the database, analytics and predictor hot
+# paths. Tracing is off unless DOWNTIME_TRACE=1 is set or set_enabled(True)
+# is called for the whole process, or begin_rerun(trace=True) turns it on
+# for one thread's rerun (a single app session); while off, a traced
+# function costs a global and a thread-local lookup on top of the call
+# itself.
+
+ENABLED = os.environ.get('DOWNTIME_TRACE') == '1'
+
+MAX_SPANS = 20000
+
+_spans = deque(maxlen=MAX_SPANS)
+_spans_lock = threading.Lock()
+_local = threading.local()
+_rerun_ids = itertools.count(1)
+_origin = time.perf_counter()
+
+
+def set_enabled(enabled):
+    global ENABLED
+    ENABLED = bool(enabled)
+
+
+def begin_rerun(label='', trace=False):
+    """Mark the start of a script rerun on this thread; returns its id.
+
+    With trace, this thread records spans until its next begin_rerun even
+    while tracing is off for the process.
+    """
+    _local.rerun = (next(_rerun_ids), label)
+    _local.trace = trace
+    return _local.rerun[0]
+
+
+def count_rows(result):
+    """Best-effort row count of a traced function's result"""
+    if result is None:
+        return None
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], list):
+        # (columns, records) as returned by the Database record queries
+        return len(result[1])
+    if isinstance(result, tuple) and len(result) == 2 and hasattr(result[1], 'shape'):
+        # (figure, DataFrame) as returned by create_shift_analysis
+        return len(result[1])
+    if hasattr(result, 'shape') or isinstance(result, list):
+        return len(result)
+    return None
+
+
+def _record(name, category, started, ended, rows, parent, depth):
+    rerun_id, rerun_label = getattr(_local, 'rerun', (None, ''))
+    span = {
+        'name': name,
+        'category': category,
+        'start': started - _origin,
+        'duration': ended - started,
+        'rows': rows,
+        'thread': threading.get_ident(),
+        'rerun': rerun_id,
+        'rerun_label': rerun_label,
+        'parent': parent,
+        'depth': depth,
+    }
+    with _spans_lock:
+        _spans.append(span)
+
+
+class _Span:
+    __slots__ = ('rows',)
+
+    def __init__(self):
+        self.rows = None
+
+
+@contextmanager
+def span(name, category='app'):
+    """Time a block; set .rows on the yielded object to record a row count"""
+    if not ENABLED and not getattr(_local, 'trace', False):
+        yield _Span()
+        return
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    current = _Span()
+    stack.append(name)
+    started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        ended = time.perf_counter()
+        stack.pop()
+        _record(name, category, started, ended, current.rows, parent, len(stack))
+
+
+def traced(name=None, category='app'):
+    """Decorator recording a span for each call, with the result's row count"""
+    def decorator(function):
+        span_name = name or f'{function.__module__}.{function.__qualname__}'
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED and not getattr(_local, 'trace', False):
+                return function(*args, **kwargs)
+            with span(span_name, category) as current:
+                result = function(*args, **kwargs)
+                current.rows = count_rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def get_spans(rerun=None):
+    with _spans_lock:
+        spans = list(_spans)
+    if rerun is not None:
+        spans = [s for s in spans if s['rerun'] == rerun]
+    return spans
+
+
+def clear():
+    with _spans_lock:
+        _spans.clear()
+
+
+def recent_reruns(limit=20):
+    """[(rerun_id, label, total_seconds)] for the most recent reruns with spans"""
+    totals = {}
+    for s in get_spans():
+        if s['rerun'] is None:
+            continue
+        label, total = totals.get(s['rerun'], (s['rerun_label'], 0.0))
+        # Top-level spans only, so nested time is not counted twice
+        if s['depth'] == 0:
+            total += s['duration']
+        totals[s['rerun']] = (label, total)
+    reruns = sorted(totals.items(), reverse=True)[:limit]
+    return [(rerun, label, total) for rerun, (label, total) in reruns]
+
+
+def _percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(spans=None):
+    """Per-name count, total and p50/p95/p99/max latency in milliseconds"""
+    spans = get_spans() if spans is None else spans
+    by_name = {}
+    for s in spans:
+        by_name.setdefault((s['name'], s['category']), []).append(s['duration'])
+
+    summary = []
+    for (name, category), durations in by_name.items():
+        durations.sort()
+        summary.append({
+            'name': name,
+            'category': category,
+            'count': len(durations),
+            'total_ms': sum(durations) * 1000,
+            'p50_ms': _percentile(durations, 50) * 1000,
+            'p95_ms': _percentile(durations, 95) * 1000,
+            'p99_ms': _percentile(durations, 99) * 1000,
+            'max_ms': durations[-1] * 1000,
+        })
+    return sorted(summary, key=lambda row: row['total_ms'], reverse=True)
+
+
+def slowest(limit=20, category=None, spans=None):
+    spans = get_spans() if spans is None else spans
+    if category is not None:
+        spans = [s for s in spans if s['category'] == category]
+    return sorted(spans, key=lambda s: s['duration'], reverse=True)[:limit]
+
+
+def to_json(spans=None):
+    spans = get_spans() if spans is None else spans
+    return json.dumps({'spans': spans, 'summary': summarize(spans)}, indent=2)
+
+
+def to_chrome_trace(spans=None):
+    """Spans as Chrome trace event JSON (chrome://tracing, Perfetto)"""
+    spans = get_spans() if spans is None else spans
+    pid = os.getpid()
+    events = []
+    for s in spans:
+        args = {'rerun': s['rerun']}
+        if s['rows'] is not None:
+            args['rows'] = s['rows']
+        events.append({
+            'name': s['name'],
+            'cat': s['category'],
+            'ph': 'X',
+            'ts': s['start'] * 1e6,
+            'dur': s['duration'] * 1e6,
+            'pid': pid,
+            'tid': s['thread'],
+            'args': args,
+        })
+    return json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'})
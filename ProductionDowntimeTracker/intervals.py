@@ -0,0 +1,173 @@
+import bisect
+import functools
+from datetime import date, datetime, timedelta
+from utils import get_shift_start_times
+
+# Records carry absolute start and end timestamps (started_at, ended_at,
+# 'YYYY-MM-DD HH:MM', added in migration 10) next to the date and clock
+# times they were entered with, and downtime_intervals, an R*Tree over
+# their minutes since the epoch, answers "what was down between" queries.
+#
+# A record's date is the day its shift started, so a clock time after
+# midnight in a shift that runs past midnight falls on the next day. The
+# end is the start plus the recorded duration.
+#
+# The sweep-line functions below work on (start, end) minute pairs: they
+# merge the overlapping stops of a line so concurrent stops are counted
+# once, and measure availability and concurrent stops per shift.
+
+EPOCH = datetime(1970, 1, 1)
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M'
+
+
+def _shift_windows():
+    """[(shift, start 'HH:MM', end 'HH:MM')] in clock order; each shift ends where the next begins"""
+    starts = sorted(get_shift_start_times().items(), key=lambda item: item[1])
+    return [(shift, start, starts[(i + 1) % len(starts)][1]) for i, (shift, start) in enumerate(starts)]
+
+
+@functools.lru_cache(maxsize=None)
+def after_midnight_shifts():
+    """{shift: end 'HH:MM'} of the shifts that run past midnight"""
+    return {shift: end for shift, start, end in _shift_windows() if end <= start}
+
+
+def started_at_sql(row):
+    """SQL for the started_at of a record, row being NEW, OLD or a table name"""
+    rollover = ' '.join(
+        f"WHEN {row}.shift = '{shift}' AND {row}.start_time < '{end}' THEN '+1 day'"
+        for shift, end in after_midnight_shifts().items()
+    )
+    offset = f"CASE {rollover} ELSE '+0 days' END" if rollover else "'+0 days'"
+    return f"strftime('{TIMESTAMP_FORMAT}', {row}.date || ' ' || {row}.start_time, {offset})"
+
+
+def ended_at_sql(row):
+    """SQL for the ended_at of a record: its start plus its duration"""
+    return (f"strftime('{TIMESTAMP_FORMAT}', {started_at_sql(row)}, "
+            f"'+' || IFNULL({row}.duration, 0) || ' minutes')")
+
+
+def minutes_sql(timestamp):
+    """SQL for the minutes since the epoch of a timestamp expression"""
+    return f"CAST(strftime('%s', {timestamp}) AS INTEGER) / 60"
+
+
+def to_minutes(value):
+    """Minutes since the epoch of a datetime or 'YYYY-MM-DD HH:MM' timestamp"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return (value - EPOCH) // timedelta(minutes=1)
+
+
+def from_minutes(minutes):
+    """'YYYY-MM-DD HH:MM' timestamp of minutes since the epoch"""
+    return (EPOCH + timedelta(minutes=minutes)).strftime(TIMESTAMP_FORMAT)
+
+
+def event_minutes(record_date, shift, start_time, duration):
+    """(start, end) minutes of a record, as the started_at and ended_at columns hold them.
+
+    Returns None when the date or start time cannot be read.
+    """
+    if isinstance(record_date, (date, datetime)):
+        record_date = record_date.strftime('%Y-%m-%d')
+    try:
+        started = datetime.fromisoformat(f'{record_date} {start_time}')
+    except (TypeError, ValueError):
+        return None
+    end = after_midnight_shifts().get(shift)
+    if end is not None and str(start_time) < end:
+        started += timedelta(days=1)
+    start = to_minutes(started)
+    return start, start + int(duration or 0)
+
+
+def sweep(intervals):
+    """Sweep the (start, end) intervals of one line in time order.
+
+    Returns (downtime, overlap, peak): minutes with at least one stop,
+    minutes with two or more at once, and the most stops at once. Stops
+    that merely touch are not concurrent. O(n log n) for the sort.
+    """
+    events = []
+    for start, end in intervals:
+        if end > start:
+            events.append((start, 1))
+            events.append((end, -1))
+    # Ends sort before starts at the same minute
+    events.sort()
+
+    downtime = overlap = peak = active = 0
+    previous = None
+    for time, change in events:
+        if active:
+            downtime += time - previous
+            if active > 1:
+                overlap += time - previous
+        active += change
+        peak = max(peak, active)
+        previous = time
+    return downtime, overlap, peak
+
+
+def line_downtime(rows):
+    """Minutes any line was down, each line's overlapping stops counted once.
+
+    rows start with (line, start, end) minutes, as Database.get_intervals returns them.
+    """
+    by_line = {}
+    for line, start, end, *_ in rows:
+        by_line.setdefault(line, []).append((start, end))
+    return sum(sweep(intervals)[0] for intervals in by_line.values())
+
+
+def shift_windows(start_date, end_date):
+    """[(shift_date, shift, start, end)] minute windows of every shift from start_date to end_date"""
+    day = date.fromisoformat(str(start_date)[:10])
+    last = date.fromisoformat(str(end_date)[:10])
+    windows = []
+    while day <= last:
+        for shift, start, end in _shift_windows():
+            started = datetime.fromisoformat(f'{day} {start}')
+            ended = datetime.fromisoformat(f'{day} {end}')
+            if end <= start:
+                ended += timedelta(days=1)
+            windows.append((day.isoformat(), shift, to_minutes(started), to_minutes(ended)))
+        day += timedelta(days=1)
+    return windows
+
+
+def shift_availability(rows, windows, lines=None):
+    """Downtime, availability and concurrent stops per line and shift.
+
+    rows start with (line, start, end) minutes and windows are the
+    contiguous shift windows from shift_windows. Stops are clipped to each
+    window they cover. Returns (line, shift_date, shift, planned, stops,
+    downtime, availability, overlap, peak) rows, downtime and overlap in
+    minutes. Shifts of the given lines without stops are included at full
+    availability; otherwise only lines with stops are reported.
+    """
+    starts = [window[2] for window in windows]
+    pieces = {}
+    for line, start, end, *_ in rows:
+        index = max(bisect.bisect_right(starts, start) - 1, 0)
+        while index < len(windows) and windows[index][2] < end:
+            window_start, window_end = windows[index][2], windows[index][3]
+            clipped = (max(start, window_start), min(end, window_end))
+            if clipped[1] > clipped[0]:
+                pieces.setdefault((line, index), []).append(clipped)
+            index += 1
+
+    result = []
+    for line in sorted(set(lines or []) | {line for line, _ in pieces}, key=lambda line: line or ''):
+        for index, (shift_date, shift, window_start, window_end) in enumerate(windows):
+            intervals = pieces.get((line, index), [])
+            if not intervals and lines is None:
+                continue
+            planned = window_end - window_start
+            downtime, overlap, peak = sweep(intervals)
+            result.append((line, shift_date, shift, planned, len(intervals), downtime,
+                           round(1 - downtime / planned, 4), overlap, peak))
+    return result
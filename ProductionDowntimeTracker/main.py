@@ -1,19 +1,87 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-import plotly.express as px
 import urllib.parse
-from database import Database
-from analytics import calculate_kpis, create_pareto_chart, create_downtime_trend, create_equipment_pareto, create_issue_type_pareto
-from maintenance_predictor import calculate_equipment_metrics, get_maintenance_recommendations
+import atexit
+import instrumentation
+from database import TREND_SERIES
+from dimensions import PARETO_TOP_N
+from export import EXPORT_FORMATS, MAX_DOWNLOAD_ROWS, check_download_size, export_records
+from analytics import TREND_GRANULARITIES, calculate_kpis, create_pareto_chart, create_downtime_trend, create_equipment_pareto, create_issue_type_pareto
+from maintenance_predictor import get_maintenance_recommendations
+from partitions import DEFAULT_PLANT, PartitionedDatabase, open_database
+from predictions import PredictionScheduler
+from shift_summary import build_shift_summaries, join_summaries
 from utils import (
     calculate_duration, get_shift_options, get_line_options,
-    get_equipment_options, get_issue_type_options, format_downtime_summary
+    get_equipment_options, get_issue_type_options
 )
+import math
+import os
+import tempfile
 import time
 
-# Initialize database
-db = Database()
+SEARCH_PAGE_SIZE = 100
+BROWSE_PAGE_SIZE = 100
+EXPORT_MIME_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file'
+}
+TREND_SERIES_LABELS = {
+    'line': 'Production Line', 'shift': 'Shift', 'equipment': 'Equipment', 'issue_type': 'Issue Type'
+}
+BROWSE_COLUMNS = [
+    'id', 'date', 'shift', 'line', 'start_time', 'end_time', 'duration',
+    'equipment', 'issue_type', 'responsible_person'
+]
+
+# Initialize database once per server process; each Database owns a writer
+# thread and its connections, so it must not be recreated on every rerun.
+# DOWNTIME_DB names the database file, or a partitions directory to serve
+# every plant's records (see partitions.py). atexit closes it when the
+# server shuts down, after the scheduler below has stopped (handlers run
+# in reverse order).
+@st.cache_resource(show_spinner=False)
+def get_database():
+    database = open_database(os.environ.get('DOWNTIME_DB', 'downtime.db'))
+    atexit.register(database.close)
+    return database
+
+
+db = get_database()
+partitioned = isinstance(db, PartitionedDatabase)
+
+
+def plant_selectbox(label, **kwargs):
+    """A plant to record or summarize with a partitioned database, else None"""
+    if not partitioned:
+        return None
+    return st.selectbox(label, db.plants() or [DEFAULT_PLANT], **kwargs)
+
+
+def equipment_label(row):
+    """An alert or recommendation's equipment, after its plant when partitioned"""
+    return f"{row['plant']} {row['equipment']}" if 'plant' in row else row['equipment']
+
+
+# Keeps the maintenance_predictions table current in the background
+@st.cache_resource(show_spinner=False)
+def get_prediction_scheduler():
+    scheduler = PredictionScheduler(get_database()).start()
+    atexit.register(scheduler.stop)
+    return scheduler
+
+
+prediction_scheduler = get_prediction_scheduler()
+
+
+# Read once per server process rather than on every rerun
+@st.cache_resource(show_spinner=False)
+def load_styles():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'styles.css')) as f:
+        return f.read()
+
 
 # Page configuration
 st.set_page_config(
@@ -22,17 +90,22 @@ st.set_page_config(
     layout="wide"
 )
 
+# Hidden diagnostics tab, opened with ?diagnostics=1, which also traces
+# this session's reruns; other sessions are not traced
+show_diagnostics = st.query_params.get("diagnostics") == "1"
+instrumentation.begin_rerun(datetime.now().strftime("%H:%M:%S"), trace=show_diagnostics)
+
 # Load custom CSS
-with open('styles.css') as f:
-    st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+st.markdown(f'<style>{load_styles()}</style>', unsafe_allow_html=True)
 
 # Header
 st.markdown("<h1 class='main-header'>Production Line Downtime Reporting</h1>", unsafe_allow_html=True)
 
-# Tabs
-tab1, tab2, tab3, tab4 = st.tabs(["Data Entry", "View Records", "Analytics", "Shift Summary"])
+# Each view is a function and only the selected one runs on a rerun, unlike
+# st.tabs which executes every tab body. The records and analytics views are
+# fragments, so their own widgets rerun just that view.
 
-with tab1:
+def data_entry_view():
     st.markdown("<div class='form-container'>", unsafe_allow_html=True)
 
     # Form inputs
@@ -41,6 +114,7 @@ with tab1:
 
         with col1:
             date = st.date_input("Date", datetime.now())
+            plant = plant_selectbox("Plant")
             shift = st.selectbox("Shift", get_shift_options())
             line = st.selectbox("Production Line", get_line_options())
 
@@ -84,24 +158,53 @@ with tab1:
                 'remarks': remarks
             }
 
+            if plant:
+                data['plant'] = plant
             db.insert_record(data)
+            prediction_scheduler.notify()
             st.success("Record added successfully!")
             st.rerun()
 
     st.markdown("</div>", unsafe_allow_html=True)
 
-with tab2:
-    # View and manage records
-    columns, records = db.get_all_records()
-    if records:
-        # Create DataFrame
-        df = pd.DataFrame(records, columns=columns)
 
-        # Search functionality
+@st.fragment
+def records_view():
+    # View and manage records
+    num_records = db.get_downtime_totals()[2]
+    if num_records:
+        # Search functionality (prefix words, "quoted phrases")
         search_term = st.text_input("🔍 Search records")
         if search_term:
-            mask = df.astype(str).apply(lambda x: x.str.contains(search_term, case=False)).any(axis=1)
-            df = df[mask]
+            num_matches = db.count_search_results(search_term)
+            num_pages = max(1, math.ceil(num_matches / SEARCH_PAGE_SIZE))
+            search_page = st.number_input("Results page", min_value=1, max_value=num_pages, value=1)
+            columns, page_records = db.search_records(
+                search_term, limit=SEARCH_PAGE_SIZE, offset=(search_page - 1) * SEARCH_PAGE_SIZE
+            )
+            st.caption(f"{num_matches} matching records")
+        else:
+            # Keyset pagination: each entry is the (date, id) the page starts after
+            page_keys = st.session_state.setdefault('browse_page_keys', [None])
+            columns, page_records = db.get_records_page(
+                columns=BROWSE_COLUMNS, after=page_keys[-1], page_size=BROWSE_PAGE_SIZE
+            )
+
+            col1, col2, col3 = st.columns([1, 1, 4])
+            with col1:
+                if st.button("◀ Previous", disabled=len(page_keys) == 1):
+                    page_keys.pop()
+                    st.rerun(scope="fragment")
+            with col2:
+                if st.button("Next ▶", disabled=len(page_records) < BROWSE_PAGE_SIZE):
+                    last_record = dict(zip(columns, page_records[-1]))
+                    page_keys.append((last_record['date'], last_record['id']))
+                    st.rerun(scope="fragment")
+            with col3:
+                st.caption(f"Page {len(page_keys)} of {max(1, math.ceil(num_records / BROWSE_PAGE_SIZE))} "
+                           f"({num_records} records)")
+
+        df = pd.DataFrame(page_records, columns=columns)
 
         # Display records
         st.dataframe(df.style.set_properties(**{'text-align': 'left'}), height=400)
@@ -110,77 +213,168 @@ with tab2:
         st.subheader("Delete Records")
         st.warning("⚠️ Warning: Deletion cannot be undone!")
 
-        # Simple dropdown for record selection
-        record_to_delete = st.selectbox(
-            "Select a record to delete:",
-            options=df['id'].tolist(),
-            format_func=lambda x: f"Record #{x} - {df[df['id'] == x]['date'].iloc[0]} - {df[df['id'] == x]['equipment'].iloc[0]}"
+        # Records on the current page, labelled without searching the DataFrame;
+        # archived records are read-only and are not offered
+        deletable = db.deletable_record_ids(df['id'])
+        record_labels = {
+            record['id']: f"Record #{record['id']} - {record['date']} - {record['equipment']}"
+            for record in df.to_dict('records')
+            if record['id'] in deletable
+        }
+        if len(record_labels) < len(df):
+            st.caption(f"{len(df) - len(record_labels)} archived record(s) on this page cannot be deleted")
+        records_to_delete = st.multiselect(
+            "Select records to delete:",
+            options=list(record_labels),
+            format_func=record_labels.get
         )
 
         # Delete button
         col1, col2 = st.columns([1, 4])
         with col1:
-            if st.button("🗑️ Delete Record", type="primary"):
-                if record_to_delete:
+            if st.button("🗑️ Delete Selected", type="primary"):
+                if records_to_delete:
                     try:
-                        db.delete_record(record_to_delete)
-                        st.success(f"Record #{record_to_delete} deleted successfully!")
+                        deleted = db.delete_records(records_to_delete)
+                        prediction_scheduler.notify()
+                        if deleted < len(records_to_delete):
+                            st.warning(f"{deleted} of {len(records_to_delete)} record(s) deleted; "
+                                       "the others no longer exist or are archived")
+                        else:
+                            st.success(f"{deleted} record(s) deleted successfully!")
                         time.sleep(1)
                         st.rerun()
                     except Exception as e:
-                        st.error(f"Error deleting record: {str(e)}")
+                        st.error(f"Error deleting records: {str(e)}")
                 else:
-                    st.warning("Please select a record to delete")
+                    st.warning("Please select records to delete")
 
         # Export section
         st.subheader("Export Data")
-        if st.button("📊 Export to CSV"):
-            csv = df.to_csv(index=False)
-            st.download_button(
-                label="📥 Download CSV",
-                data=csv,
-                file_name=f"downtime_records_{datetime.now().strftime('%Y%m%d')}.csv",
-                mime="text/csv"
-            )
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            export_dates = st.date_input("Date Range", value=(), key="export_dates")
+        with col2:
+            export_lines = st.multiselect("Production Lines", get_line_options(), key="export_lines")
+        with col3:
+            export_format = st.selectbox("Format", EXPORT_FORMATS, key="export_format")
+
+        st.caption(f"Downloads are limited to {MAX_DOWNLOAD_ROWS:,} records; "
+                   "use `python export.py` for larger exports.")
+
+        if st.button("📊 Export"):
+            file_name = f"downtime_records_{datetime.now().strftime('%Y%m%d')}.{export_format}"
+            export_filters = {
+                'start_date': export_dates[0].strftime("%Y-%m-%d") if len(export_dates) > 0 else None,
+                'end_date': export_dates[-1].strftime("%Y-%m-%d") if len(export_dates) > 0 else None,
+                'line': export_lines
+            }
+            try:
+                # Rows are written to a temporary file in chunks, but the
+                # download button holds the finished file in memory, so the
+                # size is checked first
+                check_download_size(db, **export_filters)
+                with tempfile.TemporaryDirectory() as export_dir:
+                    export_path = os.path.join(export_dir, file_name)
+                    export_records(db, export_path, export_format, **export_filters)
+                    with open(export_path, 'rb') as export_file:
+                        st.download_button(
+                            label=f"📥 Download {export_format.upper()}",
+                            data=export_file,
+                            file_name=file_name,
+                            mime=EXPORT_MIME_TYPES[export_format]
+                        )
+            except (RuntimeError, ValueError) as e:
+                st.error(str(e))
     else:
         st.info("No records found in the database")
 
-with tab3:
+
+@st.fragment
+def analytics_view():
+    # Analytics filters
+    with st.expander("Filters"):
+        col1, col2 = st.columns(2)
+        with col1:
+            date_range = st.date_input("Date Range", value=(), key="analytics_dates")
+            filter_lines = st.multiselect("Production Lines", get_line_options(), key="analytics_lines")
+            filter_shifts = st.multiselect("Shifts", get_shift_options(), key="analytics_shifts")
+        with col2:
+            filter_equipment = st.multiselect("Equipment", get_equipment_options()[:-1], key="analytics_equipment")
+            filter_issue_types = st.multiselect("Issue Types", get_issue_type_options()[:-1], key="analytics_issue_types")
+
+    filters = {
+        'start_date': date_range[0].strftime("%Y-%m-%d") if len(date_range) > 0 else None,
+        'end_date': date_range[-1].strftime("%Y-%m-%d") if len(date_range) > 0 else None,
+        'line': filter_lines,
+        'shift': filter_shifts,
+        'equipment': filter_equipment,
+        'issue_type': filter_issue_types
+    }
+
     # Analytics dashboard
-    columns, records = db.get_all_records()
-    if records:
-        # Calculate KPIs
-        kpis = calculate_kpis(records)
-        col1, col2, col3 = st.columns(3)
+    kpis = calculate_kpis(db, **filters)
+    if kpis['num_incidents']:
+        col1, col2, col3, col4 = st.columns(4)
 
         with col1:
             st.metric("Total Downtime (min)", kpis['total_downtime'])
         with col2:
-            st.metric("Average Downtime (min)", kpis['avg_downtime'])
+            st.metric("Line Downtime (min)", kpis['line_downtime'],
+                      help="Overlapping stops on the same line are counted once")
         with col3:
+            st.metric("Average Downtime (min)", kpis['avg_downtime'])
+        with col4:
             st.metric("Number of Incidents", kpis['num_incidents'])
 
-        # Equipment Pareto Chart
+        # Equipment Pareto Chart; the Paretos show the top PARETO_TOP_N and
+        # sum the rest into one bar
         st.subheader("Equipment Analysis")
-        equipment_stats = db.get_equipment_stats()
-        equipment_pareto = create_equipment_pareto(equipment_stats)
+        equipment_pareto = db.get_derived(
+            'equipment_pareto',
+            lambda: create_equipment_pareto(db.get_equipment_stats(top_n=PARETO_TOP_N, **filters)),
+            **filters
+        )
         if equipment_pareto:
             st.plotly_chart(equipment_pareto, use_container_width=True)
 
         # Issue Type Pareto Chart
         st.subheader("Downtime Causes Analysis")
-        issue_type_stats = db.get_issue_type_stats()
-        issue_type_pareto = create_issue_type_pareto(issue_type_stats)
+        issue_type_pareto = db.get_derived(
+            'issue_type_pareto',
+            lambda: create_issue_type_pareto(db.get_issue_type_stats(top_n=PARETO_TOP_N, **filters)),
+            **filters
+        )
         if issue_type_pareto:
             st.plotly_chart(issue_type_pareto, use_container_width=True)
 
+        # Failure rate alerts from the running per-equipment statistics,
+        # current as of the last saved record
+        st.subheader("Failure Rate Alerts")
+        failure_alerts = db.get_failure_rate_alerts()
+        if failure_alerts:
+            for alert in failure_alerts:
+                st.warning(
+                    f"{equipment_label(alert)}: {alert['recent_rate']} failures/day recently, "
+                    f"{alert['ratio']}x its long-run rate of {alert['long_run_rate']}/day "
+                    f"(MTBF {alert['mtbf_days']} days over {alert['failures']} failures)"
+                )
+        else:
+            st.success("No equipment is failing abnormally often")
+
         # Preventive Maintenance Analysis
         st.subheader("Preventive Maintenance Predictions")
 
-        # Equipment Metrics
-        metrics_df = calculate_equipment_metrics(records)
-        if not metrics_df.empty:
+        # Equipment Metrics, precomputed over all records by the prediction
+        # scheduler; only the equipment filter applies
+        equipment_metrics = db.get_maintenance_predictions(equipment=filters['equipment'])
+        metrics_df = equipment_metrics.copy()
+        prediction_run = db.get_latest_prediction_run()
+        if prediction_run is None:
+            st.info("Maintenance predictions are being computed and will appear shortly.")
+        elif not metrics_df.empty:
             st.write("Equipment Performance Metrics:")
+            st.caption(f"Computed over all records at {prediction_run[1].replace('T', ' ')}")
             # Format dates for display
             metrics_df['next_predicted_failure'] = pd.to_datetime(metrics_df['next_predicted_failure']).dt.strftime('%Y-%m-%d')
             metrics_df['recommended_maintenance'] = pd.to_datetime(metrics_df['recommended_maintenance']).dt.strftime('%Y-%m-%d')
@@ -188,11 +382,11 @@ with tab3:
 
             # Maintenance Recommendations
             st.subheader("⚠️ Upcoming Maintenance Recommendations")
-            recommendations = get_maintenance_recommendations(records)
+            recommendations = get_maintenance_recommendations(metrics_df=equipment_metrics)
 
             if recommendations:
                 for rec in recommendations:
-                    with st.expander(f"🔧 {rec['equipment']} - Maintenance needed in {rec['days_until_maintenance']} days"):
+                    with st.expander(f"🔧 {equipment_label(rec)} - Maintenance needed in {rec['days_until_maintenance']} days"):
                         st.write(f"• Mean Time Between Failures: {rec['mtbf_days']:.1f} days")
                         st.write(f"• Current Failure Rate: {rec['failure_rate']} failures/month")
                         st.write(f"• Average Downtime per Incident: {rec['avg_downtime']} minutes")
@@ -201,19 +395,48 @@ with tab3:
 
         # Downtime Trend
         st.subheader("Downtime Trend")
-        trend_fig = create_downtime_trend(records)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            trend_granularity = st.selectbox("Granularity", list(TREND_GRANULARITIES),
+                                             format_func=str.title, key="trend_granularity")
+        with col2:
+            trend_series = st.selectbox("Split by", [None] + TREND_SERIES, key="trend_series",
+                                        format_func=lambda series: TREND_SERIES_LABELS.get(series, "Nothing"))
+        with col3:
+            trend_rolling = st.number_input("Moving average (periods)", min_value=1, max_value=90,
+                                            value=1, key="trend_rolling")
+        trend_fig = db.get_derived(
+            'downtime_trend',
+            lambda: create_downtime_trend(db, trend_granularity, trend_series, trend_rolling, **filters),
+            granularity=trend_granularity, series=trend_series, rolling=trend_rolling, **filters
+        )
         if trend_fig:
             st.plotly_chart(trend_fig, use_container_width=True)
 
         # Equipment Performance Analysis
         st.subheader("Equipment Performance Analysis")
-        equipment_df = pd.DataFrame(equipment_stats, 
+        equipment_df = pd.DataFrame(db.get_equipment_stats(**filters), 
                                   columns=['Equipment', 'Frequency', 'Total Duration'])
         st.dataframe(equipment_df)
+
+        # Availability per line and shift, over the shifts' clock time
+        st.subheader("Shift Availability")
+        if filters['start_date']:
+            availability = db.get_shift_availability(
+                filters['start_date'], filters['end_date'], line=filters['line'] or None
+            )
+            availability_df = pd.DataFrame(availability, columns=[
+                'Line', 'Date', 'Shift', 'Planned (min)', 'Stops', 'Downtime (min)',
+                'Availability', 'Overlapping Stops (min)', 'Most Concurrent Stops'
+            ])
+            st.dataframe(availability_df)
+        else:
+            st.info("Select a date range to see availability per shift")
     else:
         st.info("No data available for analytics")
 
-with tab4:
+
+def shift_summary_view():
     st.subheader("Shift Summary and Sharing")
 
     # Production data input
@@ -221,6 +444,7 @@ with tab4:
         col1, col2 = st.columns(2)
         with col1:
             summary_date = st.date_input("Select Date", datetime.now())
+            summary_plant = plant_selectbox("Select Plant", key="summary_plant")
             packs_produced = st.number_input("Number of Packs Produced", min_value=0)
         with col2:
             summary_line = st.selectbox("Select Production Line", get_line_options())
@@ -229,27 +453,106 @@ with tab4:
         generate_button = st.form_submit_button("Generate Summary")
 
         if generate_button:
-            columns, records = db.get_all_records()
-            if records:
-                production_data = {
-                    'date': summary_date.strftime("%Y-%m-%d"),
-                    'line': summary_line,
-                    'packs_produced': packs_produced,
-                    'shift': shift_select
-                }
-
-                # Generate summary
-                summary_text = format_downtime_summary(records, production_data)
-                st.text_area("Summary", summary_text, height=300)
-
-                # Share buttons
-                col1, col2 = st.columns(2)
-                with col1:
-                    whatsapp_url = f"https://wa.me/?text={urllib.parse.quote(summary_text)}"
-                    st.markdown(f'<a href="{whatsapp_url}" target="_blank"><button style="background-color: #25D366; color: white; padding: 10px 20px; border: none; border-radius: 5px; cursor: pointer;">Share via WhatsApp</button></a>', unsafe_allow_html=True)
-
-                with col2:
-                    mailto_url = f"mailto:?subject=Production%20Shift%20Summary&body={urllib.parse.quote(summary_text)}"
-                    st.markdown(f'<a href="{mailto_url}"><button style="background-color: #0066cc; color: white; padding: 10px 20px; border: none; border-radius: 5px; cursor: pointer;">Share via Email</button></a>', unsafe_allow_html=True)
-            else:
-                st.warning("No records available to generate summary")
\ No newline at end of file
+            summary_date_str = summary_date.strftime("%Y-%m-%d")
+            summary_text = build_shift_summaries(
+                db, summary_date_str, [summary_line], [shift_select],
+                {(summary_line, shift_select): packs_produced}, plant=summary_plant
+            )[(summary_line, shift_select)]
+            st.text_area("Summary", summary_text, height=300)
+
+            # Share buttons
+            col1, col2 = st.columns(2)
+            with col1:
+                whatsapp_url = f"https://wa.me/?text={urllib.parse.quote(summary_text)}"
+                st.markdown(f'<a href="{whatsapp_url}" target="_blank"><button style="background-color: #25D366; color: white; padding: 10px 20px; border: none; border-radius: 5px; cursor: pointer;">Share via WhatsApp</button></a>', unsafe_allow_html=True)
+
+            with col2:
+                mailto_url = f"mailto:?subject=Production%20Shift%20Summary&body={urllib.parse.quote(summary_text)}"
+                st.markdown(f'<a href="{mailto_url}"><button style="background-color: #0066cc; color: white; padding: 10px 20px; border: none; border-radius: 5px; cursor: pointer;">Share via Email</button></a>', unsafe_allow_html=True)
+
+    # Every line and shift of a date at once, from a single query
+    st.subheader("All Lines and Shifts")
+    batch_date = st.date_input("Select Date", datetime.now(), key="batch_summary_date")
+    batch_date_str = batch_date.strftime("%Y-%m-%d")
+    summaries = build_shift_summaries(db, batch_date_str)
+    st.caption(f"{len(summaries)} summaries for {batch_date_str}")
+    st.download_button(
+        "📥 Download all summaries", join_summaries(summaries),
+        file_name=f"shift_summaries_{batch_date_str}.txt", mime="text/plain"
+    )
+
+
+def diagnostics_view():
+    st.subheader("Performance Diagnostics")
+    st.caption("Spans are recorded while this view is open. Reruns start when a widget changes; "
+               "the rerun drawing this tab is still in progress.")
+
+    reruns = instrumentation.recent_reruns()
+    if reruns:
+        selected_rerun = st.selectbox(
+            "Rerun",
+            options=[rerun for rerun, _, _ in reruns],
+            format_func=lambda rerun: next(
+                f"#{rerun} at {label} - {total * 1000:.1f} ms traced"
+                for r, label, total in reruns if r == rerun
+            )
+        )
+        rerun_spans = instrumentation.get_spans(rerun=selected_rerun)
+
+        # Per-rerun breakdown by category, then every span in call order
+        st.write("Time by category (top-level spans):")
+        category_df = pd.DataFrame(
+            [s for s in rerun_spans if s['depth'] == 0] or [{'category': '', 'duration': 0}]
+        ).groupby('category')['duration'].sum().mul(1000).round(2).rename('ms').reset_index()
+        st.dataframe(category_df)
+
+        st.write("Spans in this rerun:")
+        st.dataframe(pd.DataFrame([{
+            'span': '  ' * s['depth'] + s['name'],
+            'category': s['category'],
+            'ms': round(s['duration'] * 1000, 2),
+            'rows': s['rows']
+        } for s in sorted(rerun_spans, key=lambda s: s['start'])]))
+
+        st.write("Slowest database queries:")
+        st.dataframe(pd.DataFrame([{
+            'query': s['name'],
+            'ms': round(s['duration'] * 1000, 2),
+            'rows': s['rows'],
+            'rerun': s['rerun']
+        } for s in instrumentation.slowest(category='db')]))
+
+        st.write("Latency percentiles:")
+        st.dataframe(pd.DataFrame(instrumentation.summarize()).round(2))
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.download_button(
+                "📥 Spans (JSON)", instrumentation.to_json(),
+                file_name="downtime_spans.json", mime="application/json"
+            )
+        with col2:
+            st.download_button(
+                "📥 Chrome trace", instrumentation.to_chrome_trace(),
+                file_name="downtime_trace.json", mime="application/json"
+            )
+        with col3:
+            if st.button("Clear spans"):
+                instrumentation.clear()
+                st.rerun()
+    else:
+        st.info("No spans recorded yet. Interact with the app to record some.")
+
+
+views = {
+    "Data Entry": data_entry_view,
+    "View Records": records_view,
+    "Analytics": analytics_view,
+    "Shift Summary": shift_summary_view
+}
+if show_diagnostics:
+    views["Diagnostics"] = diagnostics_view
+
+active_view = st.radio("View", list(views), horizontal=True, key="active_view",
+                       label_visibility="collapsed")
+views[active_view]()
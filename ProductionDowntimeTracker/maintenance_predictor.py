@@ -1,88 +1,93 @@
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
+from instrumentation import traced
+from snapshot import as_snapshot
 
-def calculate_equipment_metrics(records):
-    """Calculate maintenance metrics for each equipment"""
-    if not records or len(records) == 0:
+METRIC_COLUMNS = [
+    'equipment', 'total_failures', 'total_downtime', 'avg_downtime',
+    'mtbf_days', 'next_predicted_failure', 'recommended_maintenance',
+    'failure_rate'
+]
+
+@traced(category='predictor')
+def calculate_equipment_metrics(records, window_days=None):
+    """Calculate maintenance metrics for each equipment in a single grouped pass.
+
+    records is a RecordSnapshot or a list of record tuples. window_days,
+    the observation window failure rates are measured over, defaults to
+    the span of the records' dates.
+    """
+    if records is None or len(records) == 0:
         return pd.DataFrame()
-    
-    # Create DataFrame with proper column names
-    columns = ['id', 'date', 'shift', 'line', 'start_time', 'end_time', 
-              'duration', 'equipment', 'issue_type', 'issue_description',
-              'action_taken', 'responsible_person', 'remarks', 'created_at']
-    df = pd.DataFrame(records, columns=columns)
-    
-    # Convert date to datetime
-    df['date'] = pd.to_datetime(df['date'])
-    
-    # Group by equipment
-    equipment_stats = []
-    
-    for equipment in df['equipment'].unique():
-        equip_data = df[df['equipment'] == equipment]
-        
-        # Sort by date
-        equip_data = equip_data.sort_values('date')
-        
-        # Calculate metrics
-        total_failures = len(equip_data)
-        total_downtime = equip_data['duration'].sum()
-        avg_downtime = equip_data['duration'].mean()
-        
-        # Calculate days between failures
-        if len(equip_data) > 1:
-            date_diffs = equip_data['date'].diff().dropna()
-            mtbf = date_diffs.mean().days
-            last_failure = equip_data['date'].max()
-            
-            # Predict next failure
-            next_predicted = last_failure + timedelta(days=mtbf)
-            
-            # Recommend maintenance before predicted failure
-            maintenance_date = next_predicted - timedelta(days=max(2, int(mtbf * 0.2)))
-        else:
-            mtbf = None
-            next_predicted = None
-            maintenance_date = None
-            
-        equipment_stats.append({
-            'equipment': equipment,
-            'total_failures': total_failures,
-            'total_downtime': total_downtime,
-            'avg_downtime': round(avg_downtime, 2) if not pd.isna(avg_downtime) else 0,
-            'mtbf_days': round(mtbf, 1) if mtbf else None,
-            'next_predicted_failure': next_predicted,
-            'recommended_maintenance': maintenance_date,
-            'failure_rate': round(total_failures / (
-                (df['date'].max() - df['date'].min()).days + 1
-            ) * 30, 2)  # failures per month
-        })
-    
-    return pd.DataFrame(equipment_stats)
-
-def get_maintenance_recommendations(records, days_threshold=7):
-    """Get maintenance recommendations for equipment"""
-    metrics_df = calculate_equipment_metrics(records)
-    
+
+    df = as_snapshot(records).frame[['date', 'duration', 'equipment']]
+
+    # Observation window shared by every equipment's failure rate
+    if window_days is None:
+        window_days = (df['date'].max() - df['date'].min()).days + 1
+
+    # sort=False keeps equipment in order of first appearance
+    stats = df.groupby('equipment', sort=False, observed=True).agg(
+        total_failures=('date', 'size'),
+        total_downtime=('duration', 'sum'),
+        avg_downtime=('duration', 'mean'),
+        first_failure=('date', 'min'),
+        last_failure=('date', 'max')
+    )
+
+    # The gaps between consecutive failures telescope, so their mean is the
+    # span between first and last failure divided by the number of gaps.
+    # Whole days are taken by flooring, as Timedelta.days does.
+    gaps = (stats['total_failures'] - 1).where(stats['total_failures'] > 1)
+    mean_gap = (stats['last_failure'] - stats['first_failure']) / gaps
+    mtbf = mean_gap.dt.days
+
+    mtbf_delta = pd.to_timedelta(mtbf, unit='D')
+    next_predicted = stats['last_failure'] + mtbf_delta
+
+    # Recommend maintenance before predicted failure
+    lead_days = (mtbf * 0.2).fillna(0).astype(int).clip(lower=2)
+    maintenance_date = next_predicted - pd.to_timedelta(lead_days, unit='D')
+
+    metrics = pd.DataFrame({
+        'equipment': stats.index.astype(object),
+        'total_failures': stats['total_failures'].values,
+        'total_downtime': stats['total_downtime'].values,
+        'avg_downtime': stats['avg_downtime'].round(2).fillna(0).values,
+        # An MTBF of zero days (repeat failures on one day) is not reported
+        'mtbf_days': mtbf.where(mtbf > 0).round(1).values,
+        'next_predicted_failure': next_predicted.values,
+        'recommended_maintenance': maintenance_date.values,
+        'failure_rate': (stats['total_failures'] / window_days * 30).round(2).values  # failures per month
+    }, columns=METRIC_COLUMNS)
+
+    return metrics
+
+@traced(category='predictor')
+def get_maintenance_recommendations(records=None, days_threshold=7, metrics_df=None):
+    """Get maintenance recommendations for equipment.
+
+    Pass metrics_df from calculate_equipment_metrics or the precomputed
+    Database.get_maintenance_predictions to reuse it instead of recomputing
+    the metrics from records.
+    """
+    if metrics_df is None:
+        metrics_df = calculate_equipment_metrics(records)
+
     if metrics_df.empty:
         return []
-    
+
     current_date = datetime.now()
-    recommendations = []
-    
-    for _, row in metrics_df.iterrows():
-        if pd.isna(row['recommended_maintenance']):
-            continue
-            
-        days_until_maintenance = (row['recommended_maintenance'] - current_date).days
-        
-        if days_until_maintenance <= days_threshold:
-            recommendations.append({
-                'equipment': row['equipment'],
-                'days_until_maintenance': days_until_maintenance,
-                'mtbf_days': row['mtbf_days'],
-                'failure_rate': row['failure_rate'],
-                'avg_downtime': row['avg_downtime']
-            })
-    
-    return sorted(recommendations, key=lambda x: x['days_until_maintenance'])
+
+    due = metrics_df[metrics_df['recommended_maintenance'].notna()].copy()
+    due['days_until_maintenance'] = (
+        pd.to_datetime(due['recommended_maintenance']) - current_date
+    ).dt.days
+    due = due[due['days_until_maintenance'] <= days_threshold]
+    due = due.sort_values('days_until_maintenance', kind='stable')
+
+    columns = ['equipment', 'days_until_maintenance', 'mtbf_days', 'failure_rate', 'avg_downtime']
+    # Predictions of partitioned records name each equipment's plant
+    if 'plant' in due:
+        columns.insert(0, 'plant')
+    return due[columns].to_dict('records')
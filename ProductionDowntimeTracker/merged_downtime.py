@@ -0,0 +1,160 @@
+import bisect
+from datetime import date, timedelta
+from intervals import from_minutes, sweep, to_minutes
+
+# Line downtime (minutes a line had at least one stop, overlapping stops
+# counted once) is kept per line and record date in line_downtime_daily, so
+# the KPI sums a few rows per day instead of sweeping every stop. A day's
+# row holds the minutes its stops cover that the line's earlier-dated stops
+# do not, so the rows from any first date add up to the merged downtime
+# from that date less what its stops share with earlier-dated ones. That
+# share lies within the hours the earlier stops reach past the first date
+# (last_end), and is measured from the stops there.
+#
+# Triggers append the date and end of every changed stop to
+# line_downtime_dirty. A stop only changes the rows of its own date up to
+# the date it ends on, so refresh_line_downtime recomputes just those
+# dates, reading the stops through Database (archived ones included). A
+# dirty row without a date, added by the migration, rebuilds every row.
+
+# Records without a line are kept under '', like the rollup's members
+NO_LINE = ''
+
+
+class _Coverage:
+    """Disjoint (start, end) minute intervals, merged as stops are added"""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def add(self, start, end):
+        """Add a stop; returns the minutes it covers that were not covered yet"""
+        if end <= start:
+            return 0
+        # The intervals overlapping or touching [start, end)
+        low = bisect.bisect_left(self.ends, start)
+        high = bisect.bisect_right(self.starts, end)
+        added = end - start - sum(max(0, min(e, end) - max(s, start))
+                                  for s, e in zip(self.starts[low:high], self.ends[low:high]))
+        if low < high:
+            start, end = min(start, self.starts[low]), max(end, self.ends[high - 1])
+        self.starts[low:high] = [start]
+        self.ends[low:high] = [end]
+        return added
+
+
+def daily_downtime(stops, first_date=None):
+    """{(line, date): (downtime, last_end)} of the dates from first_date on.
+
+    stops are (line, date, start, end) rows; those dated before first_date
+    only count as covered time.
+    """
+    window = to_minutes(f'{first_date} 00:00') if first_date else None
+    coverage = {}
+    days = {}
+    for line, stop_date, start, end in sorted(stops, key=lambda stop: (stop[1] or '', stop[2], stop[3])):
+        line = NO_LINE if line is None else line
+        covered = coverage.setdefault(line, _Coverage())
+        if first_date and (stop_date or '') < first_date:
+            covered.add(max(start, window), end)
+            continue
+        added = covered.add(start, end)
+        downtime, last_end = days.get((line, stop_date), (0, end))
+        days[(line, stop_date)] = (downtime + added, max(last_end, end))
+    return days
+
+
+def _dirty_ranges(entries):
+    """Merge dirty (date, end_minute) entries into [first, last] date ranges to recompute"""
+    ranges = []
+    for stop_date, end_minute in sorted(entries, key=lambda entry: entry[0]):
+        last = stop_date
+        if end_minute is not None:
+            last = max(last, from_minutes(end_minute - 1)[:10])
+        if ranges and stop_date <= (date.fromisoformat(ranges[-1][1]) + timedelta(days=1)).isoformat():
+            ranges[-1][1] = max(ranges[-1][1], last)
+        else:
+            ranges.append([stop_date, last])
+    return ranges
+
+
+def refresh_line_downtime(db):
+    """Recompute the line_downtime_daily rows of the stops changed since the last refresh.
+
+    Returns True once the rows are current, or False if they are stale and
+    db is read-only.
+    """
+    conn = db.conn
+    seen = conn.execute('SELECT MAX(rowid) FROM line_downtime_dirty').fetchone()[0]
+    if seen is None:
+        return True
+    if db.connections.read_only:
+        return False
+    entries = conn.execute(
+        'SELECT date, end_minute FROM line_downtime_dirty WHERE rowid <= ?', (seen,)
+    ).fetchall()
+    if any(stop_date is None for stop_date, _ in entries):
+        ranges = [(None, None)]
+    else:
+        ranges = _dirty_ranges(entries)
+
+    recomputed = []
+    for first, last in ranges:
+        stops = db.get_dated_intervals(start=f'{first} 00:00' if first else None, end_date=last)
+        recomputed.append((first, last, daily_downtime(
+            [(line, stop_date, start, end) for line, start, end, _, _, stop_date in stops], first
+        )))
+
+    def write(cursor):
+        consumed = cursor.execute(
+            'SELECT COUNT(*) FROM line_downtime_dirty WHERE rowid <= ?', (seen,)
+        ).fetchone()[0]
+        if consumed != len(entries):
+            # Another refresh got there first, from records at least as new
+            return
+        for first, last, days in recomputed:
+            if first is None:
+                cursor.execute('DELETE FROM line_downtime_daily')
+            else:
+                cursor.execute('DELETE FROM line_downtime_daily WHERE date >= ? AND date <= ?',
+                               (first, last))
+            cursor.executemany('''
+                INSERT INTO line_downtime_daily (line, date, downtime, last_end) VALUES (?, ?, ?, ?)
+            ''', [(line, stop_date, downtime, last_end)
+                  for (line, stop_date), (downtime, last_end) in days.items()])
+        cursor.execute('DELETE FROM line_downtime_dirty WHERE rowid <= ?', (seen,))
+
+    db.connections.write(write)
+    return True
+
+
+def line_downtime_total(db, start_date=None, end_date=None, line=None):
+    """Merged downtime of the lines from a current line_downtime_daily (see the comment above)"""
+    conn = db.conn
+    where, params = db.build_filters(start_date=start_date, end_date=end_date, line=line)
+    total = conn.execute(
+        f'SELECT COALESCE(SUM(downtime), 0) FROM line_downtime_daily {where}', params
+    ).fetchone()[0]
+    if not start_date:
+        return total
+
+    first = str(start_date)[:10]
+    before = (date.fromisoformat(first) - timedelta(days=1)).isoformat()
+    where, params = db.build_filters(end_date=before, line=line)
+    reach = conn.execute(f'SELECT MAX(last_end) FROM line_downtime_daily {where}', params).fetchone()[0]
+    window = to_minutes(f'{first} 00:00')
+    if reach is None or reach <= window:
+        return total
+
+    # Add back the minutes the range's stops share with earlier-dated ones,
+    # all of which fall between the first date and reach
+    pieces = {}
+    for stop_line, start, end, _, _, stop_date in db.get_dated_intervals(
+            start=from_minutes(window), end=from_minutes(reach), end_date=end_date, line=line):
+        later, earlier = pieces.setdefault(stop_line, ([], []))
+        clipped = (max(start, window), min(end, reach))
+        (later if stop_date >= first else earlier).append(clipped)
+    for later, earlier in pieces.values():
+        total += sweep(later)[0] + sweep(earlier)[0] - sweep(later + earlier)[0]
+    return total
@@ -0,0 +1,781 @@
+import re
+import sqlite3
+import sys
+from dimensions import DIMENSION_COLUMNS, DIMENSION_TABLES, ROLLUP_TRIGGER_GUARD, fold_spelling_variants
+from failure_stats import rebuild_stats
+from intervals import ended_at_sql, minutes_sql, started_at_sql
+
+# Each migration is (version, description, function). The function receives a
+# cursor inside an open transaction; the runner records the version in
+# PRAGMA user_version in the same transaction, so a failed step leaves the
+# database on the previous version.
+
+# trigger_guards rows (see _add_trigger_guards) that switch off the insert
+# triggers bulk_import maintains itself once per batch, and the delete
+# triggers that would take an archived record out of the aggregates
+# retention keeps
+BULK_INSERT_GUARD = 'bulk_insert'
+ARCHIVE_GUARD = 'archive'
+
+
+def _create_downtime_records(cursor):
+    # IF NOT EXISTS adopts databases created before versioning was introduced
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS downtime_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date DATE,
+            shift TEXT,
+            line TEXT,
+            start_time TEXT,
+            end_time TEXT,
+            duration INTEGER,
+            equipment TEXT,
+            issue_type TEXT,
+            issue_description TEXT,
+            action_taken TEXT,
+            responsible_person TEXT,
+            remarks TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _add_downtime_indexes(cursor):
+    # Date-ordered browsing, daily totals and the shift summary filter
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_downtime_date_line_shift
+        ON downtime_records (date, line, shift, duration)
+    ''')
+    # Equipment Pareto and per-equipment failure history
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_downtime_equipment_date
+        ON downtime_records (equipment, date, duration)
+    ''')
+    # Issue type Pareto
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_downtime_issue_type_date
+        ON downtime_records (issue_type, date, duration)
+    ''')
+    cursor.execute('ANALYZE downtime_records')
+
+
+def _create_downtime_rollup(cursor):
+    # Incident count and summed duration per (date, line, shift, equipment,
+    # issue_type), maintained by triggers. Keys are stored with NULL as ''
+    # so every record lands in exactly one rollup row.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS downtime_rollup (
+            date DATE NOT NULL,
+            line TEXT NOT NULL,
+            shift TEXT NOT NULL,
+            equipment TEXT NOT NULL,
+            issue_type TEXT NOT NULL,
+            incidents INTEGER NOT NULL,
+            total_duration INTEGER NOT NULL,
+            PRIMARY KEY (date, line, shift, equipment, issue_type)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_downtime_rollup_insert
+        AFTER INSERT ON downtime_records
+        BEGIN
+            INSERT INTO downtime_rollup
+                (date, line, shift, equipment, issue_type, incidents, total_duration)
+            VALUES (IFNULL(NEW.date, ''), IFNULL(NEW.line, ''), IFNULL(NEW.shift, ''),
+                    IFNULL(NEW.equipment, ''), IFNULL(NEW.issue_type, ''),
+                    1, IFNULL(NEW.duration, 0))
+            ON CONFLICT (date, line, shift, equipment, issue_type) DO UPDATE SET
+                incidents = incidents + 1,
+                total_duration = total_duration + excluded.total_duration;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_downtime_rollup_delete
+        AFTER DELETE ON downtime_records
+        BEGIN
+            UPDATE downtime_rollup SET
+                incidents = incidents - 1,
+                total_duration = total_duration - IFNULL(OLD.duration, 0)
+            WHERE date = IFNULL(OLD.date, '') AND line = IFNULL(OLD.line, '')
+              AND shift = IFNULL(OLD.shift, '') AND equipment = IFNULL(OLD.equipment, '')
+              AND issue_type = IFNULL(OLD.issue_type, '');
+            DELETE FROM downtime_rollup
+            WHERE date = IFNULL(OLD.date, '') AND line = IFNULL(OLD.line, '')
+              AND shift = IFNULL(OLD.shift, '') AND equipment = IFNULL(OLD.equipment, '')
+              AND issue_type = IFNULL(OLD.issue_type, '') AND incidents <= 0;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_downtime_rollup_update
+        AFTER UPDATE OF date, line, shift, equipment, issue_type, duration ON downtime_records
+        BEGIN
+            UPDATE downtime_rollup SET
+                incidents = incidents - 1,
+                total_duration = total_duration - IFNULL(OLD.duration, 0)
+            WHERE date = IFNULL(OLD.date, '') AND line = IFNULL(OLD.line, '')
+              AND shift = IFNULL(OLD.shift, '') AND equipment = IFNULL(OLD.equipment, '')
+              AND issue_type = IFNULL(OLD.issue_type, '');
+            DELETE FROM downtime_rollup
+            WHERE date = IFNULL(OLD.date, '') AND line = IFNULL(OLD.line, '')
+              AND shift = IFNULL(OLD.shift, '') AND equipment = IFNULL(OLD.equipment, '')
+              AND issue_type = IFNULL(OLD.issue_type, '') AND incidents <= 0;
+            INSERT INTO downtime_rollup
+                (date, line, shift, equipment, issue_type, incidents, total_duration)
+            VALUES (IFNULL(NEW.date, ''), IFNULL(NEW.line, ''), IFNULL(NEW.shift, ''),
+                    IFNULL(NEW.equipment, ''), IFNULL(NEW.issue_type, ''),
+                    1, IFNULL(NEW.duration, 0))
+            ON CONFLICT (date, line, shift, equipment, issue_type) DO UPDATE SET
+                incidents = incidents + 1,
+                total_duration = total_duration + excluded.total_duration;
+        END
+    ''')
+    # Backfill from the existing records
+    cursor.execute('DELETE FROM downtime_rollup')
+    cursor.execute('''
+        INSERT INTO downtime_rollup
+            (date, line, shift, equipment, issue_type, incidents, total_duration)
+        SELECT IFNULL(date, ''), IFNULL(line, ''), IFNULL(shift, ''),
+               IFNULL(equipment, ''), IFNULL(issue_type, ''),
+               COUNT(*), IFNULL(SUM(duration), 0)
+        FROM downtime_records
+        GROUP BY 1, 2, 3, 4, 5
+    ''')
+
+
+def _create_downtime_search(cursor):
+    # External-content FTS5 index over the free-text columns; rowid is the
+    # record id, so matches join straight back to downtime_records.
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS downtime_search USING fts5(
+            issue_description, action_taken, remarks, equipment, responsible_person,
+            content='downtime_records', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_downtime_search_insert
+        AFTER INSERT ON downtime_records
+        BEGIN
+            INSERT INTO downtime_search
+                (rowid, issue_description, action_taken, remarks, equipment, responsible_person)
+            VALUES (NEW.id, NEW.issue_description, NEW.action_taken, NEW.remarks,
+                    NEW.equipment, NEW.responsible_person);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_downtime_search_delete
+        AFTER DELETE ON downtime_records
+        BEGIN
+            INSERT INTO downtime_search
+                (downtime_search, rowid, issue_description, action_taken, remarks,
+                 equipment, responsible_person)
+            VALUES ('delete', OLD.id, OLD.issue_description, OLD.action_taken, OLD.remarks,
+                    OLD.equipment, OLD.responsible_person);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_downtime_search_update
+        AFTER UPDATE OF issue_description, action_taken, remarks, equipment,
+                        responsible_person ON downtime_records
+        BEGIN
+            INSERT INTO downtime_search
+                (downtime_search, rowid, issue_description, action_taken, remarks,
+                 equipment, responsible_person)
+            VALUES ('delete', OLD.id, OLD.issue_description, OLD.action_taken, OLD.remarks,
+                    OLD.equipment, OLD.responsible_person);
+            INSERT INTO downtime_search
+                (rowid, issue_description, action_taken, remarks, equipment, responsible_person)
+            VALUES (NEW.id, NEW.issue_description, NEW.action_taken, NEW.remarks,
+                    NEW.equipment, NEW.responsible_person);
+        END
+    ''')
+    # Index the existing records
+    cursor.execute("INSERT INTO downtime_search (downtime_search) VALUES ('rebuild')")
+
+
+def _add_browse_index(cursor):
+    # The implicit rowid suffix makes this serve ORDER BY date DESC, id DESC
+    # and the (date, id) keyset predicate of the record browser
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_downtime_date_id
+        ON downtime_records (date)
+    ''')
+
+
+def _create_maintenance_predictions(cursor):
+    # Precomputed reliability metrics per equipment, written by the
+    # prediction scheduler. version is the prediction_runs entry that last
+    # computed the row.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_predictions (
+            equipment TEXT PRIMARY KEY,
+            total_failures INTEGER NOT NULL,
+            total_downtime INTEGER NOT NULL,
+            avg_downtime REAL NOT NULL,
+            mtbf_days REAL,
+            next_predicted_failure DATE,
+            recommended_maintenance DATE,
+            failure_rate REAL NOT NULL,
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS prediction_runs (
+            version INTEGER PRIMARY KEY,
+            computed_at TIMESTAMP NOT NULL,
+            window_start DATE,
+            window_end DATE,
+            equipment_updated INTEGER NOT NULL,
+            full_refresh INTEGER NOT NULL
+        )
+    ''')
+    # Equipment whose records changed since the last run, appended by
+    # triggers and consumed by the scheduler up to the rowid it has seen
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_dirty (
+            equipment TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_maintenance_dirty_insert
+        AFTER INSERT ON downtime_records
+        BEGIN
+            INSERT INTO maintenance_dirty (equipment) VALUES (NEW.equipment);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_maintenance_dirty_delete
+        AFTER DELETE ON downtime_records
+        BEGIN
+            INSERT INTO maintenance_dirty (equipment) VALUES (OLD.equipment);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_maintenance_dirty_update
+        AFTER UPDATE OF date, equipment, duration ON downtime_records
+        BEGIN
+            INSERT INTO maintenance_dirty (equipment) VALUES (OLD.equipment), (NEW.equipment);
+        END
+    ''')
+
+
+def _create_ingest_keys(cursor):
+    # Idempotency keys of events posted to the ingestion API, so a retried
+    # request returns the record created the first time
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_keys (
+            key TEXT PRIMARY KEY,
+            record_id INTEGER NOT NULL,
+            received_at TIMESTAMP NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ingest_keys_received_at
+        ON ingest_keys (received_at)
+    ''')
+
+
+def _create_archive_segments(cursor):
+    # The Parquet file holding each archived month (see archive.py). The
+    # records' rollup rows are kept when they are archived.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive_segments (
+            period TEXT PRIMARY KEY,
+            file TEXT NOT NULL,
+            first_date DATE NOT NULL,
+            last_date DATE NOT NULL,
+            records INTEGER NOT NULL,
+            archived_at TIMESTAMP NOT NULL
+        )
+    ''')
+
+
+ROLLUP_KEYS = 'date, line_id, shift_id, equipment_id, issue_type_id'
+
+
+def _rollup_key_values(row):
+    # The rollup key of a NEW or OLD record, looked up by member name
+    members = ', '.join(
+        f"(SELECT id FROM {DIMENSION_TABLES[column]} WHERE name = IFNULL({row}.{column}, ''))"
+        for column in DIMENSION_COLUMNS
+    )
+    return f"IFNULL({row}.date, ''), {members}"
+
+
+def _rollup_trigger_steps():
+    # (add_members, add_new, remove_old) statements of the id-keyed rollup
+    # triggers. Records inserted without going through dimensions.canonicalize_rows
+    # still get a member under their own spelling
+    add_members = '\n'.join(
+        f"INSERT OR IGNORE INTO {DIMENSION_TABLES[column]} (name) VALUES (IFNULL(NEW.{column}, ''));"
+        for column in DIMENSION_COLUMNS
+    )
+    add_new = f'''
+            INSERT INTO downtime_rollup ({ROLLUP_KEYS}, incidents, total_duration)
+            VALUES ({_rollup_key_values('NEW')}, 1, IFNULL(NEW.duration, 0))
+            ON CONFLICT ({ROLLUP_KEYS}) DO UPDATE SET
+                incidents = incidents + 1,
+                total_duration = total_duration + excluded.total_duration;
+    '''
+    remove_old = f'''
+            UPDATE downtime_rollup SET
+                incidents = incidents - 1,
+                total_duration = total_duration - IFNULL(OLD.duration, 0)
+            WHERE ({ROLLUP_KEYS}) = ({_rollup_key_values('OLD')});
+            DELETE FROM downtime_rollup
+            WHERE ({ROLLUP_KEYS}) = ({_rollup_key_values('OLD')}) AND incidents <= 0;
+    '''
+    return add_members, add_new, remove_old
+
+
+def _create_dimensions(cursor):
+    # Lines, shifts, equipment and issue types interned with integer ids,
+    # with every spelling seen mapped to its member by alias key (see
+    # dimensions.py). downtime_rollup is rebuilt keyed by the ids; the
+    # records keep the canonical names, which search, the archive and the
+    # record readers use.
+    for table in DIMENSION_TABLES.values():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+        ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dimension_aliases (
+            dimension TEXT NOT NULL,
+            alias_key TEXT NOT NULL,
+            member_id INTEGER NOT NULL,
+            PRIMARY KEY (dimension, alias_key)
+        ) WITHOUT ROWID
+    ''')
+
+    # The name-keyed rollup also counts archived records, so it is
+    # converted rather than recomputed from downtime_records
+    for name in ('trg_downtime_rollup_insert', 'trg_downtime_rollup_delete',
+                 'trg_downtime_rollup_update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    cursor.execute('ALTER TABLE downtime_rollup RENAME TO downtime_rollup_by_name')
+    members = fold_spelling_variants(cursor, 'downtime_rollup_by_name')
+    cursor.execute('''
+        CREATE TEMP TABLE rollup_members (dimension TEXT, name TEXT, member_id INTEGER)
+    ''')
+    cursor.executemany(
+        'INSERT INTO temp.rollup_members VALUES (?, ?, ?)',
+        [(column, name, member_id) for column, names in members.items()
+         for name, member_id in names.items()]
+    )
+
+    cursor.execute(f'''
+        CREATE TABLE downtime_rollup (
+            date DATE NOT NULL,
+            line_id INTEGER NOT NULL,
+            shift_id INTEGER NOT NULL,
+            equipment_id INTEGER NOT NULL,
+            issue_type_id INTEGER NOT NULL,
+            incidents INTEGER NOT NULL,
+            total_duration INTEGER NOT NULL,
+            PRIMARY KEY ({ROLLUP_KEYS})
+        ) WITHOUT ROWID
+    ''')
+    joins = ' '.join(
+        f"JOIN temp.rollup_members m_{column} ON m_{column}.dimension = '{column}' "
+        f"AND m_{column}.name = r.{column}"
+        for column in DIMENSION_COLUMNS
+    )
+    cursor.execute(f'''
+        INSERT INTO downtime_rollup ({ROLLUP_KEYS}, incidents, total_duration)
+        SELECT r.date, {', '.join(f'm_{column}.member_id' for column in DIMENSION_COLUMNS)},
+               SUM(r.incidents), SUM(r.total_duration)
+        FROM downtime_rollup_by_name r {joins}
+        GROUP BY 1, 2, 3, 4, 5
+    ''')
+    cursor.execute('DROP TABLE downtime_rollup_by_name')
+    cursor.execute('DROP TABLE temp.rollup_members')
+
+    add_members, add_new, remove_old = _rollup_trigger_steps()
+    cursor.execute(f'''
+        CREATE TRIGGER trg_downtime_rollup_insert
+        AFTER INSERT ON downtime_records
+        BEGIN
+            {add_members}
+            {add_new}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_downtime_rollup_delete
+        AFTER DELETE ON downtime_records
+        BEGIN
+            {remove_old}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_downtime_rollup_update
+        AFTER UPDATE OF date, line, shift, equipment, issue_type, duration ON downtime_records
+        BEGIN
+            {remove_old}
+            {add_members}
+            {add_new}
+        END
+    ''')
+
+
+def _add_event_timestamps(cursor):
+    # Absolute start and end of each stop (see intervals.py), derived from
+    # the date, shift, start time and duration by the triggers, and an
+    # R*Tree over their minutes for overlap queries. The shift that runs
+    # past midnight is written into the triggers.
+    cursor.execute('ALTER TABLE downtime_records ADD COLUMN started_at TEXT')
+    cursor.execute('ALTER TABLE downtime_records ADD COLUMN ended_at TEXT')
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS downtime_intervals
+        USING rtree_i32(id, start_minute, end_minute)
+    ''')
+    set_timestamps = f'''
+            UPDATE downtime_records SET
+                started_at = {started_at_sql('NEW')},
+                ended_at = {ended_at_sql('NEW')}
+            WHERE id = NEW.id;
+    '''
+    index_interval = f'''
+            INSERT INTO downtime_intervals (id, start_minute, end_minute)
+            SELECT id, {minutes_sql('started_at')}, {minutes_sql('ended_at')}
+            FROM downtime_records WHERE id = NEW.id AND started_at IS NOT NULL;
+    '''
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_downtime_interval_insert
+        AFTER INSERT ON downtime_records
+        BEGIN
+            {set_timestamps}
+            {index_interval}
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_downtime_interval_delete
+        AFTER DELETE ON downtime_records
+        BEGIN
+            DELETE FROM downtime_intervals WHERE id = OLD.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_downtime_interval_update
+        AFTER UPDATE OF date, shift, start_time, duration ON downtime_records
+        BEGIN
+            DELETE FROM downtime_intervals WHERE id = OLD.id;
+            {set_timestamps}
+            {index_interval}
+        END
+    ''')
+    # Backfill from the existing records
+    cursor.execute(f'''
+        UPDATE downtime_records SET
+            started_at = {started_at_sql('downtime_records')},
+            ended_at = {ended_at_sql('downtime_records')}
+    ''')
+    cursor.execute(f'''
+        INSERT INTO downtime_intervals (id, start_minute, end_minute)
+        SELECT id, {minutes_sql('started_at')}, {minutes_sql('ended_at')}
+        FROM downtime_records WHERE started_at IS NOT NULL
+    ''')
+
+
+def _create_equipment_failure_stats(cursor):
+    # Running failure statistics per equipment, maintained by the write
+    # paths (see failure_stats.py). The index finds a failure's neighbours
+    # in time when a record is inserted or deleted.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS equipment_failure_stats (
+            equipment TEXT PRIMARY KEY,
+            failures INTEGER NOT NULL,
+            duration_mean REAL NOT NULL,
+            duration_m2 REAL NOT NULL,
+            gap_mean REAL NOT NULL,
+            gap_m2 REAL NOT NULL,
+            rate REAL NOT NULL,
+            rate_at INTEGER
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_downtime_equipment_started
+        ON downtime_records (equipment, started_at)
+    ''')
+    rebuild_stats(cursor)
+
+
+def _add_trigger_guards(cursor):
+    # A row in trigger_guards switches a trigger off for the rest of the
+    # transaction that inserted it, without dropping the trigger (see
+    # dimensions.merge_member, which moves rollup rows itself)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS trigger_guards (
+            name TEXT PRIMARY KEY
+        ) WITHOUT ROWID
+    ''')
+    add_members, add_new, remove_old = _rollup_trigger_steps()
+    cursor.execute('DROP TRIGGER IF EXISTS trg_downtime_rollup_update')
+    cursor.execute(f'''
+        CREATE TRIGGER trg_downtime_rollup_update
+        AFTER UPDATE OF date, line, shift, equipment, issue_type, duration ON downtime_records
+        WHEN NOT EXISTS (SELECT 1 FROM trigger_guards WHERE name = '{ROLLUP_TRIGGER_GUARD}')
+        BEGIN
+            {remove_old}
+            {add_members}
+            {add_new}
+        END
+    ''')
+
+
+def _create_line_downtime(cursor):
+    # Merged downtime per line and record date (see merged_downtime.py),
+    # recomputed from the dates triggers append to line_downtime_dirty. The
+    # rows also cover archived records, which a migration cannot read, so
+    # the first refresh builds them (a dirty row without a date).
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS line_downtime_daily (
+            date DATE NOT NULL,
+            line TEXT NOT NULL,
+            downtime INTEGER NOT NULL,
+            last_end INTEGER NOT NULL,
+            PRIMARY KEY (date, line)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS line_downtime_dirty (
+            date DATE,
+            end_minute INTEGER
+        )
+    ''')
+    add_new = f'''
+            INSERT INTO line_downtime_dirty (date, end_minute)
+            SELECT NEW.date, {minutes_sql(ended_at_sql('NEW'))}
+            WHERE {started_at_sql('NEW')} IS NOT NULL;
+    '''
+    add_old = f'''
+            INSERT INTO line_downtime_dirty (date, end_minute)
+            SELECT OLD.date, {minutes_sql('OLD.ended_at')}
+            WHERE OLD.ended_at IS NOT NULL;
+    '''
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_line_downtime_dirty_insert
+        AFTER INSERT ON downtime_records
+        BEGIN
+            {add_new}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_line_downtime_dirty_delete
+        AFTER DELETE ON downtime_records
+        BEGIN
+            {add_old}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_line_downtime_dirty_update
+        AFTER UPDATE OF date, shift, line, start_time, duration ON downtime_records
+        BEGIN
+            {add_old}
+            {add_new}
+        END
+    ''')
+    cursor.execute('INSERT INTO line_downtime_dirty (date, end_minute) VALUES (NULL, NULL)')
+
+
+def _guard_trigger(cursor, name, guard):
+    """Recreate a trigger from its stored SQL, switched off while guard is in trigger_guards"""
+    sql, = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                          (name,)).fetchone()
+    cursor.execute(f'DROP TRIGGER {name}')
+    cursor.execute(re.sub(
+        r'\bBEGIN\b', f"WHEN NOT EXISTS (SELECT 1 FROM trigger_guards WHERE name = '{guard}')\n"
+        '        BEGIN', sql, count=1
+    ))
+
+
+def _guard_bulk_and_archive_triggers(cursor):
+    # bulk_import and retention used to drop these triggers for the length
+    # of a transaction, which rewrites the schema twice per batch and
+    # invalidates every other connection's prepared statements
+    for name in ('trg_downtime_rollup_insert', 'trg_downtime_search_insert',
+                 'trg_maintenance_dirty_insert', 'trg_downtime_interval_insert',
+                 'trg_line_downtime_dirty_insert'):
+        _guard_trigger(cursor, name, BULK_INSERT_GUARD)
+    for name in ('trg_downtime_rollup_delete', 'trg_maintenance_dirty_delete',
+                 'trg_line_downtime_dirty_delete'):
+        _guard_trigger(cursor, name, ARCHIVE_GUARD)
+
+
+MIGRATIONS = [
+    (1, 'Create downtime_records', _create_downtime_records),
+    (2, 'Index downtime_records by date, equipment and issue type', _add_downtime_indexes),
+    (3, 'Add trigger-maintained downtime_rollup', _create_downtime_rollup),
+    (4, 'Add FTS5 search over record free text', _create_downtime_search),
+    (5, 'Index downtime_records for keyset browsing', _add_browse_index),
+    (6, 'Add precomputed maintenance_predictions', _create_maintenance_predictions),
+    (7, 'Add idempotency keys for the ingestion API', _create_ingest_keys),
+    (8, 'Add archive_segments for archived records', _create_archive_segments),
+    (9, 'Intern dimension names and key downtime_rollup by their ids', _create_dimensions),
+    (10, 'Add absolute event timestamps and an interval index', _add_event_timestamps),
+    (11, 'Add running per-equipment failure statistics', _create_equipment_failure_stats),
+    (12, 'Guard the rollup update trigger instead of dropping it', _add_trigger_guards),
+    (13, 'Add merged line downtime per date', _create_line_downtime),
+    (14, 'Guard the bulk insert and archive delete triggers', _guard_bulk_and_archive_triggers),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, target_version=None):
+    """Apply pending migrations up to target_version (latest by default).
+
+    Returns the list of versions that were applied.
+    """
+    if target_version is None:
+        target_version = LATEST_VERSION
+
+    current_version = get_schema_version(conn)
+    if current_version > LATEST_VERSION:
+        raise RuntimeError(
+            f"Database schema version {current_version} is newer than "
+            f"this application supports ({LATEST_VERSION})"
+        )
+
+    applied = []
+    for version, description, apply in MIGRATIONS:
+        if version <= current_version or version > target_version:
+            continue
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN')
+            apply(cursor)
+            cursor.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+
+    return applied
+
+
+# Queries issued by Database and the shift summary, used to check that the
+# indexes remove full table scans and temporary sort trees. The Pareto
+# queries' ORDER BY on the aggregate only sorts the grouped rows, so it is
+# left out here.
+HOT_QUERIES = {
+    'records by date': (
+        'SELECT * FROM downtime_records ORDER BY date DESC', ()
+    ),
+    'daily downtime': (
+        'SELECT date, SUM(duration), COUNT(*) FROM downtime_records '
+        'WHERE date >= ? AND date <= ? GROUP BY date ORDER BY date',
+        ('2025-01-01', '2025-01-31')
+    ),
+    'equipment stats': (
+        'SELECT equipment, COUNT(*), SUM(duration) FROM downtime_records '
+        'GROUP BY equipment', ()
+    ),
+    'issue type stats': (
+        'SELECT issue_type, COUNT(*), SUM(duration) FROM downtime_records '
+        'GROUP BY issue_type', ()
+    ),
+    'equipment history': (
+        'SELECT date, duration FROM downtime_records '
+        'WHERE equipment = ? ORDER BY date', ('Mixer',)
+    ),
+    'record page': (
+        'SELECT id, date, equipment FROM downtime_records '
+        'WHERE (date, id) < (?, ?) '
+        'ORDER BY date DESC, id DESC LIMIT 50',
+        ('2025-01-01', 100)
+    ),
+    'shift summary': (
+        'SELECT * FROM downtime_records '
+        'WHERE date = ? AND line = ? AND shift = ? AND duration >= 10',
+        ('2025-01-01', 'Line 1', 'Morning')
+    ),
+    'shift summaries for a date': (
+        'SELECT line, shift, equipment, duration, issue_description FROM downtime_records '
+        'WHERE date = ? ORDER BY line, shift',
+        ('2025-01-01',)
+    ),
+}
+
+
+def explain_query_plan(conn, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for a query"""
+    rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def plan_has_full_scan(plan):
+    """True if the plan scans the table without an index or sorts in a temp tree"""
+    for detail in plan:
+        if detail.startswith('SCAN downtime_records') and 'INDEX' not in detail:
+            return True
+        if 'USE TEMP B-TREE' in detail:
+            return True
+    return False
+
+
+def check_query_plans(conn):
+    """Explain every hot query; returns {name: (plan, has_full_scan)}"""
+    results = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = explain_query_plan(conn, sql, params)
+        results[name] = (plan, plan_has_full_scan(plan))
+    return results
+
+
+def compare_query_plans():
+    """Explain the hot queries on the unindexed and the latest schema.
+
+    Returns (before, after) as produced by check_query_plans.
+    """
+    conn = sqlite3.connect(':memory:')
+    migrate(conn, target_version=1)
+    before = check_query_plans(conn)
+    migrate(conn)
+    after = check_query_plans(conn)
+    conn.close()
+    return before, after
+
+
+def main(argv=None):
+    """Upgrade a database file in place, or print the query plan comparison.
+
+    Usage: python migrations.py [downtime.db]
+           python migrations.py --check-plans
+    """
+    argv = sys.argv[1:] if argv is None else argv
+
+    if argv and argv[0] == '--check-plans':
+        before, after = compare_query_plans()
+        failed = False
+        for name in HOT_QUERIES:
+            print(f"{name}:")
+            print(f"  before: {'; '.join(before[name][0])}")
+            print(f"  after:  {'; '.join(after[name][0])}")
+            if after[name][1]:
+                failed = True
+                print("  ! still scans or sorts without an index")
+        return 1 if failed else 0
+
+    db_path = argv[0] if argv else 'downtime.db'
+    conn = sqlite3.connect(db_path)
+    old_version = get_schema_version(conn)
+    applied = migrate(conn)
+    conn.close()
+    if applied:
+        print(f"Upgraded {db_path} from version {old_version} to {applied[-1]}")
+    else:
+        print(f"{db_path} is already at version {old_version}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,817 @@
+import argparse
+import contextlib
+import heapq
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+import pandas as pd
+from archive import RecordArchive, archive_path_for
+from bulk_import import IMPORT_COLUMNS, RowError, load_rows, normalize_row
+from cache import SnapshotCache, make_key
+from connection import DEFAULT_BUSY_TIMEOUT
+from database import Database, RECORD_COLUMNS
+from dimensions import DIMENSION_TABLES, fold_top_n
+from failure_stats import merge_stats, rate_alerts
+from intervals import from_minutes, shift_availability, shift_windows, sweep, to_minutes
+from maintenance_predictor import METRIC_COLUMNS
+from migrations import migrate
+from retention import archive_records
+from snapshot import RecordSnapshot, concat_frames
+
+# Records split across one SQLite file per plant and period, laid out as
+# root/<plant>/<period>.db where the period is a year (2024) or a month
+# (2024-03). Every partition is a complete Database with its own rollups,
+# search index and snapshot cache, opened the first time a query or write
+# needs it. At most max_open partitions stay open; the least recently used
+# one that no query is reading is closed when another has to be opened.
+# Queries only open the partitions whose plant and period can match the
+# filters, and aggregates are merged from the per-partition results, which
+# each partition caches until its own data changes.
+#
+# PartitionedDatabase answers the same calls as Database, so the app and
+# the command line tools take either (see open_database). Record ids are
+# only unique within a partition, so its records carry 'plant/period/id'
+# keys in place of ids. root/partitions.json records the scheme, and each
+# plant's maintenance predictions are kept in root/<plant>/predictions.db
+# (see predictions.py).
+
+PARTITION_SCHEMES = {'year': 4, 'month': 7}
+
+DEFAULT_MAX_OPEN = 16
+
+# Columns copied when splitting a database: the imported ones and created_at
+SPLIT_COLUMNS = IMPORT_COLUMNS + ['created_at']
+
+DEFAULT_PLANT = 'main'
+
+LAYOUT_FILE = 'partitions.json'
+PREDICTIONS_FILE = 'predictions.db'
+
+# Above any record id, for keyset comparisons that take a whole date
+MAX_RECORD_ID = 2 ** 63 - 1
+
+PLANT_PATTERN = re.compile(r'^[\w.-]+$')
+PERIOD_PATTERNS = {
+    'year': re.compile(r'^(\d{4})\.db$'),
+    'month': re.compile(r'^(\d{4}-\d{2})\.db$'),
+}
+KEY_PATTERN = re.compile(r'^([\w.-]+)/(\d{4}(?:-\d{2})?)/(\d+)$')
+
+
+def partition_period(record_date, scheme='year'):
+    """Return the period a 'YYYY-MM-DD' date belongs to under scheme"""
+    record_date = str(record_date)
+    if not re.match(r'^\d{4}-\d{2}-\d{2}', record_date):
+        raise ValueError(f"Expected a YYYY-MM-DD date, got {record_date!r}")
+    return record_date[:PARTITION_SCHEMES[scheme]]
+
+
+def period_overlaps(period, start_date=None, end_date=None):
+    """Whether any date in period can fall within the inclusive date bounds"""
+    if start_date and str(start_date)[:len(period)] > period:
+        return False
+    if end_date and str(end_date)[:len(period)] < period:
+        return False
+    return True
+
+
+def period_bounds(period):
+    """(first, last) 'YYYY-MM-DD' days of a year or month period"""
+    if len(period) == 4:
+        return f'{period}-01-01', f'{period}-12-31'
+    first = date.fromisoformat(f'{period}-01')
+    last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return first.isoformat(), last.isoformat()
+
+
+def record_key(plant, period, record_id):
+    """The key of a partitioned record, 'plant/period/id'"""
+    return f'{plant}/{period}/{record_id}'
+
+
+def parse_record_key(key):
+    """(plant, period, id) of a record key, raising ValueError for anything else"""
+    match = KEY_PATTERN.match(str(key))
+    if not match:
+        raise ValueError(f"Not a partitioned record key: {key!r}")
+    return match.group(1), match.group(2), int(match.group(3))
+
+
+def _with_keys(columns, records, plant, period):
+    """Records with a leading plant column and their ids replaced by record keys"""
+    id_index = columns.index('id')
+    return [
+        (plant,) + tuple(record[:id_index]) + (record_key(plant, period, record[id_index]),)
+        + tuple(record[id_index + 1:])
+        for record in records
+    ]
+
+
+def _file_signature(path):
+    """(mtime, size) of a database file and its write-ahead log, None for a missing file"""
+    signature = []
+    for file_path in (path, path + '-wal'):
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            signature.append(None)
+        else:
+            signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set)):
+        return list(value) or None
+    return [value]
+
+
+def merge_grouped(partials):
+    """Sum (key, frequency, total_duration) rows from several partitions, largest total first"""
+    merged = {}
+    for rows in partials:
+        for key, frequency, total_duration in rows:
+            previous_frequency, previous_total = merged.get(key, (0, 0))
+            merged[key] = (previous_frequency + frequency, previous_total + (total_duration or 0))
+    return sorted(
+        ((key, frequency, total) for key, (frequency, total) in merged.items()),
+        key=lambda row: row[2], reverse=True
+    )
+
+
+def _sweep_overlap(earlier, later):
+    """Minutes covered by both lists of (start, end) intervals"""
+    return sweep(earlier)[0] + sweep(later)[0] - sweep(earlier + later)[0]
+
+
+class PartitionedDatabase:
+    """Database-compatible reads and writes over partitioned record files.
+
+    Queries take the same filters as Database plus plant, a plant name or a
+    list of names. Records are identified by 'plant/period/id' keys (see
+    record_key), as ids are only unique within a partition. The scheme is
+    read from root/partitions.json when not given, and written there by the
+    first read-write instance. A read_only instance opens the partitions
+    read-only and cannot create them.
+    """
+
+    def __init__(self, root, scheme=None, max_open=DEFAULT_MAX_OPEN, read_only=False):
+        if scheme is not None and scheme not in PARTITION_SCHEMES:
+            raise ValueError(f"Unknown partition scheme: {scheme}")
+        if max_open < 1:
+            raise ValueError("max_open must be at least 1")
+        if read_only:
+            if not os.path.isdir(root):
+                raise FileNotFoundError(f"No partitions under {root}")
+        else:
+            os.makedirs(root, exist_ok=True)
+
+        layout_path = os.path.join(root, LAYOUT_FILE)
+        stored_scheme = None
+        if os.path.exists(layout_path):
+            with open(layout_path, encoding='utf-8') as f:
+                stored_scheme = json.load(f)['scheme']
+        if scheme is None:
+            scheme = stored_scheme or 'year'
+        elif stored_scheme is not None and stored_scheme != scheme:
+            raise ValueError(f"{root} is partitioned by {stored_scheme}, not {scheme}")
+        if stored_scheme is None and not read_only:
+            with open(layout_path, 'w', encoding='utf-8') as f:
+                json.dump({'scheme': scheme}, f)
+
+        self.root = root
+        self.scheme = scheme
+        self.max_open = max_open
+        self.read_only = read_only
+        # Open partitions, least recently used first, and how many callers use each
+        self._open = OrderedDict()
+        self._in_use = {}
+        self._lock = threading.Lock()
+        # Each plant's predictions Database, opened on first use
+        self._stores = {}
+        # Values derived from every partition, cleared when any partition file changes
+        self.cache = SnapshotCache()
+        self._seen_signature = None
+        # (signature, window) of partitions predictions.refresh_predictions
+        # found without pending changes, so it need not open them again
+        self.prediction_checks = {}
+
+    def _plant_dir(self, plant):
+        if not PLANT_PATTERN.match(str(plant)):
+            raise ValueError(f"Invalid plant name: {plant!r}")
+        return os.path.join(self.root, plant)
+
+    def partition_path(self, plant, period):
+        return os.path.join(self._plant_dir(plant), f'{period}.db')
+
+    def partition_signature(self, plant, period):
+        """A value that changes whenever the partition's file is written"""
+        return _file_signature(self.partition_path(plant, period))
+
+    def list_partitions(self):
+        """[(plant, period)] of every partition file under root, oldest period first"""
+        pattern = PERIOD_PATTERNS[self.scheme]
+        partitions = []
+        for plant in os.listdir(self.root):
+            plant_dir = os.path.join(self.root, plant)
+            if not os.path.isdir(plant_dir) or not PLANT_PATTERN.match(plant):
+                continue
+            for name in os.listdir(plant_dir):
+                match = pattern.match(name)
+                if match:
+                    partitions.append((plant, match.group(1)))
+        return sorted(partitions, key=lambda partition: (partition[1], partition[0]))
+
+    def plants(self):
+        return sorted({plant for plant, _ in self.list_partitions()})
+
+    @contextlib.contextmanager
+    def partition(self, plant, period):
+        """Open (on first use) and lend out the Database for one partition.
+
+        The partition is not closed by eviction while the with block runs.
+        """
+        key = (plant, period)
+        with self._lock:
+            db = self._open.get(key)
+            if db is None:
+                path = self.partition_path(plant, period)
+                if self.read_only:
+                    if not os.path.exists(path):
+                        raise FileNotFoundError(path)
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                db = self._open[key] = Database(path, read_only=self.read_only)
+            self._open.move_to_end(key)
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+            self._evict()
+        try:
+            yield db
+        finally:
+            with self._lock:
+                self._in_use[key] -= 1
+                if not self._in_use[key]:
+                    del self._in_use[key]
+                self._evict()
+
+    def _evict(self):
+        # Called with _lock held; partitions in use may keep more than max_open open
+        for key in list(self._open):
+            if len(self._open) <= self.max_open:
+                break
+            if key not in self._in_use:
+                self._open.pop(key).close()
+
+    def upgrade(self):
+        """Open every partition once, applying pending migrations"""
+        for plant, period in self.list_partitions():
+            with self.partition(plant, period):
+                pass
+
+    def open_partitions(self):
+        """[(plant, period)] of the partitions currently open, least recently used first"""
+        with self._lock:
+            return list(self._open)
+
+    def select_partitions(self, plant=None, start_date=None, end_date=None):
+        """The partitions a query with these filters has to read"""
+        plants = _as_list(plant)
+        return [
+            (partition_plant, period) for partition_plant, period in self.list_partitions()
+            if (plants is None or partition_plant in plants)
+            and period_overlaps(period, start_date, end_date)
+        ]
+
+    def select_periods(self, plant=None, start_date=None, end_date=None):
+        """[(period, [plant])] of the selected partitions, oldest period first"""
+        periods = OrderedDict()
+        for partition_plant, period in self.select_partitions(plant, start_date, end_date):
+            periods.setdefault(period, []).append(partition_plant)
+        return list(periods.items())
+
+    def each_partition(self, plant=None, start_date=None, end_date=None):
+        """Yield (plant, period, Database) of the selected partitions, lending one at a time"""
+        for partition_plant, period in self.select_partitions(plant, start_date, end_date):
+            with self.partition(partition_plant, period) as db:
+                yield partition_plant, period, db
+
+    def _partials(self, method, plant=None, **filters):
+        """[(plant, period, result)] of calling method on each selected partition"""
+        return [
+            (partition_plant, period, getattr(db, method)(**filters))
+            for partition_plant, period, db in self.each_partition(
+                plant, filters.get('start_date'), filters.get('end_date'))
+        ]
+
+    def prediction_store(self, plant):
+        """The Database holding a plant's maintenance predictions (see predictions.py).
+
+        None for a read-only instance when the plant has none yet.
+        """
+        path = os.path.join(self._plant_dir(plant), PREDICTIONS_FILE)
+        with self._lock:
+            store = self._stores.get(plant)
+            if store is None:
+                if self.read_only:
+                    if not os.path.exists(path):
+                        return None
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                store = self._stores[plant] = Database(path, read_only=self.read_only)
+            return store
+
+    def close(self):
+        with self._lock:
+            for db in list(self._open.values()) + list(self._stores.values()):
+                db.close()
+            self._open.clear()
+            self._stores.clear()
+
+    def _check_writes(self):
+        """Clear the derived values when any partition file changed since the last check"""
+        signature = tuple(
+            (plant, period, self.partition_signature(plant, period))
+            for plant, period in self.list_partitions()
+        )
+        with self._lock:
+            if signature != self._seen_signature:
+                self._seen_signature = signature
+                self.cache.bump_version()
+
+    @property
+    def data_version(self):
+        """Changes whenever a partition is written, created or removed"""
+        self._check_writes()
+        return self.cache.version
+
+    def get_derived(self, name, compute, **key_args):
+        """Get a value derived from the records, cached until a partition file changes"""
+        self._check_writes()
+
+        def checked():
+            value = compute()
+            # A write made while computing leaves the value uncached
+            self._check_writes()
+            return value
+
+        return self.cache.get_or_compute(make_key(name, **key_args), checked)
+
+    def insert_record(self, data, plant=None):
+        """Insert a record into its plant and period's partition; returns its key.
+
+        The plant is taken from the argument, then data['plant'], then
+        DEFAULT_PLANT.
+        """
+        plant = plant or data.get('plant') or DEFAULT_PLANT
+        period = partition_period(data['date'], self.scheme)
+        with self.partition(plant, period) as db:
+            record_id = db.insert_record(data)
+        return record_key(plant, period, record_id)
+
+    def import_rows(self, rows, plant=DEFAULT_PLANT, batch_size=50000):
+        """Validate rows as bulk_import.import_rows does and load each into its period's partition.
+
+        Rows are written through a connection of their own per partition,
+        batch_size rows of a period at a time. Returns (imported_count,
+        rejects).
+        """
+        imported = 0
+        rejects = []
+        batches = {}
+        connections = {}
+
+        def flush(period):
+            conn = connections.get(period)
+            if conn is None:
+                path = self.partition_path(plant, period)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                conn = connections[period] = sqlite3.connect(path, timeout=DEFAULT_BUSY_TIMEOUT)
+                migrate(conn)
+            return load_rows(conn, batches.pop(period), batch_size)
+
+        try:
+            for row_number, row in enumerate(rows, start=1):
+                try:
+                    values = normalize_row(row)
+                except RowError as e:
+                    rejects.append((row_number, str(e), row))
+                    continue
+                period = partition_period(values[0], self.scheme)
+                batches.setdefault(period, []).append(values)
+                if len(batches[period]) >= batch_size:
+                    imported += flush(period)
+            for period in list(batches):
+                imported += flush(period)
+        finally:
+            for conn in connections.values():
+                conn.close()
+        return imported, rejects
+
+    def merge_dimension_member(self, column, alias, canonical, plant=None):
+        """Merge alias into canonical in every partition (see Database.merge_dimension_member)"""
+        if column not in DIMENSION_TABLES:
+            raise ValueError(f"Unknown dimension: {column}")
+        return sum(db.merge_dimension_member(column, alias, canonical)
+                   for _, _, db in self.each_partition(plant))
+
+    def _keys_by_partition(self, record_keys):
+        by_partition = {}
+        for key in record_keys:
+            plant, period, record_id = parse_record_key(key)
+            by_partition.setdefault((plant, period), []).append(record_id)
+        return {
+            partition: record_ids for partition, record_ids in by_partition.items()
+            if os.path.exists(self.partition_path(*partition))
+        }
+
+    def delete_record(self, record_key):
+        return self.delete_records([record_key])
+
+    def delete_records(self, record_keys):
+        """Delete records by key, one transaction per partition; returns the number deleted"""
+        deleted = 0
+        for (plant, period), record_ids in self._keys_by_partition(record_keys).items():
+            with self.partition(plant, period) as db:
+                deleted += db.delete_records(record_ids)
+        return deleted
+
+    def deletable_record_ids(self, record_keys):
+        """Return the keys among record_keys of records that are not archived"""
+        deletable = set()
+        for (plant, period), record_ids in self._keys_by_partition(record_keys).items():
+            with self.partition(plant, period) as db:
+                deletable.update(record_key(plant, period, record_id)
+                                 for record_id in db.deletable_record_ids(record_ids))
+        return deletable
+
+    def get_records(self, plant=None, **filters):
+        """Get the matching records from every plant, newest first, with a leading plant column"""
+        # Each partition's records are already newest first
+        streams = [
+            _with_keys(columns, records, partition_plant, period)
+            for partition_plant, period, (columns, records)
+            in self._partials('get_records', plant, **filters)
+        ]
+        date_index = 1 + RECORD_COLUMNS.index('date')
+        records = list(heapq.merge(*streams, key=lambda record: record[date_index], reverse=True))
+        return ['plant'] + RECORD_COLUMNS, records
+
+    def get_all_records(self):
+        return self.get_records()
+
+    def get_records_page(self, columns=None, after=None, page_size=50, plant=None, **filters):
+        """Get one page of records, newest first, as Database.get_records_page.
+
+        Records are ordered by date, plant and id; after is the (date, key)
+        of the previous page's last row. Periods are read newest first
+        until an older one can no longer place a row on the page.
+        """
+        page_filters = dict(filters)
+        after_plant = after_id = None
+        if after is not None:
+            after_date = str(after[0])
+            after_plant, _, after_id = parse_record_key(after[1])
+            if not filters.get('end_date') or after_date < str(filters['end_date']):
+                page_filters['end_date'] = after_date
+
+        page = []
+        page_columns = None
+        for period, plants in reversed(self.select_periods(
+                plant, page_filters.get('start_date'), page_filters.get('end_date'))):
+            if len(page) >= page_size and period_bounds(period)[1] < (page[-1][0][0] or ''):
+                break
+            for partition_plant in plants:
+                partition_after = None
+                if after is not None:
+                    # A plant ordered after the last row's has the rest of its
+                    # date to come, one ordered before only the older dates
+                    partition_id = (after_id if partition_plant == after_plant
+                                    else MAX_RECORD_ID if partition_plant < after_plant else 0)
+                    partition_after = (after_date, partition_id)
+                with self.partition(partition_plant, period) as db:
+                    page_columns, records = db.get_records_page(columns, partition_after, page_size,
+                                                                **page_filters)
+                date_index, id_index = page_columns.index('date'), page_columns.index('id')
+                page.extend(
+                    ((record[date_index] or '', partition_plant, record[id_index]), period, record)
+                    for record in records
+                )
+            page.sort(key=lambda item: item[0], reverse=True)
+            del page[page_size:]
+
+        if page_columns is None:
+            page_columns = list(columns or RECORD_COLUMNS)
+            for column in ('date', 'id'):
+                if column not in page_columns:
+                    page_columns.insert(0, column)
+        return ['plant'] + page_columns, [
+            _with_keys(page_columns, [record], partition_plant, period)[0]
+            for (_, partition_plant, _), period, record in page
+        ]
+
+    def search_records(self, search_term, limit=100, offset=0, plant=None):
+        """Full-text search of every selected partition, best matches first"""
+        matches = []
+        for partition_plant, period, db in self.each_partition(plant):
+            _, records = db.search_records(search_term, limit=offset + limit, ranked=True)
+            matches.extend((record[-1], partition_plant, period, record[:-1]) for record in records)
+        # Best rank first, then newest first as within a partition
+        date_index = RECORD_COLUMNS.index('date')
+        matches.sort(key=lambda match: match[3][date_index] or '', reverse=True)
+        matches.sort(key=lambda match: match[0])
+        return ['plant'] + RECORD_COLUMNS, [
+            _with_keys(RECORD_COLUMNS, [record], partition_plant, period)[0]
+            for _, partition_plant, period, record in matches[offset:offset + limit]
+        ]
+
+    def count_search_results(self, search_term, plant=None):
+        return sum(db.count_search_results(search_term) for _, _, db in self.each_partition(plant))
+
+    def get_shift_downtimes(self, date, line=None, shift=None, plant=None):
+        """Database.get_shift_downtimes rows of one date from the selected plants"""
+        rows = []
+        for _, _, db in self.each_partition(plant, date, date):
+            rows += db.get_shift_downtimes(date, line=line, shift=shift)
+        rows.sort(key=lambda row: (row[0] or '', row[1] or ''))
+        return rows
+
+    def archive_records(self, cutoff, plant=None):
+        """Archive each partition's records dated before cutoff (see retention.archive_records).
+
+        Returns {period: records archived} summed over the plants.
+        """
+        archived = {}
+        for _, _, db in self.each_partition(plant, end_date=cutoff):
+            for period, count in archive_records(db, cutoff).items():
+                archived[period] = archived.get(period, 0) + count
+        return archived
+
+    def get_downtime_totals(self, plant=None, **filters):
+        total_downtime = 0
+        num_incidents = 0
+        for _, _, (partition_total, _, partition_incidents) in self._partials(
+                'get_downtime_totals', plant, **filters):
+            total_downtime += partition_total or 0
+            num_incidents += partition_incidents or 0
+        avg_downtime = total_downtime / num_incidents if num_incidents else None
+        return total_downtime, avg_downtime, num_incidents
+
+    def get_daily_downtime(self, plant=None, **filters):
+        daily = {}
+        for _, _, rows in self._partials('get_daily_downtime', plant, **filters):
+            for day, total_duration, frequency in rows:
+                previous_total, previous_frequency = daily.get(day, (0, 0))
+                daily[day] = (previous_total + (total_duration or 0), previous_frequency + frequency)
+        return [(day, total, frequency) for day, (total, frequency) in sorted(daily.items())]
+
+    def get_downtime_series(self, granularity='day', series=None, plant=None, **filters):
+        merged = {}
+        for _, _, rows in self._partials('get_downtime_series', plant, granularity=granularity,
+                                         series=series, **filters):
+            for bucket, series_key, total_duration, incidents in rows:
+                previous_total, previous_incidents = merged.get((bucket, series_key), (0, 0))
+                merged[(bucket, series_key)] = (previous_total + (total_duration or 0),
+                                                previous_incidents + incidents)
+        return [
+            (bucket, series_key, total, incidents)
+            for (bucket, series_key), (total, incidents) in sorted(
+                merged.items(), key=lambda item: (item[0][0], item[0][1] or ''))
+        ]
+
+    def get_equipment_stats(self, plant=None, top_n=None, **filters):
+        # A partition's top N is not the overall top N, so the rest is folded after merging
+        return fold_top_n(merge_grouped(
+            rows for _, _, rows in self._partials('get_equipment_stats', plant, **filters)), top_n)
+
+    def get_issue_type_stats(self, plant=None, top_n=None, **filters):
+        return fold_top_n(merge_grouped(
+            rows for _, _, rows in self._partials('get_issue_type_stats', plant, **filters)), top_n)
+
+    def get_intervals(self, plant=None, start=None, end=None, **filters):
+        """Stops as Database.get_intervals returns them, with (plant, line) in place of the line"""
+        rows = [
+            ((partition_plant, line), *rest)
+            for partition_plant, _, partial in self._partials('get_intervals', plant, start=start,
+                                                              end=end, **filters)
+            for line, *rest in partial
+        ]
+        rows.sort(key=lambda row: (row[1], row[4]))
+        return rows
+
+    def get_line_downtime(self, plant=None, **filters):
+        """Merged downtime per (plant, line), from each partition's own merged downtime.
+
+        A plant's partitions only share the time of stops running past the
+        end of a period, which both count; it is measured from the stops
+        between the next period's start and the latest such end, and
+        counted once.
+        """
+        total = 0
+        previous = {}
+        for partition_plant, period, db in self.each_partition(
+                plant, filters.get('start_date'), filters.get('end_date')):
+            total += db.get_line_downtime(**filters)
+            if partition_plant in previous:
+                total -= self._shared_downtime(partition_plant, previous[partition_plant], db,
+                                               period, filters)
+            previous[partition_plant] = period
+        return total
+
+    def _shared_downtime(self, plant, earlier_period, db, period, filters):
+        """Minutes the stops of an earlier partition share with db's, per line"""
+        window = to_minutes(f'{period_bounds(period)[0]} 00:00')
+        with self.partition(plant, earlier_period) as earlier_db:
+            earlier = earlier_db.get_intervals(start=from_minutes(window), **filters)
+        if not earlier:
+            return 0
+        reach = max(end for _, _, end, _, _ in earlier)
+        later = db.get_intervals(start=from_minutes(window), end=from_minutes(reach), **filters)
+        pieces = {}
+        for index, stops in enumerate((earlier, later)):
+            for line, start, end, _, _ in stops:
+                clipped = (max(start, window), min(end, reach))
+                pieces.setdefault(line, ([], []))[index].append(clipped)
+        return sum(_sweep_overlap(*line_pieces) for line_pieces in pieces.values())
+
+    def refresh_line_downtime(self):
+        """Refresh every partition's line_downtime_daily; False if any is read-only and stale"""
+        return all([db.refresh_line_downtime() for _, _, db in self.each_partition()])
+
+    def get_shift_availability(self, start_date, end_date, line=None, plant=None):
+        """Availability per (plant, line) and shift, as Database.get_shift_availability"""
+        windows = shift_windows(start_date, end_date)
+        if not windows:
+            return []
+        # The first window can hold stops dated the day before, as in
+        # Database.get_dated_intervals, and no earlier partition is read
+        first_date = (date.fromisoformat(str(start_date)[:10]) - timedelta(days=1)).isoformat()
+        rows = self.get_intervals(plant, start=from_minutes(windows[0][2]), end=from_minutes(windows[-1][3]),
+                                  start_date=first_date, end_date=end_date, line=line)
+        lines = None
+        if line is not None:
+            # Shifts without stops are reported for the line in every selected plant
+            plants = _as_list(plant) or self.plants()
+            lines = [(partition_plant, name) for partition_plant in plants for name in _as_list(line)]
+        return shift_availability(rows, windows, lines=lines)
+
+    def get_failure_rate_alerts(self, at=None, plant=None, **thresholds):
+        """Equipment failing abnormally often, with a plant key, from each plant's statistics"""
+        at = from_minutes(to_minutes(at or datetime.now()))
+
+        def compute():
+            by_plant = {}
+            for partition_plant, _, db in self.each_partition(plant):
+                by_plant.setdefault(partition_plant, []).append(db.get_failure_stats())
+            alerts = [
+                dict(alert, plant=partition_plant)
+                for partition_plant, partials in by_plant.items()
+                for alert in rate_alerts(merge_stats(partials), at, **thresholds)
+            ]
+            alerts.sort(key=lambda alert: alert['ratio'], reverse=True)
+            return alerts
+
+        return self.get_derived('failure_rate_alerts', compute, at=at, plant=plant, **thresholds)
+
+    def get_maintenance_predictions(self, equipment=None, plant=None):
+        """Get the plants' precomputed equipment metrics with a plant column, soonest first"""
+        frames = []
+        for store_plant in _as_list(plant) or self.plants():
+            store = self.prediction_store(store_plant)
+            if store is None:
+                continue
+            # The store's frame is cached, so it is copied before adding to it
+            frame = store.get_maintenance_predictions(equipment=equipment).copy()
+            frame.insert(0, 'plant', store_plant)
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=['plant'] + METRIC_COLUMNS)
+        return pd.concat(frames, ignore_index=True).sort_values(
+            ['recommended_maintenance', 'equipment', 'plant'], na_position='last',
+            kind='stable', ignore_index=True
+        )
+
+    def get_latest_prediction_run(self):
+        """The latest prediction run of any plant, as Database.get_latest_prediction_run"""
+        stores = [self.prediction_store(plant) for plant in self.plants()]
+        runs = [store.get_latest_prediction_run() for store in stores if store is not None]
+        return max((run for run in runs if run is not None), key=lambda run: run[1], default=None)
+
+    def get_plant_totals(self, **filters):
+        """[(plant, incidents, total_duration)] across the selected partitions, largest total first"""
+        return merge_grouped(
+            [(partition_plant, incidents, total)]
+            for partition_plant, _, (total, _, incidents) in self._partials('get_downtime_totals', **filters)
+        )
+
+    def get_snapshot(self, plant=None, **filters):
+        """Get a RecordSnapshot of the matching records from every selected partition.
+
+        The snapshot carries a categorical plant column. Its text() cannot
+        load free-text columns, as record ids repeat across partitions.
+        """
+        frames = []
+        for partition_plant, _, snapshot in self._partials('get_snapshot', plant, **filters):
+            frame = snapshot.frame.copy()
+            frame.insert(0, 'plant', pd.Categorical([partition_plant] * len(frame)))
+            frames.append(frame)
+        if not frames:
+            return RecordSnapshot.from_records([])
+        frame = concat_frames(frames, list(frames[0].columns))
+        frame = frame.sort_values('date', ascending=False, kind='stable', ignore_index=True)
+        return RecordSnapshot(frame)
+
+
+def open_database(path, read_only=False, scheme=None):
+    """The PartitionedDatabase under a directory path (or with a scheme), else the Database file"""
+    if scheme is not None or os.path.isdir(path):
+        return PartitionedDatabase(path, scheme, read_only=read_only)
+    return Database(path, read_only=read_only)
+
+
+def _archived_rows(source, archive, period):
+    """The source's archived records of a period in SPLIT_COLUMNS order, oldest first"""
+    first, last = period_bounds(period)
+    files = [row[0] for row in source.execute('''
+        SELECT file FROM archive_segments WHERE last_date >= ? AND first_date <= ? ORDER BY period
+    ''', (first, last))]
+    return archive.iter_rows(files, SPLIT_COLUMNS, start_date=first, end_date=last)
+
+
+def split_database(source_path, root, plant=DEFAULT_PLANT, scheme='year', batch_size=50000):
+    """Copy the records of a single-file database into partitions; returns {period: rows}.
+
+    Archived records are copied too and archived again in their partition,
+    which gets the same archive cutoff as the source. Records keep their
+    created_at; ids are assigned afresh in each partition.
+    """
+    source = sqlite3.connect(source_path)
+    source.execute('PRAGMA query_only = 1')
+    partitioned = PartitionedDatabase(root, scheme)
+    width = PARTITION_SCHEMES[scheme]
+    counts = {}
+    try:
+        last_archived = source.execute('SELECT MAX(last_date) FROM archive_segments').fetchone()[0]
+        archive_path = archive_path_for(source_path)
+        archive = RecordArchive(archive_path) if last_archived and archive_path else None
+        periods = {row[0] for row in source.execute(
+            f'SELECT DISTINCT substr(date, 1, {width}) FROM downtime_records'
+        )}
+        if archive is not None:
+            # Segments are monthly, so their period starts with a year's or a month's
+            periods.update(row[0][:width] for row in source.execute('SELECT period FROM archive_segments'))
+
+        for period in sorted(periods):
+            path = partitioned.partition_path(plant, period)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            conn = sqlite3.connect(path)
+            migrate(conn)
+            rows = source.execute(
+                f'SELECT {", ".join(SPLIT_COLUMNS)} FROM downtime_records '
+                f'WHERE substr(date, 1, {width}) = ? ORDER BY date, id',
+                (period,)
+            )
+            if archive is not None:
+                rows = heapq.merge(_archived_rows(source, archive, period), rows,
+                                   key=lambda row: row[0] or '')
+            counts[period] = load_rows(conn, rows, batch_size, SPLIT_COLUMNS)
+            conn.execute('ANALYZE')
+            conn.commit()
+            conn.close()
+
+            if archive is not None and period_bounds(period)[0] <= last_archived:
+                db = Database(path)
+                try:
+                    cutoff = (date.fromisoformat(last_archived) + timedelta(days=1)).isoformat()
+                    archive_records(db, cutoff)
+                finally:
+                    db.close()
+    finally:
+        source.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split a downtime database into per-plant, per-period files")
+    parser.add_argument('source', help="single-file database to split, e.g. downtime.db")
+    parser.add_argument('root', help="directory to write root/<plant>/<period>.db files under")
+    parser.add_argument('--plant', default=DEFAULT_PLANT, help=f"plant name (default: {DEFAULT_PLANT})")
+    parser.add_argument('--scheme', choices=list(PARTITION_SCHEMES), default='year')
+    parser.add_argument('--batch-size', type=int, default=50000, help="rows per transaction")
+    args = parser.parse_args(argv)
+
+    counts = split_database(args.source, args.root, args.plant, args.scheme, args.batch_size)
+    for period, rows in counts.items():
+        print(f"{args.plant}/{period}.db: {rows} records")
+    print(f"Split {sum(counts.values())} records into {len(counts)} partitions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
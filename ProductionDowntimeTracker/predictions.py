@@ -0,0 +1,307 @@
+import argparse
+import sys
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from instrumentation import traced
+from maintenance_predictor import METRIC_COLUMNS, calculate_equipment_metrics
+from partitions import PartitionedDatabase, open_database
+
+# Maintenance predictions are computed off the page render and stored in
+# maintenance_predictions. Triggers append the equipment of every changed
+# record to maintenance_dirty; a refresh recomputes only those equipment,
+# then consumes the dirty rows it has seen. The failure rate of every
+# equipment is measured over the window spanned by all records, so when
+# that window moves the other rows' rates are rescaled without recomputing
+# their metrics. Partitioned records keep each plant's predictions in a
+# store of its own, measured over that plant's records.
+
+DEFAULT_POLL_SECONDS = 5
+DEFAULT_FULL_REFRESH_SECONDS = 3600
+
+# The cached Database queries that read maintenance_predictions or prediction_runs
+PREDICTION_QUERIES = ['get_maintenance_predictions', 'get_latest_prediction_run']
+
+
+def _to_db_value(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _failure_rate(total_failures, window_days):
+    # Same rounding as calculate_equipment_metrics
+    return float(np.round(total_failures / window_days * 30, 2))
+
+
+def _pending_changes(conn):
+    """(seen, window_start, window_end): the last maintenance_dirty row and the records' dates"""
+    seen = conn.execute('SELECT MAX(rowid) FROM maintenance_dirty').fetchone()[0]
+    window_start, window_end = conn.execute(
+        "SELECT MIN(date), MAX(date) FROM downtime_rollup WHERE date != ''"
+    ).fetchone()
+    return seen, window_start, window_end
+
+
+def _dirty_equipment(conn, seen):
+    return [row[0] for row in conn.execute(
+        'SELECT DISTINCT equipment FROM maintenance_dirty WHERE rowid <= ?', (seen,)
+    )]
+
+
+def _consume_dirty(cursor, seen):
+    cursor.execute('DELETE FROM maintenance_dirty WHERE rowid <= ?', (seen,))
+
+
+@traced(category='predictor')
+def refresh_predictions(db, full=False):
+    """Bring maintenance_predictions up to date with the records.
+
+    Recomputes the equipment with changed records, or every equipment when
+    full is set or nothing has been computed yet. Returns the new run's
+    version, or None if nothing had changed. A refresh that would store
+    the predictions already stored writes nothing. A PartitionedDatabase
+    is refreshed plant by plant and returns {plant: version} of the plants
+    with a new run, or None.
+    """
+    if isinstance(db, PartitionedDatabase):
+        versions = {}
+        for plant in db.plants():
+            version = _refresh_plant(db, plant, full)
+            if version is not None:
+                versions[plant] = version
+        return versions or None
+
+    seen, window_start, window_end = _pending_changes(db.conn)
+    dirty = None if seen is None else _dirty_equipment(db.conn, seen)
+
+    def consume(cursor):
+        if seen is not None:
+            _consume_dirty(cursor, seen)
+
+    return _store_predictions(db, db.get_snapshot, full, dirty, (window_start, window_end), consume)
+
+
+def _refresh_plant(db, plant, full):
+    """Refresh a plant's predictions store from the records of its partitions.
+
+    A partition found without changes is not opened again until its file
+    changes. The dirty rows are consumed once the predictions are stored.
+    """
+    store = db.prediction_store(plant)
+    if store is None:
+        return None
+    pending = []
+    dirty = set()
+    starts, ends = [], []
+    for _, period in db.select_partitions(plant):
+        signature = db.partition_signature(plant, period)
+        checked = db.prediction_checks.get((plant, period))
+        if checked is not None and checked[0] == signature:
+            window = checked[1]
+        else:
+            with db.partition(plant, period) as partition:
+                seen, window_start, window_end = _pending_changes(partition.conn)
+                window = (window_start, window_end)
+                if seen is None:
+                    db.prediction_checks[(plant, period)] = (signature, window)
+                else:
+                    dirty.update(_dirty_equipment(partition.conn, seen))
+                    pending.append((period, seen))
+        if window[0] is not None:
+            starts.append(window[0])
+            ends.append(window[1])
+
+    version = _store_predictions(
+        store, lambda **filters: db.get_snapshot(plant=plant, **filters), full,
+        sorted(dirty, key=str) if pending else None,
+        (min(starts), max(ends)) if starts else (None, None), lambda cursor: None
+    )
+    for period, seen in pending:
+        with db.partition(plant, period) as partition:
+            partition.connections.write(lambda cursor, seen=seen: _consume_dirty(cursor, seen))
+    return version
+
+
+def _store_predictions(store, get_snapshot, full, dirty, window, consume):
+    """Recompute the predictions of the dirty equipment (None: nothing changed) into store.
+
+    get_snapshot reads the records, window is the (first, last) date they
+    span and consume(cursor) runs in the transaction storing the run.
+    """
+    conn = store.conn
+    window_start, window_end = window
+    last_run = conn.execute('''
+        SELECT window_start, window_end FROM prediction_runs ORDER BY version DESC LIMIT 1
+    ''').fetchone()
+
+    full = full or last_run is None
+    window_changed = last_run is None or tuple(last_run) != (window_start, window_end)
+    if full:
+        equipment = None
+    elif dirty is not None:
+        equipment = dirty
+    else:
+        equipment = []
+    if not full and not equipment and not window_changed:
+        return None
+
+    window_days = None
+    if window_start is not None:
+        window_days = (pd.Timestamp(window_end) - pd.Timestamp(window_start)).days + 1
+
+    # Records without equipment have no metrics of their own
+    names = None if equipment is None else [name for name in equipment if name is not None]
+    if names == []:
+        metrics = pd.DataFrame(columns=METRIC_COLUMNS)
+    else:
+        snapshot = get_snapshot() if names is None else get_snapshot(equipment=names)
+        metrics = calculate_equipment_metrics(snapshot, window_days)
+    rows = [
+        tuple(_to_db_value(value) for value in row)
+        for row in metrics.reindex(columns=METRIC_COLUMNS).itertuples(index=False)
+    ]
+    if dirty is None and not window_changed:
+        where, params = store.build_filters(equipment=names)
+        stored = conn.execute(
+            f'SELECT {", ".join(METRIC_COLUMNS)} FROM maintenance_predictions {where}', params
+        ).fetchall()
+        if sorted(stored, key=repr) == sorted(rows, key=repr):
+            return None
+
+    def write(cursor):
+        cursor.execute('''
+            INSERT INTO prediction_runs
+                (computed_at, window_start, window_end, equipment_updated, full_refresh)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (datetime.now().isoformat(timespec='seconds'), window_start, window_end,
+              len(rows), int(full)))
+        version = cursor.lastrowid
+
+        if names is None:
+            cursor.execute('DELETE FROM maintenance_predictions')
+        else:
+            # Equipment whose records were all deleted drops out here
+            cursor.executemany('DELETE FROM maintenance_predictions WHERE equipment = ?',
+                               [(name,) for name in names])
+        cursor.executemany(f'''
+            INSERT INTO maintenance_predictions ({', '.join(METRIC_COLUMNS)}, version)
+            VALUES ({', '.join('?' * len(METRIC_COLUMNS))}, ?)
+        ''', [row + (version,) for row in rows])
+
+        if window_changed and window_days and names is not None:
+            others = cursor.execute(
+                'SELECT equipment, total_failures FROM maintenance_predictions WHERE version != ?',
+                (version,)
+            ).fetchall()
+            cursor.executemany(
+                'UPDATE maintenance_predictions SET failure_rate = ? WHERE equipment = ?',
+                [(_failure_rate(total_failures, window_days), name) for name, total_failures in others]
+            )
+
+        consume(cursor)
+        return version
+
+    version = store.connections.write(write)
+    # Only the prediction queries read what was written
+    store.cache.invalidate(PREDICTION_QUERIES)
+    return version
+
+
+class PredictionScheduler:
+    """Background thread keeping maintenance_predictions up to date.
+
+    Checks for changed records every poll_seconds, or as soon as notify()
+    is called, and recomputes every equipment once per
+    full_refresh_seconds.
+    """
+
+    def __init__(self, db, poll_seconds=DEFAULT_POLL_SECONDS,
+                 full_refresh_seconds=DEFAULT_FULL_REFRESH_SECONDS):
+        self.db = db
+        self.poll_seconds = poll_seconds
+        self.full_refresh_seconds = full_refresh_seconds
+        self.last_error = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='prediction-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def notify(self):
+        """Check for changed records now rather than at the next poll"""
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        last_full = None
+        while not self._stop.is_set():
+            now = time.monotonic()
+            full = last_full is not None and now - last_full >= self.full_refresh_seconds
+            try:
+                refresh_predictions(self.db, full=full)
+                self.last_error = None
+                if full or last_full is None:
+                    last_full = now
+            except Exception as e:
+                self.last_error = e
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute maintenance predictions")
+    parser.add_argument('--db', default='downtime.db',
+                        help="database file or partitions directory (default: downtime.db)")
+    parser.add_argument('--once', action='store_true', help="refresh once and exit")
+    parser.add_argument('--full', action='store_true', help="recompute every equipment")
+    parser.add_argument('--poll', type=float, default=DEFAULT_POLL_SECONDS,
+                        help="seconds between checks for changed records")
+    parser.add_argument('--full-every', type=float, default=DEFAULT_FULL_REFRESH_SECONDS,
+                        help="seconds between full recomputes")
+    args = parser.parse_args(argv)
+
+    db = open_database(args.db)
+    try:
+        if args.once:
+            version = refresh_predictions(db, full=args.full)
+            if version is None:
+                print("Predictions already up to date")
+            elif isinstance(version, dict):
+                for plant, plant_version in version.items():
+                    print(f"{plant}: prediction run {plant_version}")
+            else:
+                run = db.get_latest_prediction_run()
+                print(f"Prediction run {version}: {run[2]} equipment updated")
+            return 0
+
+        scheduler = PredictionScheduler(db, args.poll, args.full_every).start()
+        print(f"Refreshing predictions every {args.poll:g}s (full every {args.full_every:g}s); Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            scheduler.stop()
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
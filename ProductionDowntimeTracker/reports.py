@@ -0,0 +1,402 @@
+import argparse
+import html
+import importlib.util
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+import pandas as pd
+from analytics import calculate_kpis, create_downtime_trend, create_equipment_pareto, create_issue_type_pareto
+from dimensions import PARETO_TOP_N
+from maintenance_predictor import calculate_equipment_metrics
+from partitions import PARTITION_SCHEMES, PartitionedDatabase, open_database
+from utils import get_line_options
+
+# Renders a static report per production line for a period (by default
+# the previous month): KPIs, shift availability, equipment and issue type
+# Paretos, the daily trend and maintenance predictions. Lines are rendered
+# in a process pool, each worker reading through its own read-only
+# Database, so the figures of different lines are built on different
+# cores. The records can also come from a tree of partitions (see
+# partitions.py), optionally of one plant. Reports are written to files as
+# lines finish and recorded in manifest.json; a rerun with the same inputs
+# (source, partition scheme, plant, period, formats and plotly.js mode)
+# skips lines already rendered.
+
+REPORT_FORMATS = ['html', 'png']
+
+# Where the HTML reports load plotly.js from: one plotly.min.js next to the
+# reports, a CDN, or a copy inlined into every report
+PLOTLYJS_MODES = ['directory', 'cdn', 'inline']
+
+MANIFEST_NAME = 'manifest.json'
+
+# Manifest entries that must all match for a previous run's lines to be reused
+MANIFEST_INPUTS = ['source', 'scheme', 'plant', 'start_date', 'end_date', 'formats', 'plotlyjs']
+
+TREND_ROLLING = 7
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; color: #222; }}
+table {{ border-collapse: collapse; margin: 1em 0; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 10px; text-align: right; }}
+th:first-child, td:first-child {{ text-align: left; }}
+.kpis td {{ font-size: 1.2em; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+{body}
+</body>
+</html>
+'''
+
+# The read-only Database or PartitionedDatabase of a worker process and
+# the plant its reports cover, set by _init_worker
+_worker_db = None
+_worker_plant = None
+
+
+def line_slug(line):
+    """File name stem of a line's report: 'Line 12' -> 'line-12'"""
+    return re.sub(r'[^a-z0-9]+', '-', str(line).lower()).strip('-') or 'line'
+
+
+def month_period(month=None, today=None):
+    """(first, last) 'YYYY-MM-DD' days of month ('YYYY-MM'), by default the previous month"""
+    if month is None:
+        first = ((today or date.today()).replace(day=1) - timedelta(days=1)).replace(day=1)
+    else:
+        first = date.fromisoformat(f'{month}-01')
+    last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return first.isoformat(), last.isoformat()
+
+
+def _write_file(path, data):
+    """Write path atomically, so an interrupted run never leaves half a report"""
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w' if isinstance(data, str) else 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def _table(frame):
+    return frame.to_html(index=False, border=0, na_rep='', escape=True)
+
+
+def _availability_by_shift(rows):
+    """Availability per shift over the period from Database.get_shift_availability rows"""
+    frame = pd.DataFrame(rows, columns=[
+        'line', 'date', 'shift', 'planned', 'stops', 'downtime', 'availability', 'overlap', 'peak'
+    ])
+    if frame.empty:
+        return frame, None
+    by_shift = frame.groupby('shift', sort=False).agg(
+        planned=('planned', 'sum'), stops=('stops', 'sum'),
+        downtime=('downtime', 'sum'), peak=('peak', 'max')
+    ).reset_index()
+    by_shift['availability'] = (1 - by_shift['downtime'] / by_shift['planned']).round(4)
+    by_shift.columns = ['Shift', 'Planned (min)', 'Stops', 'Downtime (min)',
+                        'Most Concurrent Stops', 'Availability']
+    overall = round(1 - frame['downtime'].sum() / frame['planned'].sum(), 4)
+    return by_shift, overall
+
+
+def open_source(path, scheme=None, read_only=False):
+    """The Database at path, or the PartitionedDatabase under a directory path or with a scheme"""
+    return open_database(path, read_only=read_only, scheme=scheme)
+
+
+def build_line_report(db, line, start_date, end_date, plant=None):
+    """KPIs, tables and figures of one line's report; plant needs a PartitionedDatabase"""
+    plants = {'plant': plant} if plant else {}
+    filters = {'start_date': start_date, 'end_date': end_date, 'line': line, **plants}
+    kpis = calculate_kpis(db, **filters)
+    availability, overall = _availability_by_shift(
+        db.get_shift_availability(start_date, end_date, line=line, **plants)
+    )
+    kpis['availability'] = overall
+
+    figures = [
+        ('equipment-pareto', create_equipment_pareto(db.get_equipment_stats(top_n=PARETO_TOP_N, **filters))),
+        ('issue-type-pareto', create_issue_type_pareto(db.get_issue_type_stats(top_n=PARETO_TOP_N, **filters))),
+        ('trend', create_downtime_trend(db, 'day', rolling=TREND_ROLLING, **filters)),
+    ]
+
+    # Predictions look at the line's whole history up to the end of the period
+    metrics = calculate_equipment_metrics(db.get_snapshot(end_date=end_date, line=line, **plants))
+    if not metrics.empty:
+        metrics = metrics.sort_values('recommended_maintenance', na_position='last')
+        for column in ('next_predicted_failure', 'recommended_maintenance'):
+            metrics[column] = pd.to_datetime(metrics[column]).dt.strftime('%Y-%m-%d')
+        metrics.columns = ['Equipment', 'Failures', 'Total Downtime', 'Avg Downtime', 'MTBF (days)',
+                           'Next Predicted Failure', 'Recommended Maintenance', 'Failures/Month']
+
+    return {
+        'kpis': kpis,
+        'availability': availability,
+        'predictions': metrics,
+        'figures': [(name, fig) for name, fig in figures if fig is not None],
+    }
+
+
+def render_html(line, start_date, end_date, report, plotlyjs='directory'):
+    """The HTML page of a line's report; figures load plotly.js as plotlyjs says"""
+    kpis = report['kpis']
+    availability = kpis['availability']
+    kpi_rows = [
+        ('Total Downtime', f"{kpis['total_downtime']} min"),
+        ('Line Downtime', f"{kpis['line_downtime']} min"),
+        ('Average Downtime', f"{kpis['avg_downtime']} min"),
+        ('Incidents', kpis['num_incidents']),
+        ('Availability', f'{availability:.1%}' if availability is not None else ''),
+    ]
+    body = ['<table class="kpis">']
+    body += [f'<tr><th>{name}</th><td>{html.escape(str(value))}</td></tr>' for name, value in kpi_rows]
+    body.append('</table>')
+
+    if not report['availability'].empty:
+        body += ['<h2>Shift Availability</h2>', _table(report['availability'])]
+
+    include = plotlyjs
+    for _, fig in report['figures']:
+        body.append(fig.to_html(full_html=False, include_plotlyjs=include))
+        include = False
+
+    body.append('<h2>Maintenance Predictions</h2>')
+    body.append(_table(report['predictions']) if not report['predictions'].empty
+                else '<p>Not enough failures to predict maintenance.</p>')
+
+    title = html.escape(f'{line}: downtime report {start_date} to {end_date}')
+    return PAGE_TEMPLATE.format(title=title, body='\n'.join(body))
+
+
+def _init_worker(db_path, scheme, plant):
+    global _worker_db, _worker_plant
+    _worker_db = open_source(db_path, scheme, read_only=True)
+    _worker_plant = plant
+
+
+def render_line(line, start_date, end_date, out_dir, formats, plotlyjs):
+    """Build and write one line's report in a worker. Returns its manifest entry."""
+    started, cpu_started = time.perf_counter(), time.process_time()
+    report = build_line_report(_worker_db, line, start_date, end_date, _worker_plant)
+    slug = line_slug(line)
+    files = []
+    if 'html' in formats:
+        files.append(f'{slug}.html')
+        _write_file(os.path.join(out_dir, files[-1]), render_html(line, start_date, end_date, report, plotlyjs))
+    if 'png' in formats:
+        for name, fig in report['figures']:
+            files.append(f'{slug}-{name}.png')
+            _write_file(os.path.join(out_dir, files[-1]), fig.to_image(format='png'))
+    return {
+        'files': files,
+        'kpis': report['kpis'],
+        'seconds': round(time.perf_counter() - started, 3),
+        'cpu_seconds': round(time.process_time() - cpu_started, 3),
+        'pid': os.getpid(),
+    }
+
+
+def load_manifest(out_dir, inputs):
+    """The manifest of a previous run with the same inputs (see MANIFEST_INPUTS), or a new one"""
+    manifest = dict(inputs, lines={})
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME)) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        return manifest
+    if all(key in previous and previous[key] == manifest[key] for key in MANIFEST_INPUTS):
+        manifest['lines'] = previous.get('lines', {})
+    return manifest
+
+
+def save_manifest(out_dir, manifest):
+    _write_file(os.path.join(out_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, default=str))
+
+
+def is_rendered(out_dir, entry):
+    return entry is not None and all(os.path.exists(os.path.join(out_dir, name)) for name in entry['files'])
+
+
+def render_index(manifest, lines):
+    """index.html linking every rendered line's report with its KPIs"""
+    rows = []
+    for line in lines:
+        entry = manifest['lines'].get(line)
+        if entry is None:
+            continue
+        kpis = entry['kpis']
+        name = html.escape(line)
+        link = f'<a href="{line_slug(line)}.html">{name}</a>' if 'html' in manifest['formats'] else name
+        availability = kpis.get('availability')
+        rows.append(f"<tr><td>{link}</td><td>{kpis['num_incidents']}</td><td>{kpis['total_downtime']}</td>"
+                    f"<td>{kpis['line_downtime']}</td>"
+                    f"<td>{f'{availability:.1%}' if availability is not None else ''}</td></tr>")
+    body = ('<table><tr><th>Line</th><th>Incidents</th><th>Total Downtime (min)</th>'
+            '<th>Line Downtime (min)</th><th>Availability</th></tr>\n' + '\n'.join(rows) + '\n</table>')
+    title = f"Downtime reports {manifest['start_date']} to {manifest['end_date']}"
+    return PAGE_TEMPLATE.format(title=title, body=body)
+
+
+def generate_reports(db_path, out_dir, start_date, end_date, lines=None, workers=None,
+                     formats=('html',), plotlyjs='directory', force=False, progress=None,
+                     scheme=None, plant=None):
+    """Render the reports of lines (all configured lines by default) into out_dir.
+
+    A directory db_path (or one given a partition scheme) is the root of a
+    PartitionedDatabase, and plant optionally limits the reports to one
+    plant. Lines already in out_dir's manifest from a run with the same
+    inputs are skipped unless force. workers defaults to the number of
+    CPUs. Returns a summary with the wall time, the time each line took in
+    its worker and the lines that failed.
+    """
+    lines = list(lines or get_line_options())
+    workers = workers or os.cpu_count() or 1
+    if 'png' in formats and importlib.util.find_spec('kaleido') is None:
+        raise RuntimeError("PNG reports need the kaleido package (pip install kaleido)")
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"No database at {db_path}")
+    # Opening the database read-write once applies any pending migrations
+    # and refreshes the merged line downtime, which the read-only workers
+    # cannot
+    source = open_source(db_path, scheme)
+    try:
+        partitioned = isinstance(source, PartitionedDatabase)
+        if plant and not partitioned:
+            raise RuntimeError("Reports for a plant need partitioned records")
+        if partitioned:
+            source.upgrade()
+            scheme = source.scheme
+        source.refresh_line_downtime()
+    finally:
+        source.close()
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir, {
+        'source': os.path.abspath(db_path), 'scheme': scheme, 'plant': plant,
+        'start_date': start_date, 'end_date': end_date, 'formats': sorted(formats),
+        'plotlyjs': plotlyjs if 'html' in formats else None,
+    })
+    pending = [line for line in lines if force or not is_rendered(out_dir, manifest['lines'].get(line))]
+    if 'html' in formats and plotlyjs == 'directory' and pending:
+        from plotly.offline import get_plotlyjs
+        _write_file(os.path.join(out_dir, 'plotly.min.js'), get_plotlyjs())
+
+    started = time.perf_counter()
+    failed = {}
+    rendered = {}
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)), initializer=_init_worker,
+                                 initargs=(db_path, scheme, plant)) as pool:
+            futures = {
+                pool.submit(render_line, line, start_date, end_date, out_dir, formats, plotlyjs): line
+                for line in pending
+            }
+            for future in as_completed(futures):
+                line = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    failed[line] = f'{type(e).__name__}: {e}'
+                    if progress:
+                        progress(f"{line}: failed ({failed[line]})")
+                    continue
+                # Saved after every line, so an interrupted run resumes where it stopped
+                manifest['lines'][line] = rendered[line] = entry
+                save_manifest(out_dir, manifest)
+                if progress:
+                    progress(f"{line}: {entry['seconds']:.2f} s")
+
+    if 'html' in formats:
+        _write_file(os.path.join(out_dir, 'index.html'), render_index(
+            manifest, lines + [line for line in manifest['lines'] if line not in lines]
+        ))
+    return {
+        'wall_seconds': time.perf_counter() - started,
+        'workers': workers,
+        'rendered': rendered,
+        'skipped': len(lines) - len(pending),
+        'failed': failed,
+    }
+
+
+def timing_summary(summary):
+    """Lines describing how the rendering work spread over the workers"""
+    rendered = summary['rendered']
+    wall = summary['wall_seconds']
+    text = [f"Rendered {len(rendered)} reports in {wall:.2f} s with {summary['workers']} workers"
+            f" ({summary['skipped']} already rendered, {len(summary['failed'])} failed)"]
+    if rendered:
+        work = sum(entry['seconds'] for entry in rendered.values())
+        cpu = sum(entry['cpu_seconds'] for entry in rendered.values())
+        slowest = max(rendered, key=lambda line: rendered[line]['seconds'])
+        # Report time counts waiting for a core too, so the parallelism
+        # actually achieved is measured by the CPU time
+        cores = cpu / wall if wall else 0
+        used = min(summary['workers'], len(rendered))
+        text.append(f"  {work:.2f} s of report time, {cpu:.2f} s of it on a CPU, across "
+                    f"{len({entry['pid'] for entry in rendered.values()})} processes")
+        text.append(f"  {cores:.2f} cores busy on average, {cores / used:.0%} of {used} workers")
+        text.append(f"  slowest line {slowest}: {rendered[slowest]['seconds']:.2f} s")
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a downtime report per production line")
+    parser.add_argument('--db', default='downtime.db',
+                        help="database file or partitions directory (default: downtime.db)")
+    parser.add_argument('--partitions', choices=list(PARTITION_SCHEMES),
+                        help="partition scheme of a new partitions directory (see partitions.py)")
+    parser.add_argument('--plant', help="with a partitions directory, report on this plant only")
+    parser.add_argument('--out-dir', default='reports', help="directory to write the reports to (default: reports)")
+    period = parser.add_mutually_exclusive_group()
+    period.add_argument('--month', help="report on this month (YYYY-MM, default the previous month)")
+    period.add_argument('--start', help="first day of the period (YYYY-MM-DD, with --end)")
+    parser.add_argument('--end', help="last day of the period (YYYY-MM-DD)")
+    parser.add_argument('--lines', help="comma-separated lines (default: all configured lines)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--format', default='html',
+                        help=f"comma-separated report formats from {', '.join(REPORT_FORMATS)} (default: html)")
+    parser.add_argument('--plotlyjs', choices=PLOTLYJS_MODES, default='directory',
+                        help="how HTML reports load plotly.js (default: one shared plotly.min.js)")
+    parser.add_argument('--force', action='store_true', help="render lines again that are already rendered")
+    args = parser.parse_args(argv)
+
+    if bool(args.start) != bool(args.end):
+        parser.error("--start and --end go together")
+    start_date, end_date = (args.start, args.end) if args.start else month_period(args.month)
+    formats = [name.strip() for name in args.format.split(',') if name.strip()]
+    unknown = [name for name in formats if name not in REPORT_FORMATS]
+    if unknown or not formats:
+        parser.error(f"unknown report format: {', '.join(unknown) or args.format}")
+    lines = [line.strip() for line in args.lines.split(',')] if args.lines else None
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    try:
+        summary = generate_reports(args.db, args.out_dir, start_date, end_date, lines=lines,
+                                   workers=args.workers, formats=formats, plotlyjs=args.plotlyjs,
+                                   force=args.force, progress=print,
+                                   scheme=args.partitions, plant=args.plant)
+    except (RuntimeError, FileNotFoundError) as e:
+        print(f"Cannot render reports: {e}")
+        return 2
+
+    for text in timing_summary(summary):
+        print(text)
+    print(f"Reports for {start_date} to {end_date} are in {args.out_dir}")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
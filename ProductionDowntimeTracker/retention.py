@@ -0,0 +1,147 @@
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import date, datetime, timedelta
+from database import RECORD_COLUMNS
+from failure_stats import delete_records
+from migrations import ARCHIVE_GUARD
+
+# Moves records older than the retention age out of downtime_records into
+# the compressed archive (see archive.py), keeping the hot database to the
+# recent weeks the dashboard works with. The rollup rows of archived
+# records are kept, so totals, Paretos and trends still cover all of
+# history, and Database record reads fetch archived rows when their date
+# range reaches back that far. Archived records drop out of the full-text
+# search index and can no longer be deleted. The delete triggers that
+# would undo the rollup, maintenance and line downtime rows of an archived
+# record are switched off by the ARCHIVE_GUARD row while it is moved.
+
+DEFAULT_RETENTION_DAYS = 90
+
+
+def archive_cutoff(retention_days=DEFAULT_RETENTION_DAYS, today=None):
+    """The first date kept hot; records dated before it are archived"""
+    today = today or date.today()
+    return (today - timedelta(days=retention_days)).isoformat()
+
+
+def _move_to_archive(cursor, record_ids, period, file_name, first_date, last_date, total):
+    """Delete archived records with their aggregate triggers guarded, and record the segment"""
+    cursor.execute('INSERT INTO trigger_guards (name) VALUES (?)', (ARCHIVE_GUARD,))
+
+    # The running failure statistics describe the hot records, so archived
+    # records are taken out of them
+    if delete_records(cursor, record_ids) != len(record_ids):
+        # A record was deleted after it was read; its copy must not be archived
+        raise RuntimeError(f"Records of {period} changed while archiving; run again")
+
+    cursor.execute('DELETE FROM trigger_guards WHERE name = ?', (ARCHIVE_GUARD,))
+    cursor.execute('''
+        INSERT INTO archive_segments (period, file, first_date, last_date, records, archived_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (period) DO UPDATE SET
+            file = excluded.file,
+            first_date = MIN(first_date, excluded.first_date),
+            last_date = MAX(last_date, excluded.last_date),
+            records = excluded.records,
+            archived_at = excluded.archived_at
+    ''', (period, file_name, first_date, last_date, total, datetime.now().isoformat(timespec='seconds')))
+
+
+def archive_records(db, cutoff):
+    """Archive every record dated before cutoff ('YYYY-MM-DD'), one month per transaction.
+
+    Returns {period: records archived}.
+    """
+    if db.archive is None:
+        raise ValueError("An in-memory database has no archive")
+
+    conn = db.conn
+    periods = [row[0] for row in conn.execute(
+        'SELECT DISTINCT substr(date, 1, 7) FROM downtime_records WHERE date < ? ORDER BY 1',
+        (cutoff,)
+    )]
+    archived = {}
+    for period in periods:
+        rows = conn.execute(f'''
+            SELECT {', '.join(RECORD_COLUMNS)} FROM downtime_records
+            WHERE date >= ? AND date <= ? AND date < ?
+            ORDER BY date, id
+        ''', (f'{period}-01', f'{period}-31', cutoff)).fetchall()
+        if not rows:
+            continue
+        previous = conn.execute(
+            'SELECT file FROM archive_segments WHERE period = ?', (period,)
+        ).fetchone()
+        previous = previous[0] if previous else None
+
+        file_name, total = db.archive.write_segment(period, rows, previous)
+        record_ids = [row[0] for row in rows]
+        date_index = RECORD_COLUMNS.index('date')
+        try:
+            db.connections.write(lambda cursor: _move_to_archive(
+                cursor, record_ids, period, file_name, rows[0][date_index], rows[-1][date_index], total
+            ))
+        except Exception:
+            db.archive.remove(file_name)
+            raise
+        finally:
+            db.cache.bump_version()
+        if previous is not None:
+            db.archive.remove(previous)
+        archived[period] = len(rows)
+    return archived
+
+
+def vacuum(db_path):
+    """Rebuild the database file so the space of archived records is returned"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move old downtime records into the compressed archive")
+    parser.add_argument('--db', default='downtime.db',
+                        help="database file or partitions directory (default: downtime.db)")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--days', type=int, default=DEFAULT_RETENTION_DAYS,
+                       help=f"keep this many days of records hot (default: {DEFAULT_RETENTION_DAYS})")
+    group.add_argument('--before', help="archive records dated before this date (YYYY-MM-DD)")
+    parser.add_argument('--vacuum', action='store_true', help="shrink the database file afterwards")
+    args = parser.parse_args(argv)
+
+    # partitions imports this module, so it is only imported when run as a script
+    from partitions import PartitionedDatabase, open_database
+    cutoff = args.before or archive_cutoff(args.days)
+    db = open_database(args.db)
+    try:
+        if isinstance(db, PartitionedDatabase):
+            archived = db.archive_records(cutoff)
+            paths = [db.partition_path(*partition) for partition in db.list_partitions()]
+            vacuumed = [db.partition_path(*partition)
+                        for partition in db.select_partitions(end_date=cutoff)]
+            archive_size = sum(partition.archive.size() for _, _, partition in db.each_partition())
+        else:
+            archived = archive_records(db, cutoff)
+            paths = vacuumed = [args.db]
+            archive_size = db.archive.size()
+    finally:
+        db.close()
+    if args.vacuum:
+        for path in vacuumed:
+            vacuum(path)
+
+    for period, count in archived.items():
+        print(f"{period}: {count} records archived")
+    print(f"Archived {sum(archived.values())} records dated before {cutoff}")
+    database_size = sum(os.path.getsize(path) for path in paths)
+    print(f"Database {database_size / 1e6:.1f} MB, archive {archive_size / 1e6:.1f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
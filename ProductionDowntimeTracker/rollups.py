@@ -0,0 +1,179 @@
+import sqlite3
+import sys
+from pathlib import Path
+from archive import RecordArchive, archive_path_for
+from dimensions import DIMENSION_COLUMNS, DIMENSION_TABLES, intern_names, lookup_names
+from migrations import LATEST_VERSION, get_schema_version, migrate
+from partitions import PartitionedDatabase
+
+# downtime_rollup is kept up to date by the triggers created in migration 3
+# (keyed by dimension member ids since migration 9). This module rebuilds it
+# from scratch and checks it against the raw records. Archived records keep
+# their rollup rows, so they are aggregated from the archive segments into
+# temp.archived_rollup and counted in as well; their names are looked up by
+# alias, as they keep the spelling they were archived with. Verifying only
+# reads: an archived name without a member counts as a mismatch rather
+# than being interned.
+
+ROLLUP_KEYS = ['date', 'line', 'shift', 'equipment', 'issue_type']
+
+ROLLUP_FROM_RECORDS = '''
+    SELECT date, line_id, shift_id, equipment_id, issue_type_id,
+           SUM(incidents) AS incidents, SUM(total_duration) AS total_duration
+    FROM (
+        SELECT IFNULL(r.date, '') AS date, l.id AS line_id, s.id AS shift_id,
+               e.id AS equipment_id, i.id AS issue_type_id,
+               COUNT(*) AS incidents, IFNULL(SUM(r.duration), 0) AS total_duration
+        FROM downtime_records r
+        JOIN dim_line l ON l.name = IFNULL(r.line, '')
+        JOIN dim_shift s ON s.name = IFNULL(r.shift, '')
+        JOIN dim_equipment e ON e.name = IFNULL(r.equipment, '')
+        JOIN dim_issue_type i ON i.name = IFNULL(r.issue_type, '')
+        GROUP BY 1, 2, 3, 4, 5
+        UNION ALL
+        SELECT date, line_id, shift_id, equipment_id, issue_type_id, incidents, total_duration
+        FROM temp.archived_rollup
+    )
+    GROUP BY 1, 2, 3, 4, 5
+'''
+
+ROLLUP_COLUMNS = '''
+    date, line_id, shift_id, equipment_id, issue_type_id, incidents, total_duration
+'''
+
+
+def load_archived_rollup(conn, intern=True):
+    """Fill temp.archived_rollup with the rollup rows of the archived records.
+
+    With intern, names without a member get one and the temp table is
+    committed; otherwise they get a NULL member id and nothing is committed.
+    """
+    conn.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS archived_rollup (
+            date TEXT, line_id INTEGER, shift_id INTEGER, equipment_id INTEGER,
+            issue_type_id INTEGER, incidents INTEGER, total_duration INTEGER
+        )
+    ''')
+    conn.execute('DELETE FROM temp.archived_rollup')
+    if intern:
+        conn.commit()
+    files = [row[0] for row in conn.execute('SELECT file FROM archive_segments ORDER BY period')]
+    if not files:
+        return 0
+
+    import pyarrow.compute as pc
+    db_path = conn.execute('PRAGMA database_list').fetchone()[2]
+    table = RecordArchive(archive_path_for(db_path)).read_table(files, ROLLUP_KEYS + ['duration'])
+    # Missing keys are stored as '' and missing durations count as 0, as in the triggers
+    for index, name in enumerate(table.column_names):
+        table = table.set_column(index, name, pc.fill_null(table[name], 0 if name == 'duration' else ''))
+    grouped = table.group_by(ROLLUP_KEYS).aggregate([('duration', 'count'), ('duration', 'sum')])
+    columns = [grouped['date'].to_pylist()]
+    cursor = conn.cursor()
+    for column in DIMENSION_COLUMNS:
+        names = grouped[column].to_pylist()
+        canonical = (intern_names if intern else lookup_names)(cursor, column, set(names))
+        member_ids = dict(cursor.execute(f'SELECT name, id FROM {DIMENSION_TABLES[column]}').fetchall())
+        columns.append([member_ids.get(canonical[name]) for name in names])
+    rows = list(zip(*columns, grouped['duration_count'].to_pylist(), grouped['duration_sum'].to_pylist()))
+    conn.executemany(f'''
+        INSERT INTO temp.archived_rollup ({ROLLUP_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    if intern:
+        conn.commit()
+    return len(rows)
+
+
+def rebuild_rollups(conn):
+    """Recompute downtime_rollup from the records and the archive in one transaction"""
+    load_archived_rollup(conn)
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN')
+        for column in DIMENSION_COLUMNS:
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO {DIMENSION_TABLES[column]} (name)
+                SELECT DISTINCT IFNULL({column}, '') FROM downtime_records
+            ''')
+        cursor.execute('DELETE FROM downtime_rollup')
+        cursor.execute(f'''
+            INSERT INTO downtime_rollup ({ROLLUP_COLUMNS})
+            {ROLLUP_FROM_RECORDS}
+        ''')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return conn.execute('SELECT COUNT(*) FROM downtime_rollup').fetchone()[0]
+
+
+def verify_rollups(conn):
+    """Compare downtime_rollup with a fresh aggregation of the records.
+
+    Returns (missing, unexpected): rollup rows the records imply but the
+    table lacks, and table rows the records do not account for. Both are
+    empty when the rollup is consistent. Nothing is written to the database.
+    """
+    load_archived_rollup(conn, intern=False)
+    missing = conn.execute(f'''
+        {ROLLUP_FROM_RECORDS}
+        EXCEPT
+        SELECT {ROLLUP_COLUMNS} FROM downtime_rollup
+    ''').fetchall()
+    unexpected = conn.execute(f'''
+        SELECT {ROLLUP_COLUMNS} FROM downtime_rollup
+        EXCEPT
+        {ROLLUP_FROM_RECORDS}
+    ''').fetchall()
+    # Only temp.archived_rollup was filled
+    conn.rollback()
+    return missing, unexpected
+
+
+def _rebuild_or_verify(db_path, verify_only):
+    if verify_only:
+        conn = sqlite3.connect(f'{Path(db_path).resolve().as_uri()}?mode=ro', uri=True)
+        version = get_schema_version(conn)
+        if version != LATEST_VERSION:
+            conn.close()
+            print(f"Schema version {version} is not the current {LATEST_VERSION}; rebuild to upgrade it")
+            return 2
+    else:
+        conn = sqlite3.connect(db_path)
+        migrate(conn)
+        rows = rebuild_rollups(conn)
+        print(f"Rebuilt downtime_rollup with {rows} rows")
+
+    missing, unexpected = verify_rollups(conn)
+    conn.close()
+    if missing or unexpected:
+        print(f"Rollup mismatch: {len(missing)} missing, {len(unexpected)} unexpected rows")
+        return 1
+    print("Rollups match downtime_records")
+    return 0
+
+
+def main(argv=None):
+    """Rebuild or verify the downtime rollups.
+
+    Usage: python rollups.py [downtime.db] [--verify-only]
+
+    Given a partitions directory, every partition is rebuilt or verified.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    verify_only = '--verify-only' in argv
+    paths = [arg for arg in argv if not arg.startswith('--')]
+    db_path = paths[0] if paths else 'downtime.db'
+    if not Path(db_path).is_dir():
+        return _rebuild_or_verify(db_path, verify_only)
+
+    partitioned = PartitionedDatabase(db_path, read_only=True)
+    status = 0
+    for plant, period in partitioned.list_partitions():
+        print(f"{plant}/{period}:")
+        path = partitioned.partition_path(plant, period)
+        status = max(status, _rebuild_or_verify(path, verify_only))
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import argparse
+import csv
+import os
+import re
+import sys
+from datetime import datetime
+from partitions import open_database
+from utils import get_line_options, get_shift_options
+
+# End-of-shift summaries for every line and shift of a date, built from
+# one query over that date's records rather than one scan per summary.
+# The text comes from str.format templates, so a plant can change the
+# layout without touching the code. Summary templates get date, line,
+# shift, packs_produced, downtimes (the rendered major downtime block),
+# major_count, incidents and total_duration; downtime templates get
+# equipment, duration and issue_description.
+
+MAJOR_DOWNTIME_MINUTES = 10
+
+SUMMARY_TEMPLATE = '''Production Summary
+Date: {date}
+Line: {line}
+Shift: {shift}
+Packs Produced: {packs_produced}
+
+{downtimes}'''
+
+MAJOR_DOWNTIMES_TEMPLATE = 'Major Downtimes (≥{min_duration} minutes):\n{items}'
+
+DOWNTIME_TEMPLATE = '- {equipment} ({duration} mins): {issue_description}\n'
+
+NO_DOWNTIMES_TEXT = 'No major downtimes recorded for this line and shift.\n'
+
+PACKS_NOT_RECORDED = 'not recorded'
+
+
+def render_summary(summary_date, line, shift, downtimes, packs_produced=None,
+                   template=SUMMARY_TEMPLATE, downtime_template=DOWNTIME_TEMPLATE,
+                   min_duration=MAJOR_DOWNTIME_MINUTES):
+    """Render one summary from (equipment, duration, issue_description) rows of its line and shift"""
+    major = sorted(
+        (row for row in downtimes if (row[1] or 0) >= min_duration),
+        key=lambda row: row[1], reverse=True
+    )
+    if major:
+        items = ''.join(
+            downtime_template.format(equipment=equipment, duration=duration,
+                                     issue_description=issue_description)
+            for equipment, duration, issue_description in major
+        )
+        downtime_text = MAJOR_DOWNTIMES_TEMPLATE.format(min_duration=min_duration, items=items)
+    else:
+        downtime_text = NO_DOWNTIMES_TEXT
+
+    return template.format(
+        date=summary_date,
+        line=line,
+        shift=shift,
+        packs_produced=PACKS_NOT_RECORDED if packs_produced is None else packs_produced,
+        downtimes=downtime_text,
+        major_count=len(major),
+        incidents=len(downtimes),
+        total_duration=sum(row[1] or 0 for row in downtimes)
+    )
+
+
+def format_downtime_summary(records, production_data):
+    """Format one summary for sharing from record tuples (see build_shift_summaries for batches)"""
+    # Records for the selected date, line and shift
+    downtimes = [(r[7], r[6], r[9]) for r in records
+                 if r[1] == production_data['date']
+                 and r[3] == production_data['line']
+                 and r[2] == production_data['shift']]
+
+    return render_summary(
+        production_data['date'], production_data['line'], production_data['shift'],
+        downtimes, production_data['packs_produced']
+    )
+
+
+def build_shift_summaries(db, summary_date, lines=None, shifts=None, packs_produced=None,
+                          template=SUMMARY_TEMPLATE, downtime_template=DOWNTIME_TEMPLATE,
+                          min_duration=MAJOR_DOWNTIME_MINUTES, plant=None):
+    """Return {(line, shift): summary text} for every requested line and shift of a date.
+
+    lines and shifts default to every configured option. packs_produced
+    maps (line, shift) to the packs produced in that shift. plant, for
+    partitioned records, limits the summaries to one plant's.
+    """
+    summary_date = str(summary_date)
+    packs_produced = packs_produced or {}
+    plants = {'plant': plant} if plant else {}
+
+    by_shift = {}
+    for line, shift, equipment, duration, issue_description in db.get_shift_downtimes(
+            summary_date, line=lines, shift=shifts, **plants):
+        by_shift.setdefault((line, shift), []).append((equipment, duration, issue_description))
+
+    if lines is None:
+        # Lines recorded by name but no longer configured still get a summary
+        lines = get_line_options()
+        lines += sorted({line for line, _ in by_shift if line not in lines})
+    shifts = list(shifts or get_shift_options())
+    return {
+        (line, shift): render_summary(
+            summary_date, line, shift, by_shift.get((line, shift), []),
+            packs_produced.get((line, shift)), template, downtime_template, min_duration
+        )
+        for line in lines
+        for shift in shifts
+    }
+
+
+def join_summaries(summaries):
+    """All summaries as one text, in line then shift order"""
+    return '\n\n'.join(summaries.values())
+
+
+def summary_filename(summary_date, line, shift):
+    name = f'{summary_date}_{line}_{shift}'
+    return re.sub(r'[^\w.-]+', '-', name) + '.txt'
+
+
+def read_packs_produced(path):
+    """{(line, shift): packs} from a CSV with line, shift and packs_produced columns"""
+    with open(path, newline='', encoding='utf-8') as f:
+        return {
+            (row['line'], row['shift']): int(row['packs_produced'])
+            for row in csv.DictReader(f)
+            if row.get('packs_produced', '').strip()
+        }
+
+
+def write_summaries(summaries, summary_date, out_dir):
+    """Write one text file per summary into out_dir; returns the paths written"""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for (line, shift), text in summaries.items():
+        path = os.path.join(out_dir, summary_filename(summary_date, line, shift))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write shift summaries for every line and shift of a date")
+    parser.add_argument('date', nargs='?', default=datetime.now().strftime('%Y-%m-%d'),
+                        help="date to summarize, YYYY-MM-DD (default: today)")
+    parser.add_argument('--db', default='downtime.db',
+                        help="database file or partitions directory (default: downtime.db)")
+    parser.add_argument('--plant', help="with partitioned records, summarize this plant only")
+    parser.add_argument('--out-dir', help="write one file per summary here instead of printing them")
+    parser.add_argument('--line', action='append', help="production line, repeatable (default: all)")
+    parser.add_argument('--shift', action='append', choices=get_shift_options(),
+                        help="shift, repeatable (default: all)")
+    parser.add_argument('--packs', help="CSV of line, shift, packs_produced")
+    parser.add_argument('--template', help="file with a summary template to use instead of the default")
+    parser.add_argument('--min-duration', type=int, default=MAJOR_DOWNTIME_MINUTES,
+                        help="minutes from which a downtime is listed as major")
+    args = parser.parse_args(argv)
+    if args.plant and not os.path.isdir(args.db):
+        parser.error("--plant needs --db to be a partitions directory")
+
+    template = SUMMARY_TEMPLATE
+    if args.template:
+        with open(args.template, encoding='utf-8') as f:
+            template = f.read()
+    packs_produced = read_packs_produced(args.packs) if args.packs else None
+
+    db = open_database(args.db)
+    try:
+        summaries = build_shift_summaries(
+            db, args.date, args.line, args.shift, packs_produced,
+            template=template, min_duration=args.min_duration, plant=args.plant
+        )
+    finally:
+        db.close()
+
+    if args.out_dir:
+        paths = write_summaries(summaries, args.date, args.out_dir)
+        print(f"Wrote {len(paths)} summaries to {args.out_dir}")
+    else:
+        print(join_summaries(summaries))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import pandas as pd
+from pandas.api.types import union_categoricals
+from dimensions import fold_top_n
+from intervals import event_minutes, line_downtime, to_minutes
+from utils import get_shift_start_times
+
+# A typed, columnar copy of the records for the analytics and predictor
+# code. Dates are datetime64 and the low-cardinality columns are
+# categoricals, so a snapshot takes a fraction of the memory of the tuple
+# list and nothing downstream has to parse or convert it again. The long
+# free-text columns are left out and loaded by id only when asked for.
+
+RECORD_COLUMNS = [
+    'id', 'date', 'shift', 'line', 'start_time', 'end_time',
+    'duration', 'equipment', 'issue_type', 'issue_description',
+    'action_taken', 'responsible_person', 'remarks', 'created_at'
+]
+
+CATEGORY_COLUMNS = ['plant', 'shift', 'line', 'start_time', 'end_time', 'equipment', 'issue_type']
+
+TEXT_COLUMNS = ['issue_description', 'action_taken', 'responsible_person', 'remarks', 'created_at']
+
+SNAPSHOT_COLUMNS = [column for column in RECORD_COLUMNS if column not in TEXT_COLUMNS]
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def _typed_frame(rows, columns):
+    return _apply_types(pd.DataFrame.from_records(rows, columns=columns))
+
+
+def _apply_types(df):
+    if 'date' in df:
+        df['date'] = pd.to_datetime(df['date'])
+    for column in CATEGORY_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype('category')
+    return df
+
+
+def concat_frames(frames, columns):
+    """Concatenate typed chunks, merging their categories rather than falling back to object"""
+    if not frames:
+        return _typed_frame([], columns)
+    # Empty chunks have no categories to merge, and of a different dtype
+    frames = [frame for frame in frames if len(frame)] or frames[:1]
+    if len(frames) == 1:
+        return frames[0]
+    combined = {}
+    for column in columns:
+        parts = [frame[column] for frame in frames]
+        if column in CATEGORY_COLUMNS:
+            combined[column] = pd.Series(union_categoricals(parts, sort_categories=True))
+        else:
+            combined[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(combined, columns=columns)
+
+
+class RecordSnapshot:
+    """Typed records shared by the analytics and predictor functions.
+
+    frame holds every column except the free text ones. text() returns
+    those on demand, from the original rows or through text_loader, a
+    function taking column names and returning a DataFrame indexed by id.
+
+    The get_* aggregate methods mirror the Database ones, so functions
+    taking a Database for its aggregates accept a snapshot as well.
+    """
+
+    def __init__(self, frame, text=None, text_loader=None):
+        self.frame = frame
+        self._text = text if text is not None else pd.DataFrame(index=frame['id'])
+        self._text_loader = text_loader
+
+    @classmethod
+    def from_records(cls, records, columns=None):
+        """Build a snapshot from record tuples such as Database.get_records returns"""
+        columns = list(columns or RECORD_COLUMNS)
+        df = _typed_frame(records, columns)
+        text_columns = [column for column in TEXT_COLUMNS if column in df]
+        text = df[['id'] + text_columns].set_index('id')
+        return cls(df.drop(columns=text_columns), text=text)
+
+    @classmethod
+    def from_cursor(cls, cursor, text_loader=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Build a snapshot from an executed query, chunk_size rows at a time"""
+        columns = [description[0] for description in cursor.description]
+        frames = []
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            frames.append(_typed_frame(rows, columns))
+        return cls(concat_frames(frames, columns), text_loader=text_loader)
+
+    @classmethod
+    def from_frame(cls, frame, text_loader=None):
+        """Build a snapshot from a DataFrame of SNAPSHOT_COLUMNS with untyped values"""
+        return cls(_apply_types(frame.copy()), text_loader=text_loader)
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def shape(self):
+        return self.frame.shape
+
+    def text(self, *columns):
+        """Return the requested free-text columns, aligned with frame"""
+        columns = list(columns or TEXT_COLUMNS)
+        for column in columns:
+            if column not in TEXT_COLUMNS:
+                raise ValueError(f"Unknown text column: {column}")
+
+        missing = [column for column in columns if column not in self._text]
+        if missing and self._text_loader is not None:
+            loaded = self._text_loader(missing).reindex(self._text.index)
+            self._text = pd.concat([self._text, loaded], axis=1)
+        return self._text.reindex(columns=columns).reset_index(drop=True)
+
+    def filter(self, start_date=None, end_date=None, line=None,
+               shift=None, equipment=None, issue_type=None):
+        """Return the records matching the same filters Database.build_filters takes"""
+        df = self.frame
+        mask = pd.Series(True, index=df.index)
+        if start_date:
+            mask &= df['date'] >= pd.Timestamp(str(start_date))
+        if end_date:
+            mask &= df['date'] <= pd.Timestamp(str(end_date))
+
+        for column, value in (('line', line), ('shift', shift),
+                              ('equipment', equipment), ('issue_type', issue_type)):
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple, set)):
+                values = list(value)
+                if not values:
+                    continue
+                mask &= df[column].isin(values)
+            else:
+                mask &= df[column] == value
+
+        if mask.all():
+            return self
+        ids = df.loc[mask, 'id']
+        return RecordSnapshot(
+            df[mask].reset_index(drop=True),
+            text=self._text.reindex(ids),
+            text_loader=self._text_loader
+        )
+
+    def get_downtime_totals(self, **filters):
+        duration = self.filter(**filters).frame['duration']
+        if duration.empty:
+            return 0, None, 0
+        total = duration.sum()
+        return total, total / len(duration), len(duration)
+
+    def get_daily_downtime(self, **filters):
+        df = self.filter(**filters).frame
+        daily = df.groupby('date')['duration'].agg(['sum', 'size'])
+        return list(zip(daily.index.strftime('%Y-%m-%d'), daily['sum'], daily['size']))
+
+    def get_downtime_series(self, granularity='day', series=None, **filters):
+        df = self.filter(**filters).frame
+        dates = df['date'].dt.normalize()
+        if granularity == 'day':
+            buckets = dates.dt.strftime('%Y-%m-%d')
+        elif granularity == 'week':
+            buckets = (dates - pd.to_timedelta(dates.dt.weekday, unit='D')).dt.strftime('%Y-%m-%d')
+        elif granularity == 'month':
+            buckets = dates.dt.strftime('%Y-%m-01')
+        elif granularity == 'shift':
+            start_times = df['shift'].astype(object).map(get_shift_start_times()).fillna('00:00')
+            buckets = dates.dt.strftime('%Y-%m-%d') + ' ' + start_times
+        else:
+            raise ValueError(f"Unknown trend granularity: {granularity}")
+
+        keys = [buckets.rename('bucket')]
+        if series is not None:
+            keys.append(df[series].astype(object).rename('series'))
+        grouped = df.groupby(keys, sort=True)['duration'].agg(['sum', 'size']).reset_index()
+        series_keys = grouped['series'] if series is not None else [None] * len(grouped)
+        return list(zip(grouped['bucket'], series_keys, grouped['sum'], grouped['size']))
+
+    def _category_stats(self, column, top_n, filters):
+        df = self.filter(**filters).frame
+        keys = df[column]
+        if keys.hasnans:
+            # The rollups store a missing key as ''
+            if '' not in keys.cat.categories:
+                keys = keys.cat.add_categories([''])
+            keys = keys.fillna('')
+        stats = df.groupby(keys, observed=True, sort=False)['duration'].agg(['size', 'sum'])
+        stats = stats.sort_values('sum', ascending=False, kind='stable')
+        return fold_top_n(list(zip(stats.index, stats['size'], stats['sum'])), top_n)
+
+    def get_intervals(self, start=None, end=None, **filters):
+        df = self.filter(**filters).frame
+        low = to_minutes(start) if start is not None else None
+        high = to_minutes(end) if end is not None else None
+        rows = []
+        for line, record_date, shift, start_time, duration, equipment, record_id in zip(
+                df['line'], df['date'], df['shift'], df['start_time'], df['duration'],
+                df['equipment'], df['id']):
+            interval = event_minutes(record_date, shift, start_time, duration)
+            if interval is None or (low is not None and interval[1] <= low) \
+                    or (high is not None and interval[0] >= high):
+                continue
+            rows.append((line, interval[0], interval[1], equipment, record_id))
+        rows.sort(key=lambda row: (row[1], row[4]))
+        return rows
+
+    def get_line_downtime(self, **filters):
+        return line_downtime(self.get_intervals(**filters))
+
+    def get_equipment_stats(self, top_n=None, **filters):
+        return self._category_stats('equipment', top_n, filters)
+
+    def get_issue_type_stats(self, top_n=None, **filters):
+        return self._category_stats('issue_type', top_n, filters)
+
+
+def as_snapshot(records):
+    """Return records as a RecordSnapshot, converting record tuples if needed"""
+    if isinstance(records, RecordSnapshot):
+        return records
+    return RecordSnapshot.from_records(records)
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# The application modules are imported from the application directory
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+from benchmarks.synthetic import populate_database  # noqa: E402
+from database import Database  # noqa: E402
+from retention import archive_records  # noqa: E402
+
+# The synthetic records span 2021 to 2023; records before the cutoff are archived
+SYNTHETIC_ROWS = 3000
+ARCHIVE_CUTOFF = '2023-06-01'
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'downtime.db')
+    populate_database(path, SYNTHETIC_ROWS)
+    return path
+
+
+@pytest.fixture
+def archived_db(db_path):
+    db = Database(db_path)
+    archive_records(db, ARCHIVE_CUTOFF)
+    yield db
+    db.close()
@@ -0,0 +1,55 @@
+import sqlite3
+
+import bulk_import
+from benchmarks.synthetic import generate_records
+from database import Database
+from failure_stats import STATS_COLUMNS, rebuild_stats
+from migrations import migrate
+from retention import archive_records
+from rollups import verify_rollups
+
+
+def _stats(conn):
+    return conn.execute(f'SELECT {", ".join(STATS_COLUMNS)} FROM equipment_failure_stats ORDER BY 1').fetchall()
+
+
+def test_failure_stats_rebuilt_once_per_import(tmp_path, monkeypatch):
+    conn = sqlite3.connect(str(tmp_path / 'downtime.db'))
+    migrate(conn)
+    calls = []
+
+    def counting_rebuild_stats(cursor, equipment=None):
+        calls.append(equipment)
+        rebuild_stats(cursor, equipment)
+
+    monkeypatch.setattr(bulk_import, 'rebuild_stats', counting_rebuild_stats)
+    assert bulk_import.load_rows(conn, generate_records(2000), batch_size=300) == 2000
+    assert len(calls) == 1
+
+    imported = _stats(conn)
+    rebuild_stats(conn.cursor())
+    conn.commit()
+    assert imported == _stats(conn)
+    conn.close()
+
+
+def test_import_and_archive_keep_the_schema(tmp_path):
+    db_path = str(tmp_path / 'downtime.db')
+    conn = sqlite3.connect(db_path)
+    migrate(conn)
+    schema_version = conn.execute('PRAGMA schema_version').fetchone()[0]
+    bulk_import.load_rows(conn, generate_records(1000), batch_size=300)
+    assert conn.execute('PRAGMA schema_version').fetchone()[0] == schema_version
+    assert verify_rollups(conn) == ([], [])
+    conn.close()
+
+    db = Database(db_path)
+    try:
+        totals = db.get_downtime_totals()
+        assert archive_records(db, '2022-01-01')
+        assert db.conn.execute('PRAGMA schema_version').fetchone()[0] == schema_version
+        assert db.conn.execute('SELECT COUNT(*) FROM trigger_guards').fetchone()[0] == 0
+        db.cache.bump_version()
+        assert db.get_downtime_totals() == totals
+    finally:
+        db.close()
@@ -0,0 +1,97 @@
+import os
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import cache
+import database
+from conftest import ARCHIVE_CUTOFF
+
+
+def _count_archive_reads(db, monkeypatch):
+    reads = []
+    read_table = db.archive.read_table
+
+    def counting_read_table(file_names, *args, **kwargs):
+        reads.extend(file_names)
+        return read_table(file_names, *args, **kwargs)
+
+    monkeypatch.setattr(db.archive, 'read_table', counting_read_table)
+    return reads
+
+
+def test_full_hot_first_page_skips_archive(archived_db, monkeypatch):
+    reads = _count_archive_reads(archived_db, monkeypatch)
+    columns, records = archived_db.get_records_page(page_size=50)
+    assert len(records) == 50
+    assert all(row[columns.index('date')] >= ARCHIVE_CUTOFF for row in records)
+    assert reads == []
+
+
+def test_pages_continue_into_archive(archived_db):
+    hot = archived_db.conn.execute('SELECT COUNT(*) FROM downtime_records').fetchone()[0]
+    total = archived_db.get_downtime_totals()[2]
+    assert total > hot
+
+    ids = []
+    after = None
+    while True:
+        columns, records = archived_db.get_records_page(after=after, page_size=500)
+        if not records:
+            break
+        ids.extend(row[columns.index('id')] for row in records)
+        after = (records[-1][columns.index('date')], records[-1][columns.index('id')])
+    assert len(ids) == len(set(ids)) == total
+
+
+def test_failure_rate_alerts_age_out(archived_db, monkeypatch):
+    # A burst of failures on one equipment, ending at the last hot record
+    last = archived_db.conn.execute('SELECT MAX(started_at) FROM downtime_records').fetchone()[0]
+    burst = {'date': last[:10], 'shift': 'Morning', 'line': 'Line 1', 'end_time': None,
+             'duration': 10, 'equipment': 'Burst Test Rig', 'issue_type': 'Mechanical',
+             'issue_description': '', 'action_taken': '', 'responsible_person': '', 'remarks': ''}
+    for day in range(0, 60, 10):
+        archived_db.insert_record(dict(burst, date=f'2023-0{1 + day // 30}-{1 + day % 30:02d}',
+                                       start_time='08:00'))
+    for hour in range(6, 12):
+        archived_db.insert_record(dict(burst, start_time=f'{hour:02d}:30'))
+
+    # Without writes in between, alerts for "now" follow the clock
+    class Clock(datetime):
+        current = datetime.fromisoformat(f'{last[:10]} 13:00')
+
+        @classmethod
+        def now(cls, tz=None):
+            return cls.current
+
+    monkeypatch.setattr(database, 'datetime', Clock)
+    soon = archived_db.get_failure_rate_alerts()
+    assert 'Burst Test Rig' in [alert['equipment'] for alert in soon]
+    Clock.current = datetime(2030, 1, 1)
+    later = archived_db.get_failure_rate_alerts()
+    assert 'Burst Test Rig' not in [alert['equipment'] for alert in later]
+
+
+def test_read_only_database_watches_read_only(db_path):
+    cache._caches.pop(os.path.abspath(db_path), None)
+    db = database.Database(db_path, read_only=True)
+    try:
+        with pytest.raises(sqlite3.OperationalError, match='readonly'):
+            db.cache._watch_conn.execute('CREATE TABLE watch_probe (x)')
+    finally:
+        db.close()
+        cache._caches.pop(os.path.abspath(db_path), None)
+
+
+def test_archived_records_are_not_deleted(archived_db):
+    hot_id = archived_db.conn.execute('SELECT MIN(id) FROM downtime_records').fetchone()[0]
+    _, records = archived_db.get_records_page(columns=['id', 'date'], page_size=5, end_date='2023-01-31')
+    archived_ids = [record_id for record_id, date in records if date < ARCHIVE_CUTOFF]
+    assert archived_ids
+
+    assert archived_db.deletable_record_ids(archived_ids + [hot_id]) == {hot_id}
+    version = archived_db.cache.version
+    assert archived_db.delete_records(archived_ids) == 0
+    assert archived_db.cache.version == version
+    assert archived_db.delete_records(archived_ids + [hot_id]) == 1
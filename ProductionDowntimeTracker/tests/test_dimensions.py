@@ -0,0 +1,31 @@
+import sqlite3
+
+from rollups import verify_rollups
+
+
+def _trigger_sql(db):
+    return db.conn.execute('''
+        SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_downtime_rollup_update'
+    ''').fetchone()[0]
+
+
+def test_merge_member_keeps_rollup_consistent(archived_db):
+    trigger = _trigger_sql(archived_db)
+    equipment = archived_db.conn.execute('''
+        SELECT equipment FROM downtime_records GROUP BY equipment ORDER BY COUNT(*) LIMIT 1
+    ''').fetchone()[0]
+
+    renamed = archived_db.merge_dimension_member('equipment', equipment, 'Conveyor')
+    assert renamed > 0
+    assert _trigger_sql(archived_db) == trigger
+    assert archived_db.conn.execute('SELECT COUNT(*) FROM trigger_guards').fetchone()[0] == 0
+    conn = sqlite3.connect(archived_db.connections.db_path)
+    assert verify_rollups(conn) == ([], [])
+
+    # The trigger is back in force for later updates
+    record_id = archived_db.conn.execute('SELECT MAX(id) FROM downtime_records').fetchone()[0]
+    archived_db.connections.write(lambda cursor: cursor.execute(
+        'UPDATE downtime_records SET duration = duration + 5 WHERE id = ?', (record_id,)
+    ))
+    assert verify_rollups(conn) == ([], [])
+    conn.close()
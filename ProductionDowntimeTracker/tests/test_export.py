@@ -0,0 +1,14 @@
+import pytest
+
+import export
+
+
+def test_download_size_counts_archived_records(archived_db, monkeypatch):
+    filters = {'start_date': '2021-01-01', 'end_date': '2023-12-31'}
+    assert archived_db.archive_segments(**filters)
+    exported = sum(len(chunk) for chunk in export.iter_record_chunks(archived_db, **filters))
+    assert export.check_download_size(archived_db, **filters) == exported
+
+    monkeypatch.setattr(export, 'MAX_DOWNLOAD_ROWS', exported - 1)
+    with pytest.raises(ValueError):
+        export.check_download_size(archived_db, **filters)
@@ -0,0 +1,65 @@
+import asyncio
+
+from database import Database
+from ingest import IngestBuffer, IngestServer, validate_event
+from partitions import DEFAULT_PLANT, PartitionedDatabase, parse_record_key
+
+
+async def _raw_request(port, request):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(request)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+def _post_with_content_length(db_path, content_length):
+    async def run():
+        server = IngestServer(Database(db_path), port=0)
+        await server.start()
+        try:
+            return await _raw_request(server.port, (
+                f'POST /events HTTP/1.1\r\nHost: localhost\r\n'
+                f'Content-Length: {content_length}\r\n\r\n'
+            ).encode())
+        finally:
+            await server.stop()
+            server.db.close()
+    return asyncio.run(run())
+
+
+def test_negative_content_length_is_rejected(tmp_path):
+    response = _post_with_content_length(str(tmp_path / 'downtime.db'), -5)
+    assert response.startswith(b'HTTP/1.1 400 Bad Request\r\n')
+
+
+def test_invalid_content_length_is_rejected(tmp_path):
+    response = _post_with_content_length(str(tmp_path / 'downtime.db'), 'abc')
+    assert response.startswith(b'HTTP/1.1 400 Bad Request\r\n')
+
+
+def test_events_are_written_to_their_plant_and_period(tmp_path):
+    event = {'date': '2023-05-31', 'shift': 'Night', 'line': 'Line 1', 'start_time': '23:00',
+             'end_time': '23:30', 'duration': 30, 'equipment': 'Mixer', 'issue_type': 'Mechanical'}
+
+    async def run(db):
+        buffer = IngestBuffer(db, max_delay=0)
+        buffer.start()
+        futures = buffer.submit([validate_event(event),
+                                 validate_event(dict(event, date='2023-06-01', plant='south')),
+                                 validate_event(dict(event, idempotency_key='a', plant='south'))])
+        results = await asyncio.gather(*futures)
+        await buffer.stop()
+        return results
+
+    db = PartitionedDatabase(str(tmp_path / 'partitions'), 'month')
+    try:
+        keys = [key for key, created in asyncio.run(run(db)) if created]
+        assert [parse_record_key(key)[:2] for key in keys] == [
+            (DEFAULT_PLANT, '2023-05'), ('south', '2023-06'), ('south', '2023-05')
+        ]
+        assert db.list_partitions() == [(DEFAULT_PLANT, '2023-05'), ('south', '2023-05'),
+                                        ('south', '2023-06')]
+    finally:
+        db.close()
@@ -0,0 +1,34 @@
+import threading
+
+import instrumentation
+
+
+@instrumentation.traced('test.work')
+def _work():
+    return [1, 2, 3]
+
+
+def _rerun(trace):
+    rerun = instrumentation.begin_rerun('session', trace=trace)
+    _work()
+    return rerun
+
+
+def test_traced_rerun_does_not_trace_other_sessions():
+    assert not instrumentation.ENABLED
+    reruns = {}
+    threads = [threading.Thread(target=lambda trace=trace: reruns.update({trace: _rerun(trace)}))
+               for trace in (True, False)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [span['rows'] for span in instrumentation.get_spans(rerun=reruns[True])] == [3]
+    assert instrumentation.get_spans(rerun=reruns[False]) == []
+
+    # The traced session stops recording at its next rerun without tracing
+    _rerun(True)
+    spans = len(instrumentation.get_spans())
+    _rerun(False)
+    assert len(instrumentation.get_spans()) == spans
@@ -0,0 +1,90 @@
+import random
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+from maintenance_predictor import calculate_equipment_metrics
+from snapshot import RECORD_COLUMNS
+
+EQUIPMENT = ['Filler', 'Capper', 'Labeller', 'Blowmould', 'Conveyor']
+
+
+def _reference_metrics(records):
+    """The per-equipment loop calculate_equipment_metrics replaced, kept as the expected values"""
+    df = pd.DataFrame(records, columns=RECORD_COLUMNS)
+    df['date'] = pd.to_datetime(df['date'])
+    span_days = (df['date'].max() - df['date'].min()).days + 1
+    metrics = {}
+    for equipment in df['equipment'].unique():
+        equip_data = df[df['equipment'] == equipment].sort_values('date')
+        mtbf = next_predicted = maintenance_date = None
+        if len(equip_data) > 1:
+            mtbf = equip_data['date'].diff().dropna().mean().days
+            next_predicted = equip_data['date'].max() + timedelta(days=mtbf)
+            maintenance_date = next_predicted - timedelta(days=max(2, int(mtbf * 0.2)))
+        metrics[equipment] = {
+            'total_failures': len(equip_data),
+            'total_downtime': equip_data['duration'].sum(),
+            'avg_downtime': round(equip_data['duration'].mean(), 2),
+            'mtbf_days': round(mtbf, 1) if mtbf else None,
+            'next_predicted_failure': next_predicted,
+            'recommended_maintenance': maintenance_date,
+            'failure_rate': round(len(equip_data) / span_days * 30, 2),
+        }
+    return metrics
+
+
+def _record(record_id, record_date, equipment, duration):
+    return (record_id, record_date.isoformat(), 'Morning', 'Line 1', '08:00', '08:30', duration,
+            equipment, 'Mechanical', '', '', '', '', '2023-01-01 00:00:00')
+
+
+@pytest.fixture
+def records():
+    rng = random.Random(4)
+    start = date(2022, 1, 1)
+    records = [_record(record_id, start + timedelta(days=rng.randrange(540)), rng.choice(EQUIPMENT),
+                       rng.randint(5, 120))
+               for record_id in range(1, 801)]
+    # Equipment failing once, and failing only on one day
+    records.append(_record(801, date(2022, 3, 5), 'Palletiser', 45))
+    records += [_record(802 + index, date(2022, 9, 14), 'Shrinkwrap', 10 + index)
+                for index in range(3)]
+    rng.shuffle(records)
+    return records
+
+
+def _assert_matches(metrics, expected):
+    assert sorted(metrics['equipment']) == sorted(expected)
+    for row in metrics.to_dict('records'):
+        reference = expected[row['equipment']]
+        for column in ('total_failures', 'total_downtime', 'avg_downtime', 'failure_rate'):
+            assert row[column] == reference[column], (row['equipment'], column)
+        for column in ('mtbf_days', 'next_predicted_failure', 'recommended_maintenance'):
+            if reference[column] is None:
+                assert pd.isna(row[column]), (row['equipment'], column)
+            else:
+                assert row[column] == reference[column], (row['equipment'], column)
+
+
+def test_matches_the_per_equipment_loop(records):
+    expected = _reference_metrics(records)
+    assert pd.isna(expected['Palletiser']['mtbf_days'])
+    assert expected['Shrinkwrap']['total_failures'] == 3
+    assert expected['Shrinkwrap']['mtbf_days'] is None
+    _assert_matches(calculate_equipment_metrics(records), expected)
+
+    # A date window of the records is its own observation window
+    window = [record for record in records if '2022-06-01' <= record[1] <= '2022-12-31']
+    _assert_matches(calculate_equipment_metrics(window), _reference_metrics(window))
+
+
+def test_equipment_subset_keeps_the_full_observation_window(records):
+    # As predictions.py recomputes only changed equipment, with the window of all records
+    dates = [record[1] for record in records]
+    window_days = (date.fromisoformat(max(dates)) - date.fromisoformat(min(dates))).days + 1
+    subset = [record for record in records if record[7] in ('Capper', 'Palletiser', 'Shrinkwrap')]
+    expected = {equipment: metrics for equipment, metrics in _reference_metrics(records).items()
+                if equipment in ('Capper', 'Palletiser', 'Shrinkwrap')}
+    _assert_matches(calculate_equipment_metrics(subset, window_days), expected)
@@ -0,0 +1,67 @@
+import shutil
+
+from conftest import ARCHIVE_CUTOFF
+from database import Database
+from intervals import line_downtime
+
+RANGES = [
+    {},
+    {'start_date': '2021-03-15'},
+    {'start_date': '2023-03-01', 'end_date': '2023-07-31'},
+    {'start_date': ARCHIVE_CUTOFF, 'end_date': '2023-08-15'},
+    {'end_date': '2022-02-01', 'line': ['Line 1', 'Line 3']},
+    {'start_date': '2023-06-02', 'line': 'Line 2'},
+]
+
+NIGHT_STOP = {'shift': 'Night', 'line': 'Line 1', 'end_time': None, 'equipment': 'Mixer',
+              'issue_type': 'Mechanical', 'issue_description': '', 'action_taken': '',
+              'responsible_person': '', 'remarks': ''}
+
+
+def _assert_matches_sweep(db, ranges=RANGES):
+    db.cache.bump_version()
+    for filters in ranges:
+        assert db.get_line_downtime(**filters) == line_downtime(db.get_intervals(**filters)), filters
+
+
+def test_matches_sweep_through_writes(archived_db):
+    _assert_matches_sweep(archived_db)
+
+    # Stops running past midnight into the next date's stops, including
+    # one dated in the archived months
+    ids = [archived_db.insert_record(dict(NIGHT_STOP, date=stop_date, start_time=start_time,
+                                          duration=duration))
+           for stop_date, start_time, duration in [('2023-07-10', '23:00', 300), ('2023-07-11', '01:00', 200),
+                                                   ('2023-02-28', '23:30', 600)]]
+    ranges = RANGES + [{'start_date': day} for day in ('2023-07-11', '2023-07-12', '2023-03-01', '2023-03-02')]
+    _assert_matches_sweep(archived_db, ranges)
+
+    archived_db.delete_records(ids[:1])
+    archived_db.connections.write(lambda cursor: cursor.execute(
+        "UPDATE downtime_records SET line = 'Line 4', duration = 90 WHERE id = ?", (ids[1],)
+    ))
+    _assert_matches_sweep(archived_db, ranges)
+
+    archived_db.merge_dimension_member('line', 'Line 4', 'Line 1')
+    _assert_matches_sweep(archived_db, ranges)
+
+
+def test_kpi_reads_no_archive_once_current(archived_db, monkeypatch):
+    archived_db.refresh_line_downtime()
+    reads = []
+    monkeypatch.setattr(archived_db.archive, 'read_table', lambda *args, **kwargs: reads.append(args))
+    for filters in ({}, {'start_date': '2021-01-01', 'end_date': '2023-05-31'}):
+        archived_db.get_line_downtime(**filters)
+    assert reads == []
+
+
+def test_read_only_database_sweeps_stale_rows(db_path, tmp_path):
+    # A freshly populated database has never been refreshed
+    copy = str(tmp_path / 'copy.db')
+    shutil.copyfile(db_path, copy)
+    db = Database(copy, read_only=True)
+    try:
+        assert not db.refresh_line_downtime()
+        _assert_matches_sweep(db)
+    finally:
+        db.close()
@@ -0,0 +1,164 @@
+import pandas as pd
+import pytest
+
+import export
+from conftest import ARCHIVE_CUTOFF
+from database import RECORD_COLUMNS, Database
+from intervals import line_downtime
+from partitions import PartitionedDatabase, open_database, parse_record_key, split_database
+from predictions import refresh_predictions
+from test_merged_downtime import NIGHT_STOP, RANGES
+
+COMPARED_COLUMNS = [column for column in RECORD_COLUMNS if column != 'id']
+
+
+def _record_values(columns, records):
+    positions = [columns.index(column) for column in COMPARED_COLUMNS]
+    return sorted(tuple(str(record[index]) for index in positions) for record in records)
+
+
+def test_split_round_trip_keeps_archived_records_and_created_at(archived_db, tmp_path):
+    root = str(tmp_path / 'partitions')
+    counts = split_database(archived_db.connections.db_path, root, plant='north')
+    columns, records = archived_db.get_records()
+    assert sum(counts.values()) == len(records)
+
+    partitioned = PartitionedDatabase(root)
+    try:
+        partitioned_columns, partitioned_records = partitioned.get_records()
+        assert _record_values(partitioned_columns, partitioned_records) == _record_values(columns, records)
+        assert partitioned.get_downtime_totals() == pytest.approx(archived_db.get_downtime_totals())
+        assert partitioned.get_equipment_stats() == archived_db.get_equipment_stats()
+
+        # Records archived in the source are archived in their partitions
+        with partitioned.partition('north', '2021') as db:
+            assert db.conn.execute('SELECT COUNT(*) FROM downtime_records').fetchone()[0] == 0
+        with partitioned.partition('north', ARCHIVE_CUTOFF[:4]) as db:
+            hot_dates = db.conn.execute('SELECT MIN(date) FROM downtime_records').fetchone()[0]
+            assert hot_dates >= ARCHIVE_CUTOFF
+            assert db.archive_segments()
+    finally:
+        partitioned.close()
+
+
+def test_least_recently_used_partitions_are_closed(archived_db, tmp_path):
+    root = str(tmp_path / 'partitions')
+    split_database(archived_db.connections.db_path, root, scheme='month')
+    partitioned = PartitionedDatabase(root, scheme='month', max_open=3)
+    try:
+        totals = partitioned.get_downtime_totals()
+        assert len(partitioned.open_partitions()) == 3
+        assert partitioned.open_partitions() == partitioned.list_partitions()[-3:]
+
+        # A partition in use is not closed, even past the bound
+        plant, period = partitioned.list_partitions()[0]
+        with partitioned.partition(plant, period) as db:
+            assert partitioned.get_downtime_totals() == totals
+            assert (plant, period) in partitioned.open_partitions()
+            assert db.get_downtime_totals()[2] > 0
+        assert len(partitioned.open_partitions()) == 3
+    finally:
+        partitioned.close()
+
+
+@pytest.fixture
+def plants(archived_db, tmp_path):
+    """The archived records split by month into two plants holding the same records"""
+    root = str(tmp_path / 'partitions')
+    for plant in ('north', 'south'):
+        split_database(archived_db.connections.db_path, root, plant=plant, scheme='month')
+    partitioned = open_database(root)
+    yield partitioned
+    partitioned.close()
+
+
+def test_open_database_detects_partitions_and_keeps_their_scheme(plants, db_path):
+    assert isinstance(plants, PartitionedDatabase)
+    assert plants.scheme == 'month'
+    assert plants.plants() == ['north', 'south']
+    with pytest.raises(ValueError):
+        PartitionedDatabase(plants.root, 'year')
+    db = open_database(db_path, read_only=True)
+    try:
+        assert isinstance(db, Database)
+    finally:
+        db.close()
+
+
+def test_pages_search_and_deletes_use_record_keys(plants):
+    columns, records = plants.get_records()
+    date_index, id_index = columns.index('date'), columns.index('id')
+    order = sorted(((record[date_index], record[0], parse_record_key(record[id_index])[2]),
+                    record[id_index]) for record in records)
+    expected = [key for _, key in reversed(order)]
+
+    paged = []
+    after = None
+    while True:
+        page_columns, page = plants.get_records_page(['date', 'line'], after=after, page_size=700)
+        paged += [record[page_columns.index('id')] for record in page]
+        if len(page) < 700:
+            break
+        after = (page[-1][page_columns.index('date')], page[-1][page_columns.index('id')])
+    assert paged == expected
+
+    term = records[0][columns.index('equipment')]
+    matches = plants.search_records(term, limit=len(records))[1]
+    assert plants.count_search_results(term) == len(matches) > 0
+    assert plants.search_records(term, limit=10, offset=5)[1] == matches[5:15]
+    assert plants.count_search_results(term, plant='south') * 2 == len(matches)
+
+    # Archived records are read-only, so only the hot one is deleted
+    hot = next(record[id_index] for record in records if record[date_index] >= ARCHIVE_CUTOFF)
+    archived = next(record[id_index] for record in records if record[date_index] < ARCHIVE_CUTOFF)
+    keys = [hot, archived, 'north/1999-01/1']
+    assert plants.deletable_record_ids(keys) == {hot}
+    assert plants.delete_records(keys) == 1
+    assert len(plants.get_records()[1]) == len(records) - 1
+    with pytest.raises(ValueError):
+        plants.delete_records([1])
+
+
+def test_line_downtime_across_partitions_matches_sweep(plants, monkeypatch):
+    # Night stops running into the next month and the next year
+    stops = [('2022-12-31', '23:00', 300), ('2023-01-01', '01:00', 200),
+             ('2023-07-31', '23:30', 600)]
+    for stop_date, start_time, duration in stops:
+        stop = dict(NIGHT_STOP, date=stop_date, start_time=start_time, duration=duration)
+        plants.insert_record(stop, plant='north')
+    ranges = RANGES + [{'start_date': '2023-01-01'}, {'start_date': '2023-08-01'},
+                       {'start_date': '2022-12-15', 'end_date': '2023-01-15', 'plant': 'north'}]
+    for filters in ranges:
+        expected = line_downtime(plants.get_intervals(**filters))
+        assert plants.get_line_downtime(**filters) == expected, filters
+
+    # Shift availability reads the day before the first date, and no other period
+    opened = []
+    lend = plants.partition
+    monkeypatch.setattr(plants, 'partition',
+                        lambda plant, period: opened.append(period) or lend(plant, period))
+    assert plants.get_shift_availability('2023-03-01', '2023-03-31', line='Line 1')
+    assert set(opened) == {'2023-02', '2023-03'}
+
+
+def test_predictions_alerts_and_export_name_the_plant(plants, tmp_path):
+    assert set(refresh_predictions(plants)) == {'north', 'south'}
+    assert refresh_predictions(plants) is None
+    predictions = plants.get_maintenance_predictions()
+    assert sorted(predictions['plant'].unique()) == ['north', 'south']
+    assert plants.get_latest_prediction_run() is not None
+
+    alerts = plants.get_failure_rate_alerts(at='2023-12-31', ratio=1.0, min_failures=2,
+                                            min_recent=1)
+    assert alerts
+    by_plant = {plant: sorted((alert['equipment'], alert['failures']) for alert in alerts
+                              if alert['plant'] == plant)
+                for plant in ('north', 'south')}
+    assert by_plant['north'] == by_plant['south']
+
+    path = str(tmp_path / 'records.csv')
+    export.export_records(plants, path, start_date='2023-03-01', end_date='2023-04-30')
+    frame = pd.read_csv(path)
+    assert list(frame.columns) == ['plant'] + RECORD_COLUMNS
+    assert frame['plant'].value_counts()['north'] == frame['plant'].value_counts()['south']
+    assert frame['date'].is_monotonic_increasing
@@ -0,0 +1,71 @@
+import sqlite3
+
+from cache import SnapshotCache, make_key
+from database import Database
+from predictions import refresh_predictions
+
+
+def test_refresh_without_changes_keeps_the_cache(db_path):
+    db = Database(db_path)
+    try:
+        assert refresh_predictions(db) is not None
+        totals = db.get_downtime_totals()
+        version = db.cache.version
+
+        assert refresh_predictions(db) is None
+        assert refresh_predictions(db, full=True) is None
+        hits = db.cache.hits
+        assert db.get_downtime_totals() == totals
+        assert db.cache.hits == hits + 1
+        assert db.cache.version == version
+    finally:
+        db.close()
+
+
+def test_prediction_write_keeps_other_queries_cached(db_path):
+    db = Database(db_path)
+    try:
+        refresh_predictions(db)
+        db.insert_record({
+            'date': '2023-12-31', 'shift': 'Morning', 'line': 'Line 1', 'start_time': '08:00',
+            'end_time': '08:30', 'duration': 30, 'equipment': 'Cache Test Rig',
+            'issue_type': 'Mechanical', 'issue_description': '', 'action_taken': '',
+            'responsible_person': '', 'remarks': ''
+        })
+        totals = db.get_downtime_totals()
+        predictions = db.get_maintenance_predictions()
+        version = db.cache.version
+
+        # The refresh commits through the writer, which the watch connection sees
+        assert refresh_predictions(db) is not None
+        hits = db.cache.hits
+        assert db.get_downtime_totals() == totals
+        assert db.cache.hits == hits + 1
+        assert db.cache.version == version
+        assert len(db.get_maintenance_predictions()) == len(predictions) + 1
+    finally:
+        db.close()
+
+
+def test_external_write_still_clears_the_cache(db_path):
+    db = Database(db_path)
+    try:
+        db.get_downtime_totals()
+        version = db.cache.version
+        other = sqlite3.connect(db_path)
+        with other:
+            other.execute("UPDATE downtime_records SET remarks = 'edited' WHERE id = 1")
+        other.close()
+        db.get_downtime_totals()
+        assert db.cache.version == version + 1
+    finally:
+        db.close()
+
+
+def test_invalidate_drops_only_named_queries():
+    cache = SnapshotCache()
+    cache.get_or_compute(make_key('get_maintenance_predictions'), lambda: 'predictions')
+    cache.get_or_compute(make_key('get_downtime_totals'), lambda: 'totals')
+    cache.invalidate(['get_maintenance_predictions'])
+    assert cache.get_or_compute(make_key('get_downtime_totals'), lambda: 'recomputed') == 'totals'
+    assert cache.get_or_compute(make_key('get_maintenance_predictions'), lambda: 'new') == 'new'
@@ -0,0 +1,37 @@
+import shutil
+
+from partitions import PartitionedDatabase, split_database
+from reports import build_line_report, generate_reports
+
+PERIOD = ('2023-06-01', '2023-06-30')
+
+
+def test_partitioned_report_matches_single_file(archived_db, tmp_path):
+    root = str(tmp_path / 'partitions')
+    split_database(archived_db.connections.db_path, root, plant='north')
+    partitioned = PartitionedDatabase(root, read_only=True)
+    try:
+        for line in ('Line 1', 'Line 2'):
+            expected = build_line_report(archived_db, line, *PERIOD)
+            report = build_line_report(partitioned, line, *PERIOD, plant='north')
+            assert report['kpis'] == expected['kpis']
+            assert report['availability'].equals(expected['availability'])
+            assert [name for name, _ in report['figures']] == [name for name, _ in expected['figures']]
+    finally:
+        partitioned.close()
+
+
+def test_rerun_reuses_lines_only_with_the_same_inputs(db_path, tmp_path):
+    out_dir = str(tmp_path / 'reports')
+    other_path = str(tmp_path / 'other.db')
+    shutil.copyfile(db_path, other_path)
+
+    def run(path, **options):
+        options = dict({'lines': ['Line 1'], 'workers': 1, 'plotlyjs': 'cdn'}, **options)
+        return generate_reports(path, out_dir, *PERIOD, **options)['skipped']
+
+    assert run(db_path) == 0
+    assert run(db_path) == 1
+    assert run(other_path) == 0
+    assert run(other_path, plotlyjs='inline') == 0
+    assert run(other_path, plotlyjs='inline') == 1
@@ -0,0 +1,29 @@
+import sqlite3
+
+import rollups
+from dimensions import alias_key
+
+
+def _member_counts(conn):
+    return [conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            for table in ('dim_equipment', 'dimension_aliases')]
+
+
+def test_verify_only_reads(archived_db):
+    db_path = archived_db.connections.db_path
+    archived_db.close()
+    assert rollups.main([db_path, '--verify-only']) == 0
+
+    # An archived spelling without a member is a mismatch, not a new member
+    conn = sqlite3.connect(db_path)
+    equipment = conn.execute('SELECT name FROM dim_equipment WHERE name != ? LIMIT 1', ('',)).fetchone()[0]
+    conn.execute("DELETE FROM dimension_aliases WHERE dimension = 'equipment' AND alias_key = ?",
+                 (alias_key(equipment),))
+    conn.commit()
+    before = _member_counts(conn)
+    missing, unexpected = rollups.verify_rollups(conn)
+    assert any(row[3] is None for row in missing)
+    assert _member_counts(conn) == before
+    assert not conn.in_transaction
+    conn.close()
+    assert rollups.main([db_path, '--verify-only']) == 1
@@ -0,0 +1,27 @@
+import importlib
+import sys
+
+from database import Database
+from shift_summary import build_shift_summaries, format_downtime_summary
+
+
+def test_single_summary_matches_batch(db_path):
+    db = Database(db_path)
+    try:
+        _, records = db.get_all_records()
+        date, line, shift = records[0][1], records[0][3], records[0][2]
+        summary = format_downtime_summary(records, {
+            'date': date, 'line': line, 'shift': shift, 'packs_produced': 1200
+        })
+        batch = build_shift_summaries(db, date, lines=[line], shifts=[shift],
+                                      packs_produced={(line, shift): 1200})
+        assert summary == batch[(line, shift)]
+    finally:
+        db.close()
+
+
+def test_utils_does_not_load_the_data_layer():
+    for name in ('utils', 'shift_summary', 'database'):
+        sys.modules.pop(name, None)
+    importlib.import_module('utils')
+    assert 'database' not in sys.modules
@@ -17,6 +17,9 @@ def calculate_duration(start_time, end_time):
 def get_shift_options():
     return ['Morning', 'Afternoon', 'Night']
 
+def get_shift_start_times():
+    return {'Morning': '06:00', 'Afternoon': '14:00', 'Night': '22:00'}
+
 def get_line_options():
     return [f'Line {i}' for i in range(1, 31)]  # Lines 1-30
 
@@ -34,26 +37,3 @@ def get_issue_type_options():
         'Quality', 'Material Shortage'
     ]
     return standard_options + ['Other']
-
-def format_downtime_summary(records, production_data):
-    """Format downtime summary for sharing"""
-    # Filter records for selected date and line
-    filtered_records = [r for r in records 
-                       if r[1] == production_data['date'] 
-                       and r[3] == production_data['line']
-                       and r[6] >= 10]  # records where duration >= 10 minutes
-
-    summary = f"Production Summary\n"
-    summary += f"Date: {production_data['date']}\n"
-    summary += f"Line: {production_data['line']}\n"
-    summary += f"Shift: {production_data['shift']}\n"
-    summary += f"Packs Produced: {production_data['packs_produced']}\n\n"
-
-    if filtered_records:
-        summary += "Major Downtimes (≥10 minutes):\n"
-        for record in filtered_records:
-            summary += f"- {record[7]} ({record[6]} mins): {record[9]}\n"
-    else:
-        summary += "No major downtimes recorded for this line and date.\n"
-
-    return summary
\ No newline at end of file